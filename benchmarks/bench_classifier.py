@@ -0,0 +1,64 @@
+"""
+Micro-benchmark of the per-line classification
+
+Compares the cost per line of :func:`code_split.classifier.classify` with the
+checks of the split loop before the classifier was introduced, i.e. several
+``startswith`` calls, two ``line.strip()`` and ``re.findall`` for headers.
+
+Usage::
+
+    python benchmarks/bench_classifier.py --lines 200000
+"""
+
+import argparse
+import re
+import sys
+import timeit
+from typing import List
+
+from generate_source import generate_module
+
+from code_split.classifier import classify
+
+__author__ = "Matthias Homann"
+__copyright__ = "Matthias Homann"
+__license__ = "GPL-3.0-or-later"
+
+
+def legacy_classify(line: str) -> str:
+    """Line checks as done by the split loop before the classifier"""
+    kind = "code"
+    if line.startswith("@"):
+        kind = "decorator"
+    if line.startswith("def") or line.startswith("class"):
+        re.findall(r"^\w+\s+(\w+).*", line)
+        kind = "header"
+    elif not (line.startswith(" ") or line.startswith(")")) and len(line.strip()):
+        pass
+    if not line.strip():
+        kind = "blank"
+    elif line.startswith("#"):
+        kind = "comment"
+    return kind
+
+
+def new_classify(line: str) -> str:
+    kind, match = classify(line)
+    if match is not None and kind == "header":
+        match.group("name")
+    return kind
+
+
+def main(args: List[str]) -> None:
+    parser = argparse.ArgumentParser(description="Benchmark the line classification")
+    parser.add_argument("-l", "--lines", type=int, default=200_000, help="Number of lines")
+    parser.add_argument("-r", "--repeat", type=int, default=5, help="Number of runs, the best one is reported")
+    settings = parser.parse_args(args)
+    lines = list(generate_module(settings.lines))
+    for name, function in (("before", legacy_classify), ("after", new_classify)):
+        seconds = min(timeit.repeat(lambda: list(map(function, lines)), number=1, repeat=settings.repeat))
+        print(f"{name:>6}: {seconds / len(lines) * 1e9:7.1f} ns/line")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
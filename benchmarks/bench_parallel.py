@@ -0,0 +1,82 @@
+"""
+Speedup of the parallel engine by number of worker processes
+
+A large synthetic module is split with the serial mmap engine and with the parallel
+engine using 1, 2, 4, ... workers up to the number of CPU cores. The speedup is
+relative to the serial mmap engine, the output of each run is compared with it.
+
+Usage::
+
+    python benchmarks/bench_parallel.py --lines 5000000 --workers 1,2,4,8
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List
+
+from generate_source import generate_module
+
+from code_split.code_split import split_code
+
+__author__ = "Matthias Homann"
+__copyright__ = "Matthias Homann"
+__license__ = "GPL-3.0-or-later"
+
+
+def _files(folder: Path) -> Dict[str, bytes]:
+    return {path.name: path.read_bytes() for path in folder.iterdir()}
+
+
+def _best(src: Path, folder: Path, repeat: int, **options) -> float:
+    """Best time of ``repeat`` runs of split_code in seconds"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        split_code(str(src), str(folder), **options)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main(args: List[str]) -> int:
+    cores = os.cpu_count() or 1
+    default_workers = [1 << power for power in range(cores.bit_length()) if 1 << power <= cores]
+    parser = argparse.ArgumentParser(description="Benchmark the parallel engine by number of workers")
+    parser.add_argument("-l", "--lines", type=int, default=2_000_000, help="Lines of the split module")
+    parser.add_argument("-s", "--seed", type=int, default=0, help="Seed of the source generator")
+    parser.add_argument("-r", "--repeat", type=int, default=3, help="Number of runs, the best one is reported")
+    parser.add_argument(
+        "-w",
+        "--workers",
+        type=lambda value: [int(count) for count in value.split(",")],
+        default=default_workers,
+        help=f"Comma separated list of worker counts (default: {','.join(map(str, default_workers))})",
+    )
+    settings = parser.parse_args(args)
+    with tempfile.TemporaryDirectory(prefix="code_split_bench_") as tmp:
+        src = Path(tmp) / "module.py"
+        with src.open("w", encoding="utf-8") as file:
+            file.writelines(generate_module(settings.lines, settings.seed))
+        size = src.stat().st_size / 2**20
+        print(f"{settings.lines} lines, {size:.1f} MB, {cores} CPU cores", flush=True)
+        serial = _best(src, Path(tmp) / "serial", settings.repeat, engine="mmap")
+        expected = _files(Path(tmp) / "serial")
+        print(f"{'serial':>10}: {serial:8.3f} s {size / serial:8.1f} MB/s", flush=True)
+        for workers in settings.workers:
+            folder = Path(tmp) / f"parallel_{workers}"
+            seconds = _best(src, folder, settings.repeat, engine="parallel", workers=workers)
+            if _files(folder) != expected:
+                print(f"Output of {workers} workers differs from the serial split", file=sys.stderr)
+                return 1
+            print(
+                f"{workers:>10}: {seconds:8.3f} s {size / seconds:8.1f} MB/s speedup {serial / seconds:5.2f}",
+                flush=True,
+            )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
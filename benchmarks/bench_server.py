@@ -0,0 +1,85 @@
+"""
+Latency per job of the split server compared to a cold ``code_split`` run
+
+A small synthetic module, like a single changed file of a build, is split repeatedly with:
+
+- cold: ``python -m code_split.code_split``, a new interpreter per job
+- client: ``python -m code_split.client``, a new client interpreter per job sent to the server
+- request: :func:`code_split.client.request` from this process, i.e. only the socket round trip
+
+Usage::
+
+    python benchmarks/bench_server.py --lines 2000 --jobs 20
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, Dict, List
+
+from generate_source import generate_module
+
+from code_split.client import request
+
+__author__ = "Matthias Homann"
+__copyright__ = "Matthias Homann"
+__license__ = "GPL-3.0-or-later"
+
+
+def _latency(job: Callable[[], object], jobs: int) -> Dict[str, float]:
+    """Median and best latency of the jobs in ms"""
+    timings = []
+    for _ in range(jobs):
+        start = time.perf_counter()
+        job()
+        timings.append((time.perf_counter() - start) * 1000)
+    return {"median_ms": round(statistics.median(timings), 2), "best_ms": round(min(timings), 2)}
+
+
+def main(args: List[str]) -> None:
+    parser = argparse.ArgumentParser(description="Benchmark the split server against cold runs")
+    parser.add_argument("-l", "--lines", type=int, default=2000, help="Lines of the split module")
+    parser.add_argument("-n", "--jobs", type=int, default=20, help="Number of jobs per case")
+    settings = parser.parse_args(args)
+    with tempfile.TemporaryDirectory() as tmp:
+        folder = Path(tmp)
+        src = folder / "module.py"
+        text = "".join(generate_module(settings.lines))
+        counter = iter(range(sys.maxsize))
+
+        def change() -> None:
+            """Change the module, otherwise the incremental mode skips it"""
+            src.write_text(f"{text}# change {next(counter)}\n", encoding="utf-8")
+
+        socket_path = str(folder / "server.sock")
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path), CODE_SPLIT_SOCKET=socket_path)
+        split_args = ["-i", str(src), "-f", str(folder / "out"), "--incremental"]
+        server = subprocess.Popen([sys.executable, "-m", "code_split.code_split", "serve"], env=env)
+        try:
+            while not os.path.exists(socket_path):
+                time.sleep(0.01)
+            cases = {
+                "cold": lambda: (
+                    change(),
+                    subprocess.run([sys.executable, "-m", "code_split.code_split", *split_args], env=env, check=True),
+                ),
+                "client": lambda: (
+                    change(),
+                    subprocess.run([sys.executable, "-m", "code_split.client", *split_args], env=env, check=True),
+                ),
+                "request": lambda: (change(), request(split_args, socket_path)),
+            }
+            for name, job in cases.items():
+                print(f"{name:>8}: {_latency(job, settings.jobs)}")
+        finally:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,173 @@
+"""
+Benchmark of the code_split engine and CLI
+
+For each input size a synthetic module is generated with :mod:`generate_source`
+and split with :func:`code_split.code_split.split_code` using the stream engine
+(engine) and the mmap engine (mmap) and with the ``code_split`` command line (CLI).
+The throughput (lines/s, MB/s, files written/s) and the peak memory are saved as
+JSON and optionally compared to a stored baseline.
+
+Usage::
+
+    python benchmarks/bench_split.py -o results.json --baseline benchmarks/baseline.json
+
+The baseline is updated with ``--save-baseline``.
+"""
+
+import argparse
+import functools
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from generate_source import generate_module
+
+from code_split.code_split import split_code
+
+__author__ = "Matthias Homann"
+__copyright__ = "Matthias Homann"
+__license__ = "GPL-3.0-or-later"
+
+BASELINE = Path(__file__).parent / "baseline.json"
+
+# Metrics where a higher value is better, all others are compared as lower is better
+HIGHER_IS_BETTER = ("lines_per_s", "mb_per_s", "files_per_s")
+
+
+def _metrics(lines: int, size: int, files: int, seconds: float, peak_memory: int) -> Dict[str, float]:
+    return {
+        "seconds": round(seconds, 4),
+        "lines_per_s": round(lines / seconds),
+        "mb_per_s": round(size / 2**20 / seconds, 2),
+        "files_per_s": round(files / seconds),
+        "peak_memory_mb": round(peak_memory / 2**20, 2),
+    }
+
+
+def bench_engine(src: Path, folder: Path, lines: int, repeat: int, engine: str = "stream") -> Dict[str, float]:
+    """Best of ``repeat`` runs of split_code, the peak memory is measured in an extra run with tracemalloc"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        split_code(str(src), str(folder), engine=engine)
+        timings.append(time.perf_counter() - start)
+    tracemalloc.start()
+    split_code(str(src), str(folder), engine=engine)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    files = sum(1 for _ in folder.iterdir())
+    return _metrics(lines, src.stat().st_size, files, min(timings), peak)
+
+
+def bench_cli(src: Path, folder: Path, lines: int, repeat: int) -> Dict[str, float]:
+    """Best of ``repeat`` runs of the CLI including the interpreter start, the peak memory is the max. RSS"""
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+    command = [sys.executable, "-m", "code_split.code_split", "-i", str(src), "-f", str(folder)]
+    timings = []
+    max_rss = 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        proc = subprocess.Popen(command, env=env)
+        # wait4() returns the resource usage of this child only
+        _, status, usage = os.wait4(proc.pid, 0)
+        timings.append(time.perf_counter() - start)
+        proc.returncode = os.waitstatus_to_exitcode(status)
+        if proc.returncode:
+            raise RuntimeError(f"CLI failed with exit status {proc.returncode}")
+        max_rss = max(max_rss, usage.ru_maxrss * 1024)
+    files = sum(1 for _ in folder.iterdir())
+    return _metrics(lines, src.stat().st_size, files, min(timings), max_rss)
+
+
+def run_benchmarks(sizes: List[int], seed: int, repeat: int) -> Dict[str, Dict[str, float]]:
+    """Run all benchmarks, the results are keyed by ``<case>-<lines>``"""
+    results = {}
+    with tempfile.TemporaryDirectory(prefix="code_split_bench_") as tmp:
+        for size in sizes:
+            src = Path(tmp) / f"module_{size}.py"
+            with src.open("w", encoding="utf-8") as file:
+                lines = 0
+                for line in generate_module(size, seed):
+                    file.write(line)
+                    lines += 1
+            for case, bench in (
+                ("engine", bench_engine),
+                ("mmap", functools.partial(bench_engine, engine="mmap")),
+                ("cli", bench_cli),
+            ):
+                folder = Path(tmp) / f"{case}_{size}"
+                folder.mkdir()
+                results[f"{case}-{size}"] = bench(src, folder, lines, repeat)
+                print(f"{case}-{size}: {results[f'{case}-{size}']}", flush=True)
+    return results
+
+
+def compare(results: Dict[str, Dict[str, float]], baseline: Dict[str, Dict[str, float]], tolerance: float) -> List[str]:
+    """Compare the results with the baseline
+
+    Returns
+    -------
+    List[str]
+        Description of all metrics which are worse than the baseline by more than the tolerance
+    """
+    regressions = []
+    for key, metrics in results.items():
+        for name, reference in baseline.get(key, {}).items():
+            if name == "seconds" or name not in metrics or not reference:
+                continue
+            change = metrics[name] / reference - 1
+            if name not in HIGHER_IS_BETTER:
+                change = -change
+            print(f"{key:>16} {name:>15}: {metrics[name]:>12} vs. {reference:>12} ({change:+.1%})")
+            if change < -tolerance:
+                regressions.append(f"{key} {name}: {metrics[name]} vs. baseline {reference}")
+    return regressions
+
+
+def parse_args(args: List[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark code_split")
+    parser.add_argument(
+        "-l",
+        "--lines",
+        type=lambda value: [int(size) for size in value.split(",")],
+        default=[10_000, 100_000, 1_000_000],
+        help="Comma separated list of input sizes in lines (default: 10000,100000,1000000)",
+    )
+    parser.add_argument("-s", "--seed", type=int, default=0, help="Seed of the source generator")
+    parser.add_argument("-r", "--repeat", type=int, default=3, help="Number of runs, the best one is reported")
+    parser.add_argument("-o", "--output", type=str, help="Save the results as JSON file")
+    parser.add_argument("-b", "--baseline", type=str, help="Compare with a baseline JSON file")
+    parser.add_argument("-t", "--tolerance", type=float, default=0.1, help="Allowed regression (default: 0.1)")
+    parser.add_argument("--save-baseline", action="store_true", help=f"Save the results as {BASELINE}")
+    return parser.parse_args(args)
+
+
+def main(args: List[str]) -> int:
+    settings = parse_args(args)
+    report = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "seed": settings.seed,
+        "results": run_benchmarks(settings.lines, settings.seed, settings.repeat),
+    }
+    for target in (settings.output, BASELINE if settings.save_baseline else None):
+        if target:
+            Path(target).write_text(json.dumps(report, indent=2) + "\n", encoding="utf-8")
+    regressions: Optional[List[str]] = None
+    if settings.baseline:
+        baseline = json.loads(Path(settings.baseline).read_text(encoding="utf-8"))
+        regressions = compare(report["results"], baseline["results"], settings.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
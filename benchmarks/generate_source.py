@@ -0,0 +1,141 @@
+"""
+Seeded generator for synthetic but realistic Python modules
+
+The generated modules contain many small functions, a few huge classes,
+heavy decorator stacks, long comment runs and some top level code, so all
+code paths of the splitter are exercised.
+
+Usage::
+
+    python benchmarks/generate_source.py --lines 1000000 --seed 42 -o big_module.py
+"""
+
+import argparse
+import random
+import sys
+from typing import Iterator, List
+
+__author__ = "Matthias Homann"
+__copyright__ = "Matthias Homann"
+__license__ = "GPL-3.0-or-later"
+
+HEADER = '''"""Synthetic module generated for benchmarking code_split"""
+
+import functools
+import logging
+from dataclasses import dataclass
+
+logger = logging.getLogger(__name__)
+
+'''
+
+STATEMENTS = [
+    "value = value + {n}",
+    "result.append(value * {n})",
+    "logger.debug('step {n}: %s', value)",
+    "if value > {n}:",
+    "    value -= {n}",
+    "for index in range({n}):",
+    "    total += index",
+    "# inline comment number {n}",
+    "",
+]
+
+
+def _body(rng: random.Random, length: int, indent: str) -> List[str]:
+    """Function body with a docstring and random statements"""
+    lines = [f'{indent}"""Generated function body"""\n', f"{indent}value = total = 0\n", f"{indent}result = []\n"]
+    for _ in range(length):
+        statement = rng.choice(STATEMENTS).format(n=rng.randint(1, 999))
+        lines.append(f"{indent}{statement}\n" if statement else "\n")
+    lines.append(f"{indent}return result\n")
+    return lines
+
+
+def _decorators(rng: random.Random, count: int, indent: str = "") -> List[str]:
+    return [f"{indent}@functools.lru_cache(maxsize={rng.randint(1, 512)})\n" for _ in range(count)]
+
+
+def generate_module(lines: int, seed: int = 0) -> Iterator[str]:
+    """Generate the lines of a synthetic Python module.
+
+    The same lines and seed always generate the same module.
+
+    Parameters
+    ----------
+    lines : int
+        Minimum number of lines of the module
+    seed : int
+        Seed of the random generator
+
+    Yields
+    ------
+    str
+        Source code lines including the line ending
+    """
+    rng = random.Random(seed)
+    count = 0
+    symbol = 0
+    for line in HEADER.splitlines(keepends=True):
+        count += 1
+        yield line
+    while count < lines:
+        symbol += 1
+        kind = rng.random()
+        block: List[str] = []
+        if kind < 0.65:
+            # Many small functions, some with a comment or decorator
+            if rng.random() < 0.3:
+                block.append(f"# Helper function number {symbol}\n")
+            block += _decorators(rng, rng.choice((0, 0, 0, 1, 2)))
+            block.append(f"def function_{symbol}(value: int) -> list:\n")
+            block += _body(rng, rng.randint(2, 15), "    ")
+        elif kind < 0.67:
+            # A few huge classes with many methods
+            block.append("@dataclass\n")
+            block.append(f"class HugeClass{symbol}:\n")
+            block.append('    """Generated class with many methods"""\n')
+            for method in range(rng.randint(50, 300)):
+                block.append("\n")
+                block += _decorators(rng, rng.choice((0, 0, 1)), "    ")
+                block.append(f"    def method_{method}(self, value: int) -> list:\n")
+                block += _body(rng, rng.randint(3, 25), "        ")
+        elif kind < 0.80:
+            # Heavy decorator stacks
+            block += _decorators(rng, rng.randint(5, 40))
+            block.append(f"def decorated_{symbol}(value: int) -> list:\n")
+            block += _body(rng, rng.randint(2, 10), "    ")
+        elif kind < 0.92:
+            # Long comment runs, the last part is attached to the next block
+            block += [f"# Banner comment {symbol} line {index}\n" for index in range(rng.randint(10, 200))]
+            if rng.random() < 0.5:
+                block.append("\n")
+            block.append(f"class Small{symbol}:\n")
+            block.append(f"    attribute = {symbol}\n")
+        else:
+            # Top level code between the blocks
+            block += [f"print('top level statement {index}')\n" for index in range(rng.randint(1, 20))]
+        block += ["\n", "\n"]
+        count += len(block)
+        yield from block
+
+
+def parse_args(args: List[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Generate a synthetic Python module")
+    parser.add_argument("-l", "--lines", type=int, default=100_000, help="Minimum number of lines")
+    parser.add_argument("-s", "--seed", type=int, default=0, help="Seed of the random generator")
+    parser.add_argument("-o", "--output", type=str, help="Output file (default: stdout)")
+    return parser.parse_args(args)
+
+
+def main(args: List[str]) -> None:
+    settings = parse_args(args)
+    if settings.output:
+        with open(settings.output, "w", encoding="utf-8") as file:
+            file.writelines(generate_module(settings.lines, settings.seed))
+    else:
+        sys.stdout.writelines(generate_module(settings.lines, settings.seed))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
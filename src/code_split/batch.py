@@ -0,0 +1,269 @@
+"""
+Split whole source trees in parallel
+"""
+
+import glob
+import logging
+import os
+from pathlib import Path
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Set,
+    Tuple,
+)
+
+from code_split.blocks import Select, iter_blocks
+from code_split.code_split import _supported_engine, split_code
+from code_split.sinks import ArchiveSink, NdjsonSink, block_record
+
+if TYPE_CHECKING:
+    from code_split.stats import SourceStats  # pragma: no cover
+
+__author__ = "Matthias Homann"
+__copyright__ = "Matthias Homann"
+__license__ = "GPL-3.0-or-later"
+
+_logger = logging.getLogger(__name__)
+
+GLOB_CHARS = "*?["
+
+
+def is_glob(pattern: str) -> bool:
+    """Check if the input contains glob wildcards"""
+    return any(char in pattern for char in GLOB_CHARS)
+
+
+def _glob_base(pattern: str) -> Path:
+    """Return the leading part of a glob pattern which has no wildcards"""
+    parts = []
+    for part in Path(pattern).parts:
+        if is_glob(part):
+            break
+        parts.append(part)
+    return Path(*parts) if parts else Path(".")
+
+
+def collect_sources(inputs: Iterable[str]) -> List[Tuple[Path, Path]]:
+    """Expand files, directories and glob patterns into the list of source files.
+
+    Directories are searched recursively for ``*.py`` files.
+
+    Parameters
+    ----------
+    inputs : Iterable[str]
+        Files, directories or glob patterns (``**`` is supported)
+
+    Returns
+    -------
+    List[Tuple[Path, Path]]
+        Sorted list of absolute ``(source file, base folder)`` tuples, where the base folder is the
+        root of the input the source was found in
+    """
+    sources: Dict[Path, Path] = {}
+    for item in inputs:
+        if is_glob(item):
+            base = Path.cwd().joinpath(_glob_base(item))
+            for match in glob.glob(item, recursive=True):
+                path = Path.cwd().joinpath(match)
+                if path.is_file():
+                    sources.setdefault(path, base)
+        else:
+            path = Path.cwd().joinpath(item)
+            if path.is_dir():
+                for src in path.rglob("*.py"):
+                    if src.is_file():
+                        sources.setdefault(src, path)
+            else:
+                # Missing files are passed on to be reported as failure
+                sources.setdefault(path, path.parent)
+    return sorted(sources.items())
+
+
+def collect_tree(inputs: Iterable[str], output: Path) -> List[Tuple[Path, Path]]:
+    """Source files found in the inputs, see :func:`collect_sources`
+
+    If the output folder is part of the input tree, the sources below it are the results
+    of a previous run and are skipped. If it's the root of the input tree, e.g. for ``-i .``
+    without destination folder, the results are the sources in the folder of another source,
+    like ``pkg/module/my_function.py`` of ``pkg/module.py``.
+    """
+    sources = collect_sources(inputs)
+    paths = {src for src, _ in sources}
+    return [(src, base) for src, base in sources if not _is_result(src, base, output, paths)]
+
+
+def _is_result(src: Path, base: Path, output: Path, sources: Set[Path]) -> bool:
+    """Check if a source below the input folder ``base`` was written by a previous run into the output folder"""
+    if output not in src.parents:
+        return False
+    if base in output.parents:
+        return True
+    # The results of each source are in the folder named like the source
+    return output == base and any(
+        folder.with_suffix(".py") in sources for folder in src.parents if output in folder.parents
+    )
+
+
+def _split_job(job: Tuple[str, str, Dict[str, Any]]) -> Tuple[Optional[str], List["SourceStats"]]:
+    """Worker function, returns the error message or None if the split succeeded and the statistics"""
+    src_code, folder, options = job
+    if not Path(src_code).is_file():
+        return "Can't find input file", []
+    if options.get("stats") is not None:
+        # The statistics are collected in the worker and returned to the calling process
+        from code_split.stats import RunStats
+
+        options = dict(options, stats=RunStats())
+    try:
+        split_code(src_code, folder, **options)
+    except Exception as err:  # pylint: disable=broad-except
+        return f"{type(err).__name__}: {err}", []
+    return None, options["stats"].sources if options.get("stats") is not None else []
+
+
+def _blocks_job(job: Tuple[str, Optional[Select], int]) -> Tuple[Optional[str], List[Tuple[str, bytes]]]:
+    """Worker function for archives, returns the error message and the content per output file"""
+    src_code, select, depth = job
+    try:
+        with open(src_code, "rb") as file:
+            return None, [(block.file_name, block.file_data) for block in iter_blocks(file, select, depth)]
+    except FileNotFoundError:
+        return "Can't find input file", []
+    except Exception as err:  # pylint: disable=broad-except
+        return f"{type(err).__name__}: {err}", []
+
+
+def _records_job(job: Tuple[str, Optional[Select], int, str]) -> Tuple[Optional[str], List[bytes]]:
+    """Worker function for NDJSON, returns the error message and the record per block"""
+    src_code, select, depth, content = job
+    try:
+        with open(src_code, "rb") as file:
+            return None, [block_record(src_code, block, content) for block in iter_blocks(file, select, depth)]
+    except FileNotFoundError:
+        return "Can't find input file", []
+    except Exception as err:  # pylint: disable=broad-except
+        return f"{type(err).__name__}: {err}", []
+
+
+def _map(function: Callable[[Any], Any], jobs: List[Any], workers: int) -> Iterator[Any]:
+    """Run the jobs in a process pool, the results are returned in job order"""
+    if workers == 1:
+        yield from map(function, jobs)
+    else:
+        from concurrent.futures import ProcessPoolExecutor
+
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            # map() returns the results in job order, independent of the completion order
+            yield from executor.map(function, jobs, chunksize=max(1, len(jobs) // (workers * 4)))
+
+
+def split_tree(
+    inputs: Iterable[str],
+    folder: Optional[str],
+    workers: Optional[int] = None,
+    archive: Optional[str] = None,
+    archive_format: Optional[str] = None,
+    ndjson: Optional[str] = None,
+    **options: Any,
+) -> Dict[Path, Optional[str]]:
+    """Split all source files found in the inputs using a process pool.
+
+    The source layout is mirrored below the output folder, each source file gets its own
+    sub-folder named like the file without suffix, e.g. ``pkg/mod.py`` is split into ``<folder>/pkg/mod/``.
+    A failing file is reported in the result, but doesn't stop the run.
+
+    Parameters
+    ----------
+    inputs : Iterable[str]
+        Files, directories or glob patterns
+    folder : Optional[str]
+        Output folder for the new files, defaults to the current working directory
+    workers : Optional[int]
+        Number of worker processes, defaults to the number of CPU cores
+    archive : Optional[str]
+        Write all files into this zip or tar archive (``"-"`` for stdout) instead of the output folder,
+        the workers split the sources and the archive is written by the calling process
+    archive_format : Optional[str]
+        Format of the archive, guessed from the archive name by default
+    ndjson : Optional[str]
+        Stream one JSON record per block with its ``"text"`` or its ``"hash"`` to stdout instead of writing
+        any files, the records of a source are written as soon as its worker finished, in source order
+    options : Any
+        Further options passed to :func:`code_split.code_split.split_code`, e.g. ``incremental=True``,
+        the default ``index=""`` is a single index and ``store=""`` a single store in the output folder,
+        the block filter ``select`` must be picklable, the statistics ``stats`` of the workers are added
+        to the given :class:`code_split.stats.RunStats`, they aren't collected for archives
+
+    Returns
+    -------
+    Dict[Path, Optional[str]]
+        Error message or None per source file, sorted by source path independent of the
+        order in which the workers finished
+    """
+    output = Path.cwd().joinpath(folder) if folder else Path.cwd()
+    if options.get("index") == "":
+        # One index for all sources instead of one per sub-folder
+        from code_split.index import INDEX_NAME
+
+        options["index"] = str(output.joinpath(INDEX_NAME))
+    if options.get("store") == "":
+        # One store for all sources, so the blocks are deduplicated across the tree
+        from code_split.store import STORE_NAME
+
+        options["store"] = str(output.joinpath(STORE_NAME))
+    if options.get("engine") == "parallel":
+        # The sources are already split in parallel, one process pool per source would oversubscribe the cores
+        options["engine"] = "mmap"
+    if options.get("engine", "stream") != "stream":
+        # Warn once instead of once per source
+        bundled = bool(options.get("bundle_bytes") or options.get("bundle_lines"))
+        options["engine"] = _supported_engine(
+            options["engine"], bundled, options.get("collisions", "overwrite"), options.get("depth", 1)
+        )
+    sources = collect_tree(inputs, output)
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = max(1, min(workers, len(sources)))
+    _logger.info("Split %d source files using %d workers", len(sources), workers)
+    if ndjson:
+        errors = []
+        with NdjsonSink(ndjson) as ndjson_sink:
+            select, depth = options.get("select"), options.get("depth", 1)
+            jobs = [(str(src), select, depth, ndjson) for src, _ in sources]
+            for error, records in _map(_records_job, jobs, workers):
+                for record in records:
+                    ndjson_sink.write(record)
+                errors.append(error)
+    elif archive:
+        errors = []
+        with ArchiveSink(archive, archive_format) as sink:
+            select, depth = options.get("select"), options.get("depth", 1)
+            results = _map(_blocks_job, [(str(src), select, depth) for src, _ in sources], workers)
+            for (error, files), (src, base) in zip(results, sources):
+                prefix = src.relative_to(base).with_suffix("").as_posix()
+                for name, data in files:
+                    sink.write(f"{prefix}/{name}", data)
+                errors.append(error)
+    else:
+        jobs = [
+            (str(src), str(output.joinpath(src.relative_to(base).with_suffix(""))), options) for src, base in sources
+        ]
+        stats = options.get("stats")
+        errors = []
+        for error, records in _map(_split_job, jobs, workers):
+            errors.append(error)
+            if stats is not None:
+                stats.sources += records
+    report = {}
+    for (src, _), error in zip(sources, errors):
+        if error:
+            _logger.error("Failed to split %s: %s", src, error)
+        report[src] = error
+    return report
@@ -0,0 +1,611 @@
+"""
+Split Python code in memory into blocks per top level class and function
+
+With a depth, the methods and nested classes of the classes are split in the same pass,
+see :class:`_Members`.
+"""
+
+import codecs
+import io
+import itertools
+import logging
+import os
+from typing import IO, Callable, Iterable, Iterator, List, Optional, Tuple, Union
+
+from code_split.classifier import (
+    BLANK,
+    CODE,
+    COMMENT,
+    CONTINUATION,
+    DECORATOR,
+    HEADER,
+    classify,
+    classify_line_bytes,
+    header_kind,
+)
+from code_split.encoding import DEFAULT_ENCODING, detect_encoding, with_coding_line
+
+__author__ = "Matthias Homann"
+__copyright__ = "Matthias Homann"
+__license__ = "GPL-3.0-or-later"
+
+_logger = logging.getLogger(__name__)
+
+# Line kinds in column 0 which end a class or function
+_BLOCK_END = frozenset((DECORATOR, COMMENT, CODE))
+
+Source = Union[str, bytes, "os.PathLike[str]", IO[str], IO[bytes], Iterable[str], Iterable[bytes]]
+Range = Tuple[int, int]
+# Called with name, kind and if the block is decorated, see code_split.filters.BlockFilter
+Select = Callable[[str, str, bool], bool]
+
+
+class Block:
+    """Top level class or function including its decorators and leading comment.
+
+    Members of a class split with a depth, see :func:`iter_blocks`, are named like
+    ``MyClass.method`` and keep the indentation of the source.
+
+    Line numbers start at 1 and the end line is included, the byte offsets refer
+    to the encoded source and the end offset is excluded. Blocks are immutable.
+    Blocks split from bytes keep the bytes of the source in :attr:`data`, the
+    text is only decoded when it's used. Blocks split from a path only keep the
+    byte ranges of the block, the data is read from the file when it's used.
+    """
+
+    # A plain class with slots, dataclasses imports inspect which slows down the start
+    __slots__ = (
+        "name",
+        "kind",
+        "start_line",
+        "end_line",
+        "start_offset",
+        "end_offset",
+        "_text",
+        "_data",
+        "encoding",
+        "_comment_lines",
+        "_decorator_lines",
+        "_path",
+        "_ranges",
+    )
+    _FIELDS = ("name", "kind", "start_line", "end_line", "start_offset", "end_offset", "text")
+
+    name: str
+    kind: str
+    start_line: int
+    end_line: int
+    start_offset: int
+    end_offset: int
+    encoding: str
+
+    def __init__(
+        self,
+        name: str,
+        kind: str,
+        start_line: int,
+        end_line: int,
+        start_offset: int,
+        end_offset: int,
+        text: Optional[str] = None,
+        data: Optional[bytes] = None,
+        encoding: str = DEFAULT_ENCODING,
+        comment_lines: int = 0,
+        decorator_lines: int = 0,
+        path: Optional[str] = None,
+        ranges: Tuple[Range, ...] = (),
+    ) -> None:
+        if text is None and data is None and path is None:
+            raise TypeError("Block needs the text, the data or the path of the source")
+        init = object.__setattr__
+        init(self, "name", name)
+        init(self, "kind", kind)
+        init(self, "start_line", start_line)
+        init(self, "end_line", end_line)
+        init(self, "start_offset", start_offset)
+        init(self, "end_offset", end_offset)
+        init(self, "_text", text)
+        init(self, "_data", data)
+        init(self, "encoding", encoding)
+        init(self, "_comment_lines", comment_lines)
+        init(self, "_decorator_lines", decorator_lines)
+        init(self, "_path", path)
+        init(self, "_ranges", ranges)
+
+    @property
+    def text(self) -> str:
+        """Source code of the block"""
+        if self._text is None:
+            object.__setattr__(self, "_text", self.data.decode(self.encoding))
+        return self._text
+
+    @property
+    def data(self) -> bytes:
+        """Source code of the block encoded like the source, the bytes of the source if split from bytes or a path"""
+        if self._data is None:
+            if self._text is not None:
+                data = self._text.encode(self.encoding)
+            else:
+                # Read from the source file, which must not have changed since it was split
+                with open(self._path, "rb") as file:
+                    pieces = []
+                    for start, end in self._ranges:
+                        file.seek(start)
+                        pieces.append(file.read(end - start))
+                data = b"".join(pieces)
+            object.__setattr__(self, "_data", data)
+        return self._data
+
+    @property
+    def comment(self) -> str:
+        """Comment lines in front of the block, including the line endings, or ``""``"""
+        return "".join(self._leading_lines(0, self._comment_lines))
+
+    @property
+    def decorators(self) -> Tuple[str, ...]:
+        """Decorator lines of the block without indentation and line endings, e.g. ``("@dataclass",)``"""
+        lines = self._leading_lines(self._comment_lines, self._comment_lines + self._decorator_lines)
+        return tuple(line.strip() for line in lines)
+
+    def _leading_lines(self, first: int, stop: int) -> List[str]:
+        """Lines of the block from index first to stop, only the leading lines are decoded"""
+        if first >= stop:
+            return []
+        return leading_lines(self._text if self._text is not None else self.data, first, stop, self.encoding)
+
+    def _astuple(self) -> tuple:
+        return tuple(getattr(self, attribute) for attribute in self._FIELDS)
+
+    def __setattr__(self, name: str, value) -> None:
+        raise AttributeError(f"cannot assign to field {name!r}")
+
+    def __delattr__(self, name: str) -> None:
+        raise AttributeError(f"cannot delete field {name!r}")
+
+    def __eq__(self, other) -> bool:
+        if other.__class__ is not self.__class__:
+            return NotImplemented
+        return self._astuple() == other._astuple()
+
+    def __hash__(self) -> int:
+        return hash(self._astuple())
+
+    def __repr__(self) -> str:
+        fields = ", ".join(f"{attribute}={getattr(self, attribute)!r}" for attribute in self._FIELDS)
+        return f"{self.__class__.__name__}({fields})"
+
+    @property
+    def file_name(self) -> str:
+        """Name of the output file for the block, members of a class are in its folder, e.g. ``MyClass/method.py``"""
+        return self.name.replace(".", "/") + ".py"
+
+    @property
+    def file_data(self) -> bytes:
+        """Content of the output file, :attr:`data` with the coding cookie of a source which isn't UTF-8"""
+        return with_coding_line(self.data, self.encoding)
+
+
+def leading_lines(source: Union[str, bytes], first: int, stop: int, encoding: str = DEFAULT_ENCODING) -> List[str]:
+    """Lines from index first to stop of the text or bytes, including the line endings, decoded with the encoding"""
+    newline = "\n" if isinstance(source, str) else b"\n"
+    lines = []
+    pos = 0
+    for index in range(stop):
+        end = source.find(newline, pos) + 1 or len(source)
+        if index >= first:
+            lines.append(source[pos:end])
+        pos = end
+    if isinstance(source, bytes):
+        return [line.decode(encoding) for line in lines]
+    return lines
+
+
+def _new_block(
+    name: str,
+    kind: str,
+    start: Tuple[int, int],
+    end: Tuple[int, int],
+    lines: list,
+    encoding: Optional[str],
+    leading: Tuple[int, int],
+) -> Block:
+    """Block of the collected lines, either text or bytes if the encoding is given"""
+    _logger.debug("Found %s %s in lines %d-%d", kind, name, start[0], end[0])
+    if encoding is None:
+        return Block(name, kind, start[0], end[0], start[1], end[1], "".join(lines), None, DEFAULT_ENCODING, *leading)
+    return Block(name, kind, start[0], end[0], start[1], end[1], None, b"".join(lines), encoding, *leading)
+
+
+def _ends_header(line: Union[str, bytes]) -> bool:
+    """Check if the line ends the header of a class, i.e. the code before a comment ends with a colon"""
+    if isinstance(line, bytes):
+        return line.split(b"#", 1)[0].rstrip().endswith(b":")
+    return line.split("#", 1)[0].rstrip().endswith(":")
+
+
+class _Members:
+    """Scanner of the members of a class, fed with the lines of the class body in the same pass.
+
+    The body lines are classified like the top level lines, after removing the indentation of the
+    first statement of the body, so the methods and nested classes are split like the top level
+    blocks with their decorators and leading comments. Lines deeper indented than the body continue
+    the current member. Everything else, e.g. the docstring, the class attributes and members which
+    aren't selected, stays in the lines of the class. Nested classes get their own scanner while
+    the depth allows it. Only the lines of the current member are kept, besides the class lines.
+
+    Parameters
+    ----------
+    prefix : str
+        Qualified name of the class followed by a dot, e.g. ``"MyClass."``
+    depth : int
+        Levels of members to be split, 1 for the members of this class only
+    encoding : Optional[str]
+        Encoding of byte lines, None for text lines
+    select : Optional[Select]
+        Filter of the members, called with the qualified name
+    lines : list
+        Lines of the class, the lines which aren't part of a split member are appended
+    header : Union[str, bytes]
+        Header line of the class
+    """
+
+    def __init__(
+        self,
+        prefix: str,
+        depth: int,
+        encoding: Optional[str],
+        select: Optional[Select],
+        lines: list,
+        header: Union[str, bytes],
+    ) -> None:
+        self.prefix = prefix
+        self.depth = depth
+        self.encoding = encoding
+        self.select = select
+        self.lines = lines
+        self._classify = classify if encoding is None else classify_line_bytes
+        self._space = " " if encoding is None else b" "
+        # False while the header continues, e.g. with the base classes on several lines
+        self._body = _ends_header(header)
+        self._indent: Optional[int] = None
+        self._blank_lines: list = []
+        self._cache: list = []
+        self._pre_comment: list = []
+        self._cache_start = self._pre_comment_start = (0, 0)
+        # State of the current member, like in iter_blocks
+        self._name: Optional[str] = None
+        self._kind = ""
+        self._start: Tuple[int, int] = (0, 0)
+        self._end: Tuple[int, int] = (0, 0)
+        self._leading = (0, 0)
+        self._member: list = []
+        self._member_blanks: list = []
+        self._nested: Optional["_Members"] = None
+
+    def feed(self, line: Union[str, bytes], lineno: int, offset: int, size: int) -> Iterator[Block]:
+        """Scan the next line of the class body, yields the members which ended before it"""
+        if not self._body:
+            self._body = _ends_header(line)
+            self._keep([line])
+            return
+        text = line.lstrip(self._space)
+        match = None
+        if line.isspace():
+            line_kind = BLANK
+        else:
+            indent = len(line) - len(text)
+            if self._indent is None:
+                self._indent = indent
+            if indent == self._indent:
+                line_kind, match = self._classify(text)
+            else:
+                line_kind = CONTINUATION
+        if line_kind == DECORATOR:
+            if not self._cache:
+                self._cache_start = (lineno, offset)
+            self._cache.append(line)
+        elif line_kind == HEADER:
+            if self._name:
+                yield from self._end_member()
+            kind = header_kind(match)
+            name = match.group("name")
+            if self.encoding is not None:
+                name = name.decode(self.encoding)
+            name = self.prefix + name
+            if self.select is None or self.select(name, kind, bool(self._cache)):
+                self._start_member(name, kind, line, lineno, offset, size)
+                return
+            # A member which isn't selected stays in the class
+            line_kind = CODE
+        if self._name and line_kind in _BLOCK_END:
+            yield from self._end_member()
+
+        if line_kind == BLANK:
+            if self._nested:
+                yield from self._nested.feed(line, lineno, offset, size)
+            elif self._name:
+                self._member_blanks.append(line)
+            else:
+                # A comment separated by a blank line belongs to the class
+                self._keep(self._pre_comment)
+                self._pre_comment = []
+                self._blank_lines.append(line)
+        elif self._name:
+            if self._nested:
+                yield from self._nested.feed(line, lineno, offset, size)
+            else:
+                self._member += self._member_blanks
+                self._member_blanks.clear()
+                self._member.append(line)
+            self._end = (lineno, offset + size)
+        elif line_kind == COMMENT:
+            if not self._pre_comment:
+                self._pre_comment_start = (lineno, offset)
+            self._pre_comment.append(line)
+        elif line_kind == CONTINUATION and self._cache:
+            # Argument lines of a multi-line decorator
+            self._cache.append(line)
+        elif line_kind != DECORATOR:
+            self._keep(self._pre_comment + self._cache + [line])
+            self._pre_comment = []
+            self._cache = []
+
+    def finish(self) -> Iterator[Block]:
+        """End of the class body, yields the last member, pending comments and decorators stay in the class"""
+        if self._name:
+            yield from self._end_member()
+        self._keep(self._pre_comment + self._cache)
+
+    def _keep(self, lines: list) -> None:
+        """Append the lines to the class after the blank lines in front of them"""
+        if lines:
+            self.lines += self._blank_lines
+            self._blank_lines.clear()
+            self.lines += lines
+
+    def _start_member(self, name: str, kind: str, line: Union[str, bytes], lineno: int, offset: int, size: int) -> None:
+        self._name = name
+        self._kind = kind
+        self._start = (lineno, offset)
+        if self._pre_comment:
+            self._start = min(self._start, self._pre_comment_start)
+        if self._cache:
+            self._start = min(self._start, self._cache_start)
+        self._end = (lineno, offset + size)
+        self._leading = (len(self._pre_comment), len(self._cache))
+        self._member = self._pre_comment + self._cache + [line]
+        if kind == "class" and self.depth > 1:
+            self._nested = _Members(name + ".", self.depth - 1, self.encoding, self.select, self._member, line)
+        self._pre_comment = []
+        self._cache = []
+        # Blank lines between the class lines and the member are dropped
+        self._blank_lines.clear()
+
+    def _end_member(self) -> Iterator[Block]:
+        if self._nested:
+            yield from self._nested.finish()
+            self._member_blanks = self._nested._blank_lines
+            self._nested = None
+        yield _new_block(self._name, self._kind, self._start, self._end, self._member, self.encoding, self._leading)
+        self._name = None
+        self._member = []
+        # The blank lines after the member separate the next class lines
+        self._blank_lines = self._member_blanks
+        self._member_blanks = []
+
+
+def _iter_file_blocks(path: "os.PathLike[str]", select: Optional[Select]) -> Iterator[Block]:
+    """Scan the memory mapped file for the blocks, their data is only read from the file when it's used"""
+    import mmap
+
+    from code_split.mmap_engine import scan_spans
+
+    name = os.fspath(path)
+    with open(name, "rb") as file:
+        if not os.fstat(file.fileno()).st_size:
+            # Empty files can't be mapped
+            return
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapping:
+            encoding, bom = detect_encoding(mapping)
+            for span in scan_spans(mapping, bom, select=select, encoding=encoding):
+                start = min(span.start, *(start for start, _ in span.prefix)) if span.prefix else span.start
+                yield Block(
+                    span.name,
+                    span.kind,
+                    span.start_line,
+                    span.end_line,
+                    start,
+                    span.end,
+                    None,
+                    None,
+                    encoding,
+                    span.comment_lines,
+                    span.decorator_lines,
+                    name,
+                    span.ranges(),
+                )
+
+
+def _open_lines(source: Source) -> Tuple[Iterator[Union[str, bytes]], Optional[str], int]:
+    """Lines of the source, the encoding for byte lines and the offset of the first line after a BOM.
+
+    Strings and text files are split as text, bytes and binary files as bytes, the encoding
+    is detected from the BOM or the coding cookie, see :mod:`code_split.encoding`.
+    """
+    if isinstance(source, str):
+        source = io.StringIO(source)
+    elif isinstance(source, (bytes, bytearray)):
+        source = io.BytesIO(source)
+    lines = iter(source)
+    first = next(lines, None)
+    if first is None:
+        return iter(()), None, 0
+    if isinstance(first, str):
+        if first.startswith("\ufeff"):
+            # UTF-8 BOM of a source read as text
+            return itertools.chain((first[1:],), lines), None, len(codecs.BOM_UTF8)
+        return itertools.chain((first,), lines), None, 0
+    second = next(lines, b"")
+    encoding, bom = detect_encoding(first + second)
+    return itertools.chain((first[bom:], second) if second else (first[bom:],), lines), encoding, bom
+
+
+def iter_blocks(source: Source, select: Optional[Select] = None, depth: int = 1) -> Iterator[Block]:
+    """Split the source code into the top level classes and functions.
+
+    The lines are consumed as stream, only the current block and the decorators, comments
+    and blank lines in front of the current line are kept in memory.
+    Bytes and binary files are split without decoding the lines, the blocks keep the
+    bytes of the source, see :attr:`Block.data`.
+
+    A path, e.g. a :class:`pathlib.Path`, is scanned memory mapped without copying any line,
+    the blocks only keep their byte ranges and the text is read from the file when it's used.
+    Scanning a path for names, kinds and line spans allocates little more than the block objects.
+
+    With a depth of 2 the methods and nested classes of the top level classes are split too, in the
+    same pass, 3 splits the members of the nested classes as well and so on. The members are named
+    like ``MyClass.method`` and yielded before their class, whose block then only has the lines
+    which aren't part of a member, e.g. the header, the docstring and the class attributes.
+    Only the current member and these class lines are kept in memory. A path is read as stream then.
+
+    Parameters
+    ----------
+    source : Source
+        Source code as string or bytes, a path, a text or binary file object or an iterable of lines
+    select : Optional[Select]
+        Filter called with name, kind and if the block has decorators when the header is found,
+        the lines of blocks which aren't selected are skipped, see :class:`code_split.filters.BlockFilter`,
+        members are checked with their qualified name and stay in their class if they aren't selected
+    depth : int
+        Levels of classes whose members are split, 1 for the top level classes and functions only
+
+    Yields
+    ------
+    Block
+        Block per class or function, in the order of the source
+
+    Raises
+    ------
+    ValueError
+        If the encoding of a bytes source is unknown or not compatible with ASCII
+    """
+    if isinstance(source, os.PathLike):
+        if depth > 1:
+            with open(source, "rb") as file:
+                yield from iter_blocks(file, select, depth)
+        else:
+            yield from _iter_file_blocks(source, select)
+        return
+    lines, encoding, offset = _open_lines(source)
+    binary = encoding is not None
+    # Number of comment and decorator lines at the start of the block
+    leading = (0, 0)
+    name: Optional[str] = None
+    kind = ""
+    # False while the lines of a block which isn't selected are skipped
+    keep = True
+    # Scanner of the members of the current class if they are split
+    members: Optional[_Members] = None
+    start: Tuple[int, int] = (0, 0)
+    end: Tuple[int, int] = (0, 0)
+    # Lines are collected in lists and joined when written, growing strings with += is quadratic
+    block: list = []
+    cache: list = []
+    blank_lines: list = []
+    pre_comment: list = []
+    # Line number and offset of the first line in cache and pre_comment
+    cache_start = pre_comment_start = (0, 0)
+    lineno = 0
+    for line in lines:
+        lineno += 1
+        if binary:
+            size = len(line)
+            line_kind, match = classify_line_bytes(line)
+        else:
+            size = len(line) if line.isascii() else len(line.encode("utf-8"))
+            line_kind, match = classify(line)
+        if line_kind == DECORATOR:
+            if not cache:
+                cache_start = (lineno, offset)
+            cache.append(line)
+        elif line_kind == HEADER:
+            if name and keep:
+                if members:
+                    yield from members.finish()
+                yield _new_block(name, kind, start, end, block, encoding, leading)
+            kind = header_kind(match)
+            name = match.group("name")
+            if binary:
+                # Only the names are decoded
+                name = name.decode(encoding)
+            keep = select is None or select(name, kind, bool(cache))
+            start = (lineno, offset)
+            if pre_comment:
+                start = min(start, pre_comment_start)
+            if cache:
+                start = min(start, cache_start)
+            leading = (len(pre_comment), len(cache))
+            block = pre_comment + cache if keep else []
+            members = None
+            if keep and depth > 1 and kind == "class":
+                members = _Members(name + ".", depth - 1, encoding, select, block, line)
+            pre_comment = []
+            cache = []
+            blank_lines.clear()
+        if name and line_kind in _BLOCK_END:
+            # Class of function ended, either comments or main code
+            if keep:
+                if members:
+                    yield from members.finish()
+                yield _new_block(name, kind, start, end, block, encoding, leading)
+            name = None
+            block = []
+            members = None
+
+        if line_kind == BLANK:
+            # cache blank lines, they are only written if the class or function continues
+            if members:
+                yield from members.feed(line, lineno, offset, size)
+            elif name and keep:
+                blank_lines.append(line)
+            # ignore comments before functions is separated by a blank line
+            pre_comment.clear()
+        elif name:
+            if keep:
+                if members and line_kind != HEADER:
+                    yield from members.feed(line, lineno, offset, size)
+                else:
+                    if blank_lines:
+                        block += blank_lines
+                        blank_lines.clear()
+                    block.append(line)
+                end = (lineno, offset + size)
+        elif line_kind == COMMENT:
+            if not pre_comment:
+                pre_comment_start = (lineno, offset)
+            pre_comment.append(line)
+        offset += size
+    if name and keep:
+        if members:
+            yield from members.finish()
+        yield _new_block(name, kind, start, end, block, encoding, leading)
+
+
+def split_blocks(source: Source, select: Optional[Select] = None, depth: int = 1) -> List[Block]:
+    """Split the source code into the top level classes and functions, see :func:`iter_blocks`
+
+    Parameters
+    ----------
+    source : Source
+        Source code as string or bytes, a path, a text or binary file object or an iterable of lines
+    select : Optional[Select]
+        Filter of the blocks, see :func:`iter_blocks`
+    depth : int
+        Levels of classes whose members are split, see :func:`iter_blocks`
+
+    Returns
+    -------
+    List[Block]
+        Block per class or function, in the order of the source
+    """
+    return list(iter_blocks(source, select, depth))
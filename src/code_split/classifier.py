@@ -0,0 +1,145 @@
+"""
+Classification of source code lines for the split engines
+
+Each line is classified in a single pass into one of the kinds below, based on a
+lookup of the first character and a precompiled pattern for the header lines.
+Only lines in column 0 start or end a top level block.
+"""
+
+import re
+from typing import Match, Optional, Tuple, Union
+
+__author__ = "Matthias Homann"
+__copyright__ = "Matthias Homann"
+__license__ = "GPL-3.0-or-later"
+
+BLANK = "blank"
+"""Empty line or only whitespace"""
+DECORATOR = "decorator"
+"""Decorator of a top level class or function"""
+HEADER = "header"
+"""``def``, ``async def`` or ``class`` statement of a top level block"""
+CONTINUATION = "continuation"
+"""Indented line or closing parenthesis of a multi-line statement"""
+COMMENT = "comment"
+"""Comment in column 0"""
+CODE = "code"
+"""Any other top level code"""
+
+# Candidates are selected by the first character, only lines which might be a header
+# need a regular expression. \w only matches ASCII for bytes, so all bytes of
+# multi-byte UTF-8 characters are accepted in names.
+_HEADER_PATTERN = r"(?:async\s+)?(?P<kind>def|class)\s+(?P<name>{word}+)"
+_HEADER = re.compile(_HEADER_PATTERN.format(word=r"\w"))
+_HEADER_BYTES = re.compile(_HEADER_PATTERN.format(word=r"[\w\x80-\xff]").encode())
+_BLANK_BYTES = re.compile(rb"\s*")
+
+_SPACE = "space"
+_WHITESPACE = "whitespace"
+_HEADER_CANDIDATE = "header candidate"
+_FIRST_CHAR = {
+    "": BLANK,
+    "@": DECORATOR,
+    "#": COMMENT,
+    ")": CONTINUATION,
+    " ": _SPACE,
+    "a": _HEADER_CANDIDATE,
+    "c": _HEADER_CANDIDATE,
+    "d": _HEADER_CANDIDATE,
+}
+_FIRST_CHAR.update(dict.fromkeys("\t\n\r\x0b\x0c", _WHITESPACE))
+_FIRST_BYTE = {ord(char): kind for char, kind in _FIRST_CHAR.items() if char}
+_FIRST_BYTES = {char.encode(): kind for char, kind in _FIRST_CHAR.items()}
+# Results without match are shared to avoid a new tuple per line
+_RESULTS = {kind: (kind, None) for kind in (BLANK, DECORATOR, CONTINUATION, COMMENT, CODE)}
+
+AnyStr = Union[str, bytes]
+
+
+def classify(line: str) -> Tuple[str, Optional[Match[str]]]:
+    """Classify a source code line.
+
+    Parameters
+    ----------
+    line : str
+        Source code line including the line ending
+
+    Returns
+    -------
+    Tuple[str, Optional[Match[str]]]
+        Kind of the line and for a header the match, which holds the groups
+        ``kind`` (``"def"`` or ``"class"``) and ``name``
+    """
+    kind = _FIRST_CHAR.get(line[:1], CODE)
+    if kind is _SPACE:
+        return _RESULTS[BLANK if line.isspace() else CONTINUATION]
+    if kind is _WHITESPACE:
+        return _RESULTS[BLANK if line.isspace() else CODE]
+    if kind is _HEADER_CANDIDATE:
+        match = _HEADER.match(line)
+        return (HEADER, match) if match else _RESULTS[CODE]
+    return _RESULTS[kind]
+
+
+def classify_line_bytes(line: bytes) -> Tuple[str, Optional[Match[bytes]]]:
+    """Classify a source code line given as bytes, like :func:`classify`.
+
+    Faster than :func:`classify_bytes` for lines which are separate objects, e.g. read from a binary file.
+
+    Parameters
+    ----------
+    line : bytes
+        Source code line including the line ending
+
+    Returns
+    -------
+    Tuple[str, Optional[Match[bytes]]]
+        Kind of the line and the match, see :func:`classify`
+    """
+    kind = _FIRST_BYTES.get(line[:1], CODE)
+    if kind is _SPACE:
+        return _RESULTS[BLANK if line.isspace() else CONTINUATION]
+    if kind is _WHITESPACE:
+        return _RESULTS[BLANK if line.isspace() else CODE]
+    if kind is _HEADER_CANDIDATE:
+        match = _HEADER_BYTES.match(line)
+        return (HEADER, match) if match else _RESULTS[CODE]
+    return _RESULTS[kind]
+
+
+def classify_bytes(data, pos: int, end: int) -> Tuple[str, Optional[Match[bytes]]]:
+    """Classify the line ``data[pos:end]`` of a bytes-like object without copying it.
+
+    Parameters
+    ----------
+    data : bytes-like
+        Source code, e.g. a bytes object or a memory mapped file
+    pos : int
+        Start of the line
+    end : int
+        End of the line including the line ending, must be after pos
+
+    Returns
+    -------
+    Tuple[str, Optional[Match[bytes]]]
+        Kind of the line and the match, see :func:`classify`
+    """
+    kind = _FIRST_BYTE.get(data[pos], CODE)
+    if kind is _SPACE:
+        return _RESULTS[BLANK if _BLANK_BYTES.fullmatch(data, pos, end) else CONTINUATION]
+    if kind is _WHITESPACE:
+        return _RESULTS[BLANK if _BLANK_BYTES.fullmatch(data, pos, end) else CODE]
+    if kind is _HEADER_CANDIDATE:
+        match = _HEADER_BYTES.match(data, pos, end)
+        return (HEADER, match) if match else _RESULTS[CODE]
+    return _RESULTS[kind]
+
+
+def header_kind(match: Match[AnyStr]) -> str:
+    """Kind of the block for a header match, i.e. ``"class"``, ``"def"`` or ``"async def"``"""
+    kind = match.group("kind")
+    if isinstance(kind, bytes):
+        kind = kind.decode()
+    if match.start("kind") != match.start():
+        return "async " + kind
+    return kind
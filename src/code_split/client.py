@@ -0,0 +1,106 @@
+"""
+Thin client sending split jobs to the split server
+
+The client takes the same arguments as ``code_split``, sends them together with the
+current working directory to the server started by ``code_split serve`` and prints the
+result. Only the standard library is imported, so the start of the client is as fast
+as possible. If no server is running, the job is split by the client itself.
+
+Usage::
+
+    code_split serve &
+    code_split_client -i my_source_code.py -f /path/to/output --incremental
+"""
+
+import json
+import os
+import socket
+import sys
+from typing import Any, Dict, List, Optional
+
+__author__ = "Matthias Homann"
+__copyright__ = "Matthias Homann"
+__license__ = "GPL-3.0-or-later"
+
+SOCKET_ENV = "CODE_SPLIT_SOCKET"
+
+
+def default_socket() -> str:
+    """Path of the server socket, from ``$CODE_SPLIT_SOCKET`` or in the runtime folder of the user"""
+    path = os.environ.get(SOCKET_ENV)
+    if path:
+        return path
+    runtime = os.environ.get("XDG_RUNTIME_DIR")
+    if runtime:
+        return os.path.join(runtime, "code_split.sock")
+    return os.path.join("/tmp", f"code_split-{os.getuid()}.sock")
+
+
+def request(args: List[str], socket_path: Optional[str] = None, cwd: Optional[str] = None) -> Dict[str, Any]:
+    """Send a split job to the server and wait for the result
+
+    Parameters
+    ----------
+    args : List[str]
+        command line parameters of ``code_split`` as list of strings
+    socket_path : Optional[str]
+        Path of the server socket, see :func:`default_socket`
+    cwd : Optional[str]
+        Folder for relative paths in the arguments, defaults to the current working directory
+
+    Returns
+    -------
+    Dict[str, Any]
+        Result with the exit ``status``, the ``output`` for stdout, the error ``messages`` and
+        the ``seconds`` needed by the server
+
+    Raises
+    ------
+    OSError
+        If the server can't be reached, e.g. ``FileNotFoundError`` or ``ConnectionRefusedError``
+    """
+    data = json.dumps({"args": args, "cwd": cwd or os.getcwd()}).encode("utf-8") + b"\n"
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        client.connect(socket_path or default_socket())
+        client.sendall(data)
+        client.shutdown(socket.SHUT_WR)
+        with client.makefile("rb") as response:
+            return json.loads(response.readline())
+
+
+def main(args: List[str]) -> int:
+    """Send the job given by the command line parameters to the server
+
+    Parameters
+    ----------
+    args : List[str]
+        ``code_split`` parameters, optionally preceded by ``--socket PATH``
+
+    Returns
+    -------
+    int
+        Exit status of the job
+    """
+    socket_path = None
+    if args[:1] == ["--socket"]:
+        socket_path, args = args[1], args[2:]
+    try:
+        result = request(args, socket_path)
+    except (FileNotFoundError, ConnectionRefusedError):
+        # No server, split the code in this process
+        from code_split.code_split import main as split_main
+
+        return split_main(args)
+    sys.stdout.write(result["output"])
+    for message in result["messages"]:
+        print(message, file=sys.stderr)
+    return result["status"]
+
+
+def run() -> None:
+    """Calls :func:`main` passing the CLI arguments extracted from :obj:`sys.argv`"""
+    sys.exit(main(sys.argv[1:]))
+
+
+if __name__ == "__main__":
+    run()
@@ -2,16 +2,28 @@
 Split Python code files per class and function
 """
 
-import argparse
 import logging
-import re
+import os
 import sys
+import time
+from contextlib import contextmanager, nullcontext
 from pathlib import Path
-from typing import List
+from typing import IO, TYPE_CHECKING, Dict, Iterable, Iterator, List, Optional, TextIO
 
-from attr import s
+from code_split.blocks import (  # noqa: F401 (part of the Python API)
+    Block,
+    iter_blocks,
+    split_blocks,
+)
+from code_split.sinks import COLLISIONS, FSYNC_POLICIES, BundleSink, DirectorySink
 
-from code_split import __version__
+if TYPE_CHECKING:
+    import argparse  # pragma: no cover
+
+    from code_split.blocks import Select  # pragma: no cover
+    from code_split.filters import BlockFilter  # pragma: no cover
+    from code_split.index import Symbol, SymbolIndex  # pragma: no cover
+    from code_split.stats import RunStats  # pragma: no cover
 
 __author__ = "Matthias Homann"
 __copyright__ = "Matthias Homann"
@@ -19,19 +31,63 @@ __license__ = "GPL-3.0-or-later"
 
 _logger = logging.getLogger(__name__)
 
+STDIN = "-"
+ENGINES = ("stream", "mmap", "parallel")
+# Same as code_split.sinks.ARCHIVE_FORMATS, which isn't imported unless needed
+ARCHIVE_FORMATS = ("zip", "tar", "tar.gz", "tgz", "tar.bz2", "tar.xz")
+# Same as code_split.index.INDEX_NAME
+INDEX_NAME = ".code_split.db"
+# Same as code_split.filters.KINDS
+KINDS = ("class", "def", "async def", "decorated")
+# Same as code_split.sinks.NDJSON_CONTENT
+NDJSON_CONTENT = ("text", "hash")
+# Same as code_split.plan.PLAN_FORMATS
+PLAN_FORMATS = ("text", "json")
+# Same as code_split.stats.STATS_FORMATS
+STATS_FORMATS = ("json", "prometheus")
+# Same as code_split.store.STORE_NAME
+STORE_NAME = ".code_split_store"
+QUERY = "query"
+SERVE = "serve"
+GIT = "git"
+
 
 # ---- Python API ----
 # The functions defined in this section can be imported by users in their
 # Python scripts/interactive interpreter, e.g. via
 # `from code_split.code_split import split_code`,
 # when using this Python module as a library.
+# Use `iter_blocks` or `split_blocks` to split source code in memory without writing files.
 
 
-def split_code(src_code: str, folder: str) -> None:
+def split_code(
+    src_code: str,
+    folder: str,
+    incremental: bool = False,
+    engine: str = "stream",
+    archive: Optional[str] = None,
+    archive_format: Optional[str] = None,
+    fsync: str = "none",
+    index: Optional[str] = None,
+    workers: Optional[int] = None,
+    select: Optional["Select"] = None,
+    stats: Optional["RunStats"] = None,
+    ndjson: Optional[str] = None,
+    bundle_bytes: Optional[int] = None,
+    bundle_lines: Optional[int] = None,
+    collisions: str = "overwrite",
+    store: Optional[str] = None,
+    depth: int = 1,
+) -> None:
     """Reads the source code file and writes a new output file
     per contained top level class and function.
 
     The functions accepts relative and absolute paths for the scr_code and folder.
+    The source code is read as stream, use ``"-"`` as src_code to read it from stdin.
+
+    In incremental mode a manifest is kept in the output folder. Unchanged sources are
+    skipped, output files with identical content aren't written again and output files
+    of classes or functions which were removed from the source are deleted.
 
     Parameters
     ----------
@@ -39,11 +95,76 @@ def split_code(src_code: str, folder: str) -> None:
         Name of the source code which will be used as input
     folder : str
         Output folder for the new files
+    incremental : bool
+        Only update changed output files, based on the manifest in the output folder
+    engine : str
+        ``"stream"`` to read the source line by line or ``"mmap"`` to split a memory mapped
+        source without copying the lines, see :mod:`code_split.mmap_engine`, or ``"parallel"`` to split
+        chunks of a memory mapped source by a process pool, see :mod:`code_split.parallel`
+    archive : Optional[str]
+        Write all files into this zip or tar archive (``"-"`` for stdout) instead of the output folder
+    archive_format : Optional[str]
+        Format of the archive, guessed from the archive name by default, see :class:`code_split.sinks.ArchiveSink`
+    fsync : str
+        ``"none"``, ``"file"`` to sync each output file or ``"run"`` to sync all files at the end,
+        see :class:`code_split.sinks.DirectorySink`
+    index : Optional[str]
+        Path of the symbol index to be updated, ``""`` for the default index in the output folder,
+        see :class:`code_split.index.SymbolIndex`
+    workers : Optional[int]
+        Number of worker processes of the parallel engine, defaults to the number of CPU cores
+    select : Optional[Select]
+        Only split the blocks selected by this filter, e.g. a :class:`code_split.filters.BlockFilter`,
+        the other blocks are skipped while scanning and no file is written for them
+    stats : Optional[RunStats]
+        Collect the statistics of the source, see :class:`code_split.stats.RunStats`, not in archive mode
+    ndjson : Optional[str]
+        Stream one JSON record per block with its ``"text"`` or its ``"hash"`` to stdout instead of writing
+        any files, see :class:`code_split.sinks.NdjsonSink`
+    bundle_bytes : Optional[int]
+        Write consecutive small blocks into bundle files up to this size with a table of contents,
+        see :class:`code_split.sinks.BundleSink`
+    bundle_lines : Optional[int]
+        Maximum number of lines of a bundle file
+    collisions : str
+        Policy for blocks with the same name: ``"overwrite"`` keeps the last one, ``"suffix"``, ``"merge"``
+        or ``"error"``, see :class:`code_split.sinks.DirectorySink`, not in archive mode
+    store : Optional[str]
+        Path of a content-addressed store, ``""`` for the default store in the output folder, each distinct
+        block is stored once and the output files are links to it, see :mod:`code_split.store`
+    depth : int
+        Levels of classes whose methods and nested classes get their own file in the folder of the class,
+        e.g. ``MyClass/method.py``, 1 for the top level only, see :func:`code_split.blocks.iter_blocks`,
+        the source is split by the stream engine then
+
+    Raises
+    ------
+    ValueError
+        If the encoding of the source is unknown or not compatible with ASCII, or if a name
+        is defined twice and the collision policy is ``"error"``
     """
     src_path = Path(src_code)
-    if not src_path.is_absolute():
+    if src_code != STDIN and not src_path.is_absolute():
         src_path = Path.cwd().joinpath(src_path)
         _logger.debug("Appended CWD to input file path")
+    if ndjson:
+        from code_split.sinks import NdjsonSink
+
+        try:
+            with _open_source(src_code, src_path) as file, NdjsonSink(ndjson) as sink:
+                sink.write_blocks(STDIN if src_code == STDIN else str(src_path), iter_blocks(file, select, depth))
+        except FileNotFoundError:
+            _logger.error("Can't find input file %s", src_code)
+        return
+    if archive:
+        from code_split.sinks import ArchiveSink
+
+        try:
+            with _open_source(src_code, src_path) as file, ArchiveSink(archive, archive_format) as sink:
+                sink.write_blocks(iter_blocks(file, select, depth))
+        except FileNotFoundError:
+            _logger.error("Can't find input file %s", src_code)
+        return
     if folder:
         output = Path(folder)
         if not output.is_absolute():
@@ -53,49 +174,153 @@ def split_code(src_code: str, folder: str) -> None:
 
     if not output.is_dir():
         _logger.info("Create output folder %s", output)
-        output.mkdir()
-    out_file = None
-    cache = ""
-    blank_lines = ""
-    pre_comment = ""
-    try:
-        with src_path.open(encoding="utf-8") as file:
-            for line in file.readlines():
-                if line.startswith("@"):
-                    cache += line
-                if line.startswith("def") or line.startswith("class"):
-                    out_file_name = re.findall(r"^\w+\s+(\w+).*", line)[0] + ".py"
-                    _logger.info("NEW output file: %s", out_file_name)
-                    if out_file:
-                        out_file.close()
-                    out_file = output.joinpath(out_file_name).open("w", encoding="utf-8")
-                    out_file.write(pre_comment)
-                    pre_comment = ""
-                    out_file.write(cache)
-                    cache = ""
-                    blank_lines = ""
-                elif not (line.startswith(" ") or line.startswith(")")) and len(line.strip()) and out_file:
-                    # Class of function ended, either comments or main code
-                    out_file.close()
-                    out_file = None
-
-                if not line.strip():
-                    # cache blank lines
-                    blank_lines += line
-                    # ignore comments before functions is separated by a blank line
-                    pre_comment = ""
-                elif out_file:
-                    if blank_lines:
-                        out_file.write(blank_lines)
-                        blank_lines = ""
-                    _logger.debug("> %s", line.strip())
-                    out_file.write(line)
-                elif line.startswith("#"):
-                    pre_comment += line
-        if out_file:
-            out_file.close()
-    except FileNotFoundError:
-        _logger.error("Can't find input file %s", src_code)
+        output.mkdir(parents=True, exist_ok=True)
+    manifest = None
+    if incremental:
+        from code_split.manifest import Manifest
+
+        manifest = Manifest.open(output)
+    bundled = bool(bundle_bytes or bundle_lines)
+    # stdin is always streamed
+    engine = _supported_engine(engine, bundled, collisions, depth) if src_code != STDIN else "stream"
+    key = STDIN if src_code == STDIN else str(src_path)
+    record = stats.add(key, "stream" if src_code == STDIN else engine) if stats is not None else None
+    start = time.perf_counter()
+    # Changed filters or bundle budgets need a new split of unchanged sources
+    selection = str(select or "")
+    if bundled:
+        selection += f";bundle={bundle_bytes or ''},{bundle_lines or ''}"
+    if collisions != "overwrite":
+        selection += f";collisions={collisions}"
+    if depth > 1:
+        selection += f";depth={depth}"
+    block_store = None
+    if store is not None:
+        from code_split.store import STORE_NAME, BlockStore
+
+        block_store = BlockStore(Path.cwd().joinpath(store or output.joinpath(STORE_NAME)))
+        selection += ";store"
+    symbol_index = _open_index(index, output)
+    with symbol_index or nullcontext():
+        try:
+            if (
+                src_code != STDIN
+                and manifest
+                and manifest.is_unchanged(src_path, selection)
+                and (symbol_index is None or symbol_index.has_source(key))
+            ):
+                _logger.info("Skip unchanged input file %s", src_path)
+                return
+            symbols: Optional[List["Symbol"]] = [] if symbol_index else None
+            hashes = manifest.blocks(key) if manifest else None
+            bundle_sink: Optional[BundleSink] = None
+            if bundled:
+                bundle_sink = BundleSink(output, fsync, hashes, bundle_bytes, bundle_lines, collisions, block_store)
+            sink = bundle_sink or DirectorySink(output, fsync, hashes, collisions, block_store)
+            with sink:
+                if src_code != STDIN and engine == "parallel":
+                    from code_split.parallel import split_parallel
+
+                    blocks = split_parallel(src_path, sink, workers, symbols, select)
+                elif src_code != STDIN and engine == "mmap":
+                    from code_split.mmap_engine import split_mmap
+
+                    blocks = split_mmap(src_path, sink, symbols, select)
+                else:
+                    with _open_source(src_code, src_path) as file:
+                        lines = record.count_lines(file) if record else file
+                        blocks = _split_lines(lines, sink, symbols, select, depth)
+            if record:
+                record.finish(sink, blocks, time.perf_counter() - start)
+                if src_code != STDIN and engine != "stream":
+                    from code_split.stats import count_file_lines
+
+                    # The mmap engines don't count all lines
+                    record.lines = count_file_lines(src_path)
+        except FileNotFoundError:
+            _logger.error("Can't find input file %s", src_code)
+            return
+        if manifest:
+            manifest.update(key, sink.written, selection)
+        if symbol_index:
+            if bundle_sink is not None:
+                # Symbols of bundled blocks point to the bundle
+                files = bundle_sink.files
+                symbols = [symbol._replace(output=files.get(symbol.output, symbol.output)) for symbol in symbols]
+            symbol_index.replace(key, output, symbols)
+
+
+def _supported_engine(engine: str, bundled: bool, collisions: str, depth: int) -> str:
+    """Engine supporting the options, a warning is logged if it isn't the given engine"""
+    if (bundled or collisions != "overwrite") and engine == "parallel":
+        # The workers of the parallel engine write their blocks independently
+        _logger.warning("The parallel engine can't write bundles or handle collisions, using the mmap engine")
+        engine = "mmap"
+    if depth > 1 and engine != "stream":
+        # The members are only split while streaming the lines
+        _logger.warning("The %s engine can't split the members of classes, using the stream engine", engine)
+        engine = "stream"
+    return engine
+
+
+def _open_index(index: Optional[str], output: Path) -> Optional["SymbolIndex"]:
+    """Open the symbol index if requested, ``""`` is the default index in the output folder"""
+    if index is None:
+        return None
+    from code_split.index import INDEX_NAME, SymbolIndex
+
+    return SymbolIndex(Path.cwd().joinpath(index or output.joinpath(INDEX_NAME)))
+
+
+@contextmanager
+def _open_source(src_code: str, src_path: Path) -> Iterator[IO[bytes]]:
+    """Open the source code file or stdin for reading as bytes, the encoding is detected by the split"""
+    if src_code == STDIN:
+        # A replaced stdin may be a text stream without buffer
+        yield getattr(sys.stdin, "buffer", sys.stdin)
+    else:
+        with src_path.open("rb") as file:
+            yield file
+
+
+def _split_lines(
+    lines: Iterable[bytes],
+    sink: DirectorySink,
+    symbols: Optional[List["Symbol"]] = None,
+    select: Optional["Select"] = None,
+    depth: int = 1,
+) -> int:
+    """Split the source code lines and write a file per block.
+
+    Parameters
+    ----------
+    lines : Iterable[bytes]
+        Source code lines, e.g. a file opened as binary, text lines are split as text
+    sink : DirectorySink
+        Output folder for the new files
+    symbols : Optional[List[Symbol]]
+        List to collect the symbols of the blocks for the index
+    select : Optional[Select]
+        Filter of the blocks, see :func:`code_split.blocks.iter_blocks`
+    depth : int
+        Levels of classes whose members are split, see :func:`code_split.blocks.iter_blocks`
+
+    Returns
+    -------
+    int
+        Number of blocks
+    """
+    if symbols is not None:
+        from code_split.index import Symbol
+    blocks = 0
+    for block in iter_blocks(lines, select, depth):
+        data = block.data
+        sink.write(block.file_name, block.file_data)
+        blocks += 1
+        if symbols is not None:
+            # The collision policy may write the block under another name
+            symbols.append(Symbol.from_block(block, data)._replace(output=sink.last_name))
+    return blocks
 
 
 # ---- CLI ----
@@ -104,7 +329,7 @@ def split_code(src_code: str, folder: str) -> None:
 # executable/script.
 
 
-def parse_args(args: List[str]) -> argparse.Namespace:
+def parse_args(args: List[str]) -> "argparse.Namespace":
     """Parse command line parameters
 
     Parameters
@@ -118,14 +343,152 @@ def parse_args(args: List[str]) -> argparse.Namespace:
     argparse.Namespace
         command line parameters namespace
     """
-    parser = argparse.ArgumentParser(description="Python code split tool")
+    import argparse
+
+    class _VersionAction(argparse.Action):
+        """Like ``action="version"``, but the version is only looked up if it's printed"""
+
+        def __call__(self, parser, namespace, values, option_string=None):
+            from code_split import __version__
+
+            print(f"code_split {__version__}")
+            parser.exit()
+
+    parser = argparse.ArgumentParser(
+        description="Python code split tool",
+        epilog=f"Commands: '{QUERY}' looks up the symbol index, '{SERVE}' runs a split server for code_split_client, "
+        f"'{GIT}' splits git revisions without checkout, see 'code_split <command> -h'",
+    )
     parser.add_argument(
         "--version",
-        action="version",
-        version="code_split {ver}".format(ver=__version__),
+        action=_VersionAction,
+        nargs=0,
+        help="show program's version number and exit",
+    )
+    parser.add_argument(
+        "-i",
+        "--input",
+        required=True,
+        type=str,
+        nargs="+",
+        help="Python code file to be split ('-' for stdin), "
+        "multiple files, directories or glob patterns are split in batch mode",
     )
-    parser.add_argument("-i", "--input", required=True, type=str, help="Python code file to be split")
     parser.add_argument("-f", "--folder", type=str, help="Destination folder for the split code")
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        help="Number of parallel processes in batch mode or of the parallel engine (default: number of CPU cores)",
+    )
+    parser.add_argument(
+        "-e",
+        "--engine",
+        choices=ENGINES,
+        default="stream",
+        help="Split engine, 'mmap' splits a memory mapped file without copying the lines, "
+        "'parallel' splits chunks of a single huge file in parallel processes (default: stream)",
+    )
+    _add_filter_arguments(parser)
+    _add_depth_argument(parser)
+    _add_output_arguments(parser)
+    parser.add_argument(
+        "--ndjson",
+        nargs="?",
+        const="text",
+        choices=NDJSON_CONTENT,
+        help="Stream one JSON record per block to stdout instead of writing files, with the text (default) "
+        "or the SHA-256 hash of the block",
+    )
+    parser.add_argument(
+        "--plan",
+        nargs="?",
+        const="text",
+        choices=PLAN_FORMATS,
+        help="Only scan the inputs and print the output files with their size, if they would be overwritten "
+        "and if several blocks would write the same file, as table (default) or JSON",
+    )
+    parser.add_argument(
+        "--bundle-bytes",
+        type=int,
+        metavar="BYTES",
+        help="Write consecutive small classes and functions into bundle files up to this size, "
+        "with a table of contents toc.json",
+    )
+    parser.add_argument(
+        "--bundle-lines",
+        type=int,
+        metavar="LINES",
+        help="Maximum number of lines of a bundle file, like --bundle-bytes",
+    )
+    parser.add_argument(
+        "--collisions",
+        choices=COLLISIONS,
+        default="overwrite",
+        help="Handling of classes and functions with the same name: keep the last one, write the later ones "
+        "as <name>_2.py..., merge them into one file or fail (default: overwrite)",
+    )
+    parser.add_argument(
+        "--store",
+        nargs="?",
+        const="",
+        metavar="PATH",
+        help="Store each distinct class and function once in this content-addressed folder and link the output "
+        f"files to it, shared by all sources of a batch, by default {STORE_NAME} in the destination folder",
+    )
+    parser.add_argument(
+        "--fsync",
+        choices=FSYNC_POLICIES,
+        default="none",
+        help="Sync the output files to disk: not at all, each file or all files at the end of the run (default: none)",
+    )
+    parser.add_argument(
+        "--index",
+        nargs="?",
+        const="",
+        metavar="PATH",
+        help=f"Update the symbol index for '{QUERY}', by default {INDEX_NAME} in the destination folder",
+    )
+    parser.add_argument(
+        "-w",
+        "--watch",
+        action="store_true",
+        help="Keep running and split the input files again when their content changes",
+    )
+    parser.add_argument(
+        "--debounce",
+        type=float,
+        default=0.2,
+        metavar="SECONDS",
+        help="Time without further changes before the files are split in watch mode (default: 0.2)",
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Skip unchanged input and output files based on a manifest in the destination folder",
+    )
+    parser.add_argument(
+        "--stats",
+        choices=STATS_FORMATS,
+        help="Report lines, blocks, files, bytes and the time spent reading, classifying and writing per input",
+    )
+    parser.add_argument(
+        "--stats-file",
+        type=str,
+        metavar="PATH",
+        help="Write the statistics to this file instead of stderr",
+    )
+    parser.add_argument(
+        "--profile",
+        type=str,
+        metavar="PATH",
+        help="Save cProfile statistics of the run to this file, e.g. for 'python -m pstats'",
+    )
+    parser.add_argument(
+        "--trace-memory",
+        action="store_true",
+        help="Trace the memory allocations with tracemalloc and report the peak and the top allocations to stderr",
+    )
     parser.add_argument(
         "-v",
         "--verbose",
@@ -145,32 +508,450 @@ def parse_args(args: List[str]) -> argparse.Namespace:
     return parser.parse_args(args)
 
 
-def setup_logging(loglevel: int) -> None:
+def _add_filter_arguments(parser: "argparse.ArgumentParser") -> None:
+    """Add the arguments of the block filter, see :func:`_block_filter`"""
+    parser.add_argument(
+        "--include",
+        action="append",
+        default=[],
+        metavar="PATTERN",
+        help="Only split classes and functions with a name matching the glob pattern or the regular expression "
+        "prefixed with 're:', may be repeated",
+    )
+    parser.add_argument(
+        "--exclude",
+        action="append",
+        default=[],
+        metavar="PATTERN",
+        help="Skip classes and functions with a name matching the pattern, like --include",
+    )
+    parser.add_argument(
+        "--kind",
+        action="append",
+        default=[],
+        choices=KINDS,
+        help="Only split blocks of this kind, 'decorated' for all blocks with decorators, may be repeated",
+    )
+
+
+def _add_depth_argument(parser: "argparse.ArgumentParser") -> None:
+    """Add the argument of the nesting level of the split"""
+    parser.add_argument(
+        "--depth",
+        type=_depth,
+        default=1,
+        metavar="N",
+        help="Also split the methods and nested classes of classes into <Class>/<method>.py, "
+        "down to this level of nesting, 2 for the members of top level classes (default: 1)",
+    )
+
+
+def _depth(value: str) -> int:
+    """Nesting level of the split, at least 1"""
+    import argparse
+
+    try:
+        depth = int(value)
+    except ValueError:
+        depth = 0
+    if depth < 1:
+        raise argparse.ArgumentTypeError(f"invalid depth {value!r}, must be an integer of at least 1")
+    return depth
+
+
+def _add_output_arguments(parser: "argparse.ArgumentParser") -> None:
+    """Add the arguments of the outputs instead of the destination folder"""
+    parser.add_argument(
+        "-a",
+        "--archive",
+        type=str,
+        help="Write all files into a single zip or tar archive instead of the destination folder, '-' for stdout",
+    )
+    parser.add_argument(
+        "--archive-format",
+        choices=ARCHIVE_FORMATS,
+        help="Format of the archive (default: guessed from the archive name, tar for stdout)",
+    )
+
+
+def _block_filter(settings: "argparse.Namespace") -> Optional["BlockFilter"]:
+    """Block filter of the parsed arguments or None if all blocks are selected
+
+    Raises
+    ------
+    ValueError
+        If a regular expression is invalid
+    """
+    if not (settings.include or settings.exclude or settings.kind):
+        return None
+    from code_split.filters import BlockFilter
+
+    return BlockFilter(settings.include, settings.exclude, settings.kind)
+
+
+def parse_query_args(args: List[str]) -> "argparse.Namespace":
+    """Parse the command line parameters of the query command
+
+    Parameters
+    ----------
+    args : List[str]
+        command line parameters after ``query`` as list of strings
+
+    Returns
+    -------
+    argparse.Namespace
+        command line parameters namespace
+    """
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        prog=f"code_split {QUERY}", description="Find classes and functions in the symbol index"
+    )
+    parser.add_argument("names", nargs="+", metavar="NAME", help="Name of the class or function, * and ? match any")
+    parser.add_argument("-f", "--folder", type=str, help="Destination folder of the split code with the index")
+    parser.add_argument("--index", type=str, metavar="PATH", help=f"Path of the index (default: {INDEX_NAME})")
+    parser.add_argument("-k", "--kind", choices=("class", "def", "async def"), help="Only classes or functions")
+    parser.add_argument("-s", "--source", type=str, help="Only sources matching this glob pattern")
+    parser.add_argument("--json", action="store_true", help="Print the symbols as JSON")
+    parser.add_argument(
+        "-v",
+        "--verbose",
+        dest="loglevel",
+        help="set loglevel to INFO",
+        action="store_const",
+        const=logging.INFO,
+    )
+    return parser.parse_args(args)
+
+
+def query(args: List[str]) -> int:
+    """Print the symbols of the index matching the names, see :meth:`code_split.index.SymbolIndex.query`
+
+    Returns
+    -------
+    int
+        Exit status, 1 if no symbol was found
+    """
+    settings = parse_query_args(args)
+    # stdout is used for the results
+    setup_logging(settings.loglevel, sys.stderr)
+    from code_split.index import SymbolIndex
+
+    path = Path(settings.index or Path(settings.folder or ".").joinpath(INDEX_NAME))
+    try:
+        with SymbolIndex(path, readonly=True) as index:
+            symbols = [
+                symbol for name in settings.names for symbol in index.query(name, settings.kind, settings.source)
+            ]
+    except FileNotFoundError:
+        _logger.error("Can't find index %s, split the code with --index first", path)
+        return 1
+    if settings.json:
+        import json
+
+        print(json.dumps([symbol._asdict() for symbol in symbols], indent=1))
+    else:
+        for symbol in symbols:
+            span = f"{symbol.source}:{symbol.start_line}-{symbol.end_line}"
+            print(f"{symbol.name}\t{symbol.kind}\t{span}\t{symbol.output}")
+    return 0 if symbols else 1
+
+
+def serve(args: List[str]) -> int:
+    """Run the split server until it's terminated, see :mod:`code_split.server`
+
+    Returns
+    -------
+    int
+        Exit status, 1 if the server is already running
+    """
+    import argparse
+
+    from code_split.client import default_socket
+
+    parser = argparse.ArgumentParser(
+        prog=f"code_split {SERVE}", description="Run a split server, jobs are sent by code_split_client"
+    )
+    parser.add_argument(
+        "--socket", type=str, default=default_socket(), help="Path of the Unix socket (default: %(default)s)"
+    )
+    parser.add_argument(
+        "-v",
+        "--verbose",
+        dest="loglevel",
+        help="set loglevel to INFO",
+        action="store_const",
+        const=logging.INFO,
+    )
+    settings = parser.parse_args(args)
+    setup_logging(settings.loglevel, sys.stderr)
+    from code_split.server import SplitServer
+
+    try:
+        server = SplitServer(settings.socket)
+    except FileExistsError:
+        _logger.error("Server is already running on %s", settings.socket)
+        return 1
+    # Leave serve_forever() on SIGTERM, the socket is removed when the server is closed
+    import signal
+
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    with server:
+        _logger.info("Listening on %s", settings.socket)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+    return 0
+
+
+def split_git(args: List[str]) -> int:
+    """Split the sources of git revisions without checking them out, see :mod:`code_split.git_source`
+
+    Returns
+    -------
+    int
+        Exit status, 1 if a revision is unknown or any source failed
+    """
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        prog=f"code_split {GIT}",
+        description="Split the Python sources of git revisions, read from the repository objects without checkout",
+    )
+    parser.add_argument(
+        "revisions", nargs="+", metavar="REVISION", help="Revision like HEAD or v1.0, or range like v1.0..v2.0"
+    )
+    parser.add_argument("-C", "--repo", type=str, default=".", help="Path of the repository (default: %(default)s)")
+    parser.add_argument(
+        "-f", "--folder", type=str, help="Destination folder, each commit gets a folder named like its short id"
+    )
+    parser.add_argument(
+        "-p",
+        "--path",
+        dest="paths",
+        action="append",
+        default=[],
+        help="Only split sources in this folder or this source of the repository, may be repeated",
+    )
+    _add_filter_arguments(parser)
+    _add_depth_argument(parser)
+    _add_output_arguments(parser)
+    parser.add_argument(
+        "-v",
+        "--verbose",
+        dest="loglevel",
+        help="set loglevel to INFO",
+        action="store_const",
+        const=logging.INFO,
+    )
+    settings = parser.parse_args(args)
+    setup_logging(settings.loglevel, sys.stderr if settings.archive == STDIN else None)
+    from code_split.git_source import split_revisions
+
+    try:
+        report = split_revisions(
+            settings.repo,
+            settings.revisions,
+            settings.folder,
+            settings.archive,
+            settings.archive_format,
+            settings.paths,
+            _block_filter(settings),
+            settings.depth,
+        )
+    except ValueError as err:
+        _logger.error("%s", err)
+        return 1
+    failed = sum(1 for error in report.values() if error)
+    _logger.info("Split %d sources, %d failed", len(report), failed)
+    return 1 if failed else 0
+
+
+def setup_logging(loglevel: int, stream: Optional[TextIO] = None) -> None:
     """Setup basic logging
 
     Parameters
     ----------
     loglevel : int
         minimum loglevel for emitting messages
+    stream : Optional[TextIO]
+        stream for the log messages, defaults to stdout
     """
     log_format = "[%(asctime)s] %(levelname)s:%(name)s:%(message)s"
-    logging.basicConfig(level=loglevel, stream=sys.stdout, format=log_format, datefmt="%Y-%m-%d %H:%M:%S")
+    logging.basicConfig(level=loglevel, stream=stream or sys.stdout, format=log_format, datefmt="%Y-%m-%d %H:%M:%S")
+
+
+def is_batch(inputs: List[str]) -> bool:
+    """Check if the inputs need the batch mode, i.e. more than one file, a directory or a glob pattern"""
+    from code_split.batch import is_glob
+
+    return len(inputs) > 1 or is_glob(inputs[0]) or Path(inputs[0]).is_dir()
 
 
-def main(args: List[str]) -> None:
+def execute(settings: "argparse.Namespace") -> int:
+    """Split the code as given by the parsed command line parameters, see :func:`parse_args`
+
+    Returns
+    -------
+    int
+        Exit status, 1 if any file of a batch failed
+    """
+    status = 0
+    if settings.ndjson and (settings.archive or settings.watch):
+        _logger.error("NDJSON records can't be combined with an archive or the watch mode")
+        return 1
+    if (settings.archive or settings.ndjson) and (settings.store is not None or settings.collisions != "overwrite"):
+        _logger.error("The store and the collision policy only apply to the destination folder")
+        return 1
+    try:
+        select = _block_filter(settings)
+    except ValueError as err:
+        _logger.error("%s", err)
+        return 1
+    if settings.plan:
+        from code_split.plan import plan_split, write_plan
+
+        # Sources of the batch mode which can't be split are reported, a single source raises
+        report: Dict[str, Optional[str]] = {}
+        try:
+            plan = plan_split(settings.input, settings.folder, select, settings.collisions, settings.depth, report)
+        except FileNotFoundError:
+            _logger.error("Can't find input file %s", settings.input[0])
+            return 1
+        except ValueError as err:
+            _logger.error("Can't split %s: %s", settings.input[0], err)
+            return 1
+        write_plan(plan, settings.plan, sys.stdout)
+        return 1 if any(report.values()) else 0
+    stats = None
+    if settings.stats or settings.stats_file:
+        from code_split.stats import RunStats
+
+        if settings.watch or settings.archive:
+            _logger.warning("Statistics aren't collected in watch mode and for archives")
+        stats = RunStats()
+    if settings.watch:
+        from code_split.watch import watch
+
+        if STDIN in settings.input or settings.archive:
+            _logger.error("Watch mode needs input files and a destination folder")
+            return 1
+        _logger.info(f"Watch code files {settings.input}, split into folder '{settings.folder}'")
+        watch(
+            settings.input,
+            settings.folder,
+            settings.debounce,
+            fsync=settings.fsync,
+            index=settings.index,
+            select=select,
+            collisions=settings.collisions,
+            store=settings.store,
+            depth=settings.depth,
+        )
+    elif is_batch(settings.input):
+        # Imported here to avoid a circular import
+        from code_split.batch import split_tree
+
+        _logger.info(f"Split code files {settings.input} into folder '{settings.folder}'")
+        results = split_tree(
+            settings.input,
+            settings.folder,
+            settings.jobs,
+            incremental=settings.incremental,
+            engine=settings.engine,
+            archive=settings.archive,
+            archive_format=settings.archive_format,
+            ndjson=settings.ndjson,
+            fsync=settings.fsync,
+            bundle_bytes=settings.bundle_bytes,
+            bundle_lines=settings.bundle_lines,
+            collisions=settings.collisions,
+            store=settings.store,
+            depth=settings.depth,
+            index=settings.index,
+            select=select,
+            stats=stats,
+        )
+        failed = sum(1 for error in results.values() if error)
+        _logger.info("Split %d files, %d failed", len(results), failed)
+        status = 1 if failed else 0
+    else:
+        _logger.info(f"Split code file '{settings.input[0]}' into folder '{settings.folder}'")
+        try:
+            split_code(
+                settings.input[0],
+                settings.folder,
+                settings.incremental,
+                settings.engine,
+                settings.archive,
+                settings.archive_format,
+                settings.fsync,
+                settings.index,
+                settings.jobs,
+                select,
+                stats,
+                settings.ndjson,
+                settings.bundle_bytes,
+                settings.bundle_lines,
+                settings.collisions,
+                settings.store,
+                settings.depth,
+            )
+        except ValueError as err:
+            # Unknown or unsupported encoding of the source or a name collision
+            _logger.error("Can't split %s: %s", settings.input[0], err)
+            status = 1
+    if stats is not None:
+        stats_format = settings.stats or "json"
+        if settings.stats_file:
+            with open(settings.stats_file, "w", encoding="utf-8") as file:
+                stats.write(stats_format, file)
+        else:
+            stats.write(stats_format, sys.stderr)
+    return status
+
+
+def main(args: List[str]) -> int:
     """Wrapper allowing :func:`split_code` to be called with string arguments in a CLI fashion
 
     Parameters
     ----------
     args : List[str])
         command line parameters as list of strings
-        (for example  ``["-i", "my_source_code.py", "-f", "/path/to/output]``).
+        (for example  ``["-i", "my_source_code.py", "-f", "/path/to/output]``),
+        ``["query", ...]`` runs :func:`query`, ``["serve", ...]`` :func:`serve` and ``["git", ...]`` :func:`split_git`
+
+    Returns
+    -------
+    int
+        Exit status, 1 if any file of a batch failed
     """
+    if args[:1] == [QUERY]:
+        return query(args[1:])
+    if args[:1] == [SERVE]:
+        return serve(args[1:])
+    if args[:1] == [GIT]:
+        return split_git(args[1:])
     settings = parse_args(args=args)
-    setup_logging(settings.loglevel)
-    _logger.info(f"Split code file '{settings.input}' into folder '{settings.folder}'")
-    split_code(settings.input, settings.folder)
+    # Keep stdout clean if it's used for the output
+    setup_logging(
+        settings.loglevel, sys.stderr if settings.archive == STDIN or settings.ndjson or settings.plan else None
+    )
+    try:
+        if settings.profile or settings.trace_memory:
+            from code_split.stats import Profiler
+
+            with Profiler(settings.profile, settings.trace_memory):
+                status = execute(settings)
+        else:
+            status = execute(settings)
+    except BrokenPipeError:
+        # The consumer of stdout stopped reading, e.g. "| head", avoid another error when Python flushes stdout
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        return 1
     _logger.info("Script ends here")
+    return status
 
 
 def run() -> None:
@@ -178,7 +959,7 @@ def run() -> None:
 
     This function is used as entry point for the console script by setuptools.
     """
-    main(sys.argv[1:])
+    sys.exit(main(sys.argv[1:]))
 
 
 if __name__ == "__main__":
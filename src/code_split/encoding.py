@@ -0,0 +1,143 @@
+"""
+Detect the encoding of a Python source from its UTF-8 BOM or PEP 263 coding cookie
+
+The sources are split as raw bytes, so the encoding is only needed to decode the names
+of the classes and functions. The output files get the bytes of the source unchanged,
+with the coding cookie of the source in front if it isn't UTF-8, see :func:`coding_line`.
+"""
+
+import codecs
+import logging
+import re
+from typing import List, Sequence, Tuple, Union
+
+__author__ = "Matthias Homann"
+__copyright__ = "Matthias Homann"
+__license__ = "GPL-3.0-or-later"
+
+_logger = logging.getLogger(__name__)
+
+DEFAULT_ENCODING = "utf-8"
+# The regular expression of PEP 263
+_COOKIE = re.compile(rb"^[ \t\f]*#.*?coding[:=][ \t]*([-\w.]+)")
+_BLANK_OR_COMMENT = re.compile(rb"^[ \t\f]*(?:[#\r\n]|$)")
+# Characters the scanners look for, they must be encoded as ASCII
+_SYNTAX = "\t\n\r\f #@:()_azAZ09"
+# Start of a block searched for a coding cookie, enough for its first two lines
+_HEAD_BYTES = 1024
+
+
+def normalize(encoding: str) -> str:
+    """Canonical name of the encoding, e.g. ``"iso8859-1"`` for ``"latin-1"``
+
+    Like the interpreter, all names starting with ``utf-8-``, e.g. ``utf-8-sig``, are UTF-8.
+
+    Raises
+    ------
+    ValueError
+        If the encoding is unknown or not compatible with ASCII, e.g. UTF-16
+    """
+    # As tokenize._get_normal_name(), which is private
+    prefix = encoding[:12].lower().replace("_", "-")
+    if prefix == DEFAULT_ENCODING or prefix.startswith(DEFAULT_ENCODING + "-"):
+        return DEFAULT_ENCODING
+    try:
+        name = codecs.lookup(encoding).name
+    except LookupError:
+        raise ValueError(f"Unknown encoding: {encoding}") from None
+    try:
+        compatible = _SYNTAX.encode(name) == _SYNTAX.encode("ascii")
+    except (UnicodeError, LookupError):
+        compatible = False
+    if not compatible:
+        raise ValueError(f"Encoding {name} isn't compatible with ASCII and can't be split as bytes")
+    return name
+
+
+def detect_encoding(data) -> Tuple[str, int]:
+    """Detect the encoding of a source as the Python interpreter does.
+
+    Parameters
+    ----------
+    data : bytes-like
+        Source or at least its first two lines, e.g. a memory mapped file, only the first two lines are read
+
+    Returns
+    -------
+    Tuple[str, int]
+        Encoding, ``"utf-8"`` if neither a BOM nor a coding cookie is found, and the length of the BOM
+
+    Raises
+    ------
+    ValueError
+        If the encoding is unknown, not compatible with ASCII or differs from a UTF-8 BOM
+    """
+    bom = len(codecs.BOM_UTF8) if data[: len(codecs.BOM_UTF8)] == codecs.BOM_UTF8 else 0
+    end = data.find(b"\n", bom)
+    if end >= 0:
+        end = data.find(b"\n", end + 1)
+    lines = bytes(data[bom : len(data) if end < 0 else end + 1]).splitlines(keepends=True)
+    encoding = None
+    for line in lines:
+        match = _COOKIE.match(line)
+        if match:
+            encoding = normalize(match.group(1).decode("ascii"))
+            break
+        if not _BLANK_OR_COMMENT.match(line):
+            # The cookie must be in the first line or in the second line after a comment or blank line
+            break
+    if encoding is None:
+        return DEFAULT_ENCODING, bom
+    if bom and encoding != DEFAULT_ENCODING:
+        raise ValueError(f"Encoding {encoding} doesn't match the UTF-8 BOM")
+    _logger.debug("Source encoding %s", encoding)
+    return encoding, bom
+
+
+def coding_line(head, encoding: str) -> bytes:
+    """Coding cookie to be put in front of a block of a source which isn't UTF-8
+
+    The split files keep the bytes of the source, so each file needs the cookie of the source
+    to be decoded, unless the block already starts with it, e.g. the first block of the source.
+
+    Parameters
+    ----------
+    head : bytes-like
+        Start of the block, at least its first two lines
+    encoding : str
+        Encoding of the source, see :func:`detect_encoding`
+
+    Returns
+    -------
+    bytes
+        The cookie as comment line, empty for UTF-8 or if the block has the cookie
+    """
+    if encoding == DEFAULT_ENCODING:
+        return b""
+    try:
+        if detect_encoding(head)[0] == encoding:
+            return b""
+    except ValueError:
+        # A comment like a cookie of an unknown encoding, the added cookie comes first
+        pass
+    return f"# -*- coding: {encoding} -*-\n".encode("ascii")
+
+
+def with_coding_line(
+    data: Union[bytes, Sequence[Union[bytes, memoryview]]], encoding: str
+) -> Union[bytes, List[Union[bytes, memoryview]]]:
+    """Content of the output file of a block, with the coding cookie if needed, see :func:`coding_line`
+
+    Bytes are returned as bytes, a sequence of bytes-like pieces as list.
+    """
+    if encoding == DEFAULT_ENCODING:
+        return data
+    if isinstance(data, bytes):
+        return coding_line(data[:_HEAD_BYTES], encoding) + data
+    head = b""
+    for piece in data:
+        head += bytes(piece[: _HEAD_BYTES - len(head)])
+        if len(head) >= _HEAD_BYTES:
+            break
+    line = coding_line(head, encoding)
+    return [line, *data] if line else list(data)
@@ -0,0 +1,87 @@
+"""
+Select the blocks to be split by name and kind
+
+The filter is checked by the scanners when a header line is found, before any line of
+the block is collected. Blocks which aren't selected are scanned to find their end, but
+their lines aren't kept and no output file is opened for them.
+"""
+
+import fnmatch
+import logging
+import re
+from typing import Iterable, List, Pattern
+
+__author__ = "Matthias Homann"
+__copyright__ = "Matthias Homann"
+__license__ = "GPL-3.0-or-later"
+
+_logger = logging.getLogger(__name__)
+
+KINDS = ("class", "def", "async def", "decorated")
+REGEX_PREFIX = "re:"
+
+
+def _compile(pattern: str) -> Pattern[str]:
+    """Compile a glob pattern or a regular expression prefixed with ``re:`` to be used with ``search()``"""
+    if pattern.startswith(REGEX_PREFIX):
+        return re.compile(pattern[len(REGEX_PREFIX) :])
+    # The translated glob pattern is anchored at the end only
+    return re.compile(r"\A" + fnmatch.translate(pattern))
+
+
+class BlockFilter:
+    """Filter on the names and kinds of the blocks.
+
+    A block is selected if its name matches any include pattern (or there are none), doesn't
+    match any exclude pattern and its kind is one of the kinds (or there are none).
+    The filter is called with the name, the kind and if the block has decorators.
+
+    Parameters
+    ----------
+    include : Iterable[str]
+        Glob patterns, e.g. ``"test_*"``, or regular expressions prefixed with ``re:``,
+        e.g. ``"re:^(get|set)_"``, which are searched in the name
+    exclude : Iterable[str]
+        Patterns like for ``include`` of names to be skipped
+    kinds : Iterable[str]
+        ``"class"``, ``"def"``, ``"async def"`` or ``"decorated"`` for all blocks with decorators
+
+    Raises
+    ------
+    ValueError
+        If a kind is unknown or a regular expression is invalid
+    """
+
+    def __init__(self, include: Iterable[str] = (), exclude: Iterable[str] = (), kinds: Iterable[str] = ()) -> None:
+        self.include = tuple(include)
+        self.exclude = tuple(exclude)
+        self.kinds = frozenset(kinds)
+        unknown = self.kinds.difference(KINDS)
+        if unknown:
+            raise ValueError(f"Unknown kind {', '.join(sorted(unknown))}, use one of {', '.join(KINDS)}")
+        try:
+            self._include: List[Pattern[str]] = [_compile(pattern) for pattern in self.include]
+            self._exclude: List[Pattern[str]] = [_compile(pattern) for pattern in self.exclude]
+        except re.error as err:
+            raise ValueError(f"Invalid regular expression: {err}") from err
+
+    def __call__(self, name: str, kind: str, decorated: bool = False) -> bool:
+        """Check if the block is selected"""
+        if self.kinds and kind not in self.kinds and not (decorated and "decorated" in self.kinds):
+            return False
+        if self._include and not any(pattern.search(name) for pattern in self._include):
+            return False
+        return not any(pattern.search(name) for pattern in self._exclude)
+
+    def __bool__(self) -> bool:
+        """False if the filter selects all blocks"""
+        return bool(self.include or self.exclude or self.kinds)
+
+    def __str__(self) -> str:
+        """Description of the filter, stored in the manifest of the incremental mode"""
+        parts = [f"include={','.join(self.include)}", f"exclude={','.join(self.exclude)}"]
+        parts.append(f"kinds={','.join(sorted(self.kinds))}")
+        return ";".join(parts) if self else ""
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}({self.include!r}, {self.exclude!r}, {sorted(self.kinds)!r})"
@@ -0,0 +1,308 @@
+"""
+Split the sources of git revisions straight from the repository objects
+
+All objects are read through one long-lived ``git cat-file --batch`` process: the commits,
+the trees, which are walked in this process instead of spawning ``git ls-tree``, and the
+blobs of the matching source files. Nothing is checked out, each blob is split in memory.
+Only revision ranges like ``v1.0..v2.0`` spawn a single ``git rev-list`` to list the commits.
+
+The outputs of each commit are written below a folder named like the abbreviated commit id,
+e.g. ``<folder>/1a2b3c4d5e6f/pkg/module/`` for ``pkg/module.py``, or with the same layout into
+an archive. Blobs which were already split aren't split again: their files are hard linked
+from the folder of the earlier commit, or copied if hard links aren't supported. For archives
+the split files of the recently used blobs are kept in memory up to :data:`CACHE_BYTES`.
+"""
+
+import fnmatch
+import logging
+import os
+import shutil
+import subprocess
+from collections import OrderedDict
+from contextlib import nullcontext
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from code_split.blocks import Select, iter_blocks
+from code_split.sinks import ArchiveSink, DirectorySink
+
+__author__ = "Matthias Homann"
+__copyright__ = "Matthias Homann"
+__license__ = "GPL-3.0-or-later"
+
+_logger = logging.getLogger(__name__)
+
+# Length of the abbreviated commit id used as output folder
+ABBREV = 12
+# File modes of regular and executable files and of trees, symbolic links and submodules are skipped
+_BLOB_MODES = (b"100644", b"100755")
+_TREE_MODE = b"40000"
+CACHE_BYTES = 64 * 1024 * 1024
+"""Size of the split files per blob kept in memory for archives, the least recently used are dropped"""
+
+
+class GitObjects:
+    """Reader of the objects of a repository using one ``git cat-file --batch`` process, use as context manager.
+
+    Parameters
+    ----------
+    repo : str
+        Path of the repository or of a folder inside its working tree
+
+    Raises
+    ------
+    FileNotFoundError
+        If git isn't installed
+    """
+
+    def __init__(self, repo: str) -> None:
+        self.repo = repo
+        self._process = subprocess.Popen(
+            ["git", "-C", str(repo), "cat-file", "--batch"], stdin=subprocess.PIPE, stdout=subprocess.PIPE
+        )
+
+    def read(self, name: str) -> Tuple[str, str, bytes]:
+        """Read an object
+
+        Parameters
+        ----------
+        name : str
+            Object id or any revision expression of git, e.g. ``"HEAD~2^{tree}"``
+
+        Returns
+        -------
+        Tuple[str, str, bytes]
+            Object id, type (``"commit"``, ``"tree"``, ``"blob"`` or ``"tag"``) and content
+
+        Raises
+        ------
+        KeyError
+            If the object is missing or the name is ambiguous
+        """
+        if "\n" in name:
+            raise KeyError(name)
+        stdin, stdout = self._process.stdin, self._process.stdout
+        stdin.write(name.encode() + b"\n")
+        stdin.flush()
+        header = stdout.readline().split()
+        if len(header) != 3:
+            # "<name> missing" or "<name> ambiguous", or git ended
+            raise KeyError(name)
+        oid, kind, size = header
+        data = stdout.read(int(size))
+        # Each object is followed by a line feed
+        stdout.read(1)
+        return oid.decode(), kind.decode(), data
+
+    def commit(self, revision: str) -> Tuple[str, str]:
+        """Commit id and tree id of a revision, e.g. a branch, a tag or ``"HEAD~1"``"""
+        oid, _, data = self.read(f"{revision}^{{commit}}")
+        # The first line of a commit is "tree <oid>"
+        return oid, data[5 : data.index(b"\n")].decode()
+
+    def iter_files(self, tree: str, paths: Iterable[str] = (), pattern: str = "*.py") -> Iterator[Tuple[str, str]]:
+        """Path and blob id of all files in a tree matching the pattern, depth first in tree order
+
+        Parameters
+        ----------
+        tree : str
+            Object id of the tree
+        paths : Iterable[str]
+            Only files in these folders or these files, relative to the root of the repository
+        pattern : str
+            Glob pattern of the file names
+        """
+        prefixes = [path.strip("/") for path in paths]
+        yield from self._walk(tree, "", prefixes, pattern)
+
+    def _walk(self, tree: str, folder: str, prefixes: List[str], pattern: str) -> Iterator[Tuple[str, str]]:
+        _, _, data = self.read(tree)
+        # The binary object id length depends on the hash algorithm of the repository
+        size = len(tree) // 2
+        pos = 0
+        while pos < len(data):
+            # Entries are "<mode> <name>\0<binary object id>"
+            space = data.index(b" ", pos)
+            nul = data.index(b"\0", space)
+            mode = data[pos:space]
+            name = data[space + 1 : nul].decode("utf-8", "surrogateescape")
+            oid = data[nul + 1 : nul + 1 + size].hex()
+            pos = nul + 1 + size
+            path = folder + name
+            if mode == _TREE_MODE:
+                if _in_paths(path, prefixes, folder=True):
+                    yield from self._walk(oid, path + "/", prefixes, pattern)
+            elif mode in _BLOB_MODES and fnmatch.fnmatch(name, pattern) and _in_paths(path, prefixes):
+                yield path, oid
+
+    def close(self) -> None:
+        """End the git process"""
+        self._process.stdin.close()
+        self._process.stdout.close()
+        self._process.wait()
+
+    def __enter__(self) -> "GitObjects":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+def _in_paths(path: str, prefixes: List[str], folder: bool = False) -> bool:
+    """Check if the path is one of the prefixes or inside of one, a folder also if it contains a prefix"""
+    if not prefixes:
+        return True
+    for prefix in prefixes:
+        if path == prefix or path.startswith(prefix + "/") or (folder and prefix.startswith(path + "/")):
+            return True
+    return False
+
+
+def list_commits(repo: str, revisions: Iterable[str], objects: GitObjects) -> List[str]:
+    """Commit ids of the revisions in the given order, ranges like ``a..b`` are listed oldest first
+
+    Raises
+    ------
+    ValueError
+        If a revision is unknown
+    """
+    commits: List[str] = []
+    for revision in revisions:
+        if ".." in revision or revision.startswith("^"):
+            result = subprocess.run(
+                ["git", "-C", str(repo), "rev-list", "--reverse", revision, "--"],
+                capture_output=True,
+                text=True,
+            )
+            if result.returncode:
+                raise ValueError(f"Unknown revision range {revision}: {result.stderr.strip()}")
+            commits += result.stdout.split()
+        else:
+            try:
+                commits.append(objects.commit(revision)[0])
+            except KeyError:
+                raise ValueError(f"Unknown revision {revision}") from None
+    # The same commit may be part of several ranges
+    return list(dict.fromkeys(commits))
+
+
+def split_revisions(
+    repo: str,
+    revisions: Iterable[str],
+    folder: Optional[str] = None,
+    archive: Optional[str] = None,
+    archive_format: Optional[str] = None,
+    paths: Iterable[str] = (),
+    select: Optional[Select] = None,
+    depth: int = 1,
+) -> Dict[Tuple[str, str], Optional[str]]:
+    """Split the sources of git revisions without checking them out.
+
+    Parameters
+    ----------
+    repo : str
+        Path of the repository
+    revisions : Iterable[str]
+        Revisions like ``"HEAD"``, ``"v1.0"`` or ranges like ``"v1.0..v2.0"``
+    folder : Optional[str]
+        Output folder, each commit gets a sub-folder named like its abbreviated id,
+        defaults to the current working directory
+    archive : Optional[str]
+        Write all files into this zip or tar archive (``"-"`` for stdout) instead of the output folder
+    archive_format : Optional[str]
+        Format of the archive, guessed from the archive name by default
+    paths : Iterable[str]
+        Only split sources in these folders or these sources, relative to the root of the repository
+    select : Optional[Select]
+        Filter of the blocks, see :func:`code_split.blocks.iter_blocks`
+    depth : int
+        Levels of classes whose members are split, see :func:`code_split.blocks.iter_blocks`
+
+    Returns
+    -------
+    Dict[Tuple[str, str], Optional[str]]
+        Error message or None per commit id and source path, e.g. for a source with an unknown encoding
+
+    Raises
+    ------
+    ValueError
+        If a revision is unknown
+    """
+    output = Path.cwd().joinpath(folder) if folder else Path.cwd()
+    report: Dict[Tuple[str, str], Optional[str]] = {}
+    # Output folder and file names per blob id, most files don't change between commits
+    locations: Dict[str, Tuple[Path, List[str]]] = {}
+    cache = _BlobCache(CACHE_BYTES)
+    with GitObjects(repo) as objects, ArchiveSink(archive, archive_format) if archive else nullcontext() as sink:
+        commits = list_commits(repo, revisions, objects)
+        _logger.info("Split %d commits of %s", len(commits), repo)
+        for commit in commits:
+            _, tree = objects.commit(commit)
+            for path, blob in objects.iter_files(tree, paths):
+                prefix = f"{commit[:ABBREV]}/{path[: -len(Path(path).suffix) or None]}"
+                target = output.joinpath(prefix)
+                if sink is None and blob in locations:
+                    _link_files(*locations[blob], target)
+                    report[(commit, path)] = None
+                    continue
+                files = cache.get(blob)
+                if files is None:
+                    try:
+                        files = [
+                            (block.file_name, block.file_data)
+                            for block in iter_blocks(objects.read(blob)[2], select, depth)
+                        ]
+                    except ValueError as err:
+                        _logger.error("Failed to split %s:%s: %s", commit[:ABBREV], path, err)
+                        report[(commit, path)] = str(err)
+                        continue
+                if sink is not None:
+                    cache.add(blob, files)
+                    for name, data in files:
+                        sink.write(f"{prefix}/{name}", data)
+                else:
+                    target.mkdir(parents=True, exist_ok=True)
+                    with DirectorySink(target) as directory:
+                        for name, data in files:
+                            directory.write(name, data)
+                    locations[blob] = (target, [name for name, _ in files])
+                report[(commit, path)] = None
+    return report
+
+
+def _link_files(source: Path, names: List[str], target: Path) -> None:
+    """Hard link the files of an already split blob into the target folder, or copy them"""
+    for name in names:
+        path = target.joinpath(name)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f".{path.name}.{os.urandom(6).hex()}.tmp")
+        try:
+            os.link(source.joinpath(name), tmp_path)
+        except OSError:
+            # Another file system or no hard links supported
+            shutil.copyfile(source.joinpath(name), tmp_path)
+        os.replace(tmp_path, path)
+
+
+class _BlobCache:
+    """Split files per blob id, the least recently used blobs are dropped above the size in bytes"""
+
+    def __init__(self, max_bytes: int) -> None:
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._files: "OrderedDict[str, List[Tuple[str, bytes]]]" = OrderedDict()
+
+    def get(self, blob: str) -> Optional[List[Tuple[str, bytes]]]:
+        files = self._files.get(blob)
+        if files is not None:
+            self._files.move_to_end(blob)
+        return files
+
+    def add(self, blob: str, files: List[Tuple[str, bytes]]) -> None:
+        if blob in self._files:
+            return
+        self._files[blob] = files
+        self.size += sum(len(data) for _, data in files)
+        while self.size > self.max_bytes:
+            _, dropped = self._files.popitem(last=False)
+            self.size -= sum(len(data) for _, data in dropped)
@@ -0,0 +1,234 @@
+"""
+Persistent symbol index of the split sources
+
+The index is a SQLite database with one row per class or function, holding the source path,
+the line and byte span, kind, decorators and the content hash of the output file. It is
+updated per source by :func:`code_split.code_split.split_code` and answers lookups like
+"which output file holds ``MyData``?" without reading the sources again.
+"""
+
+import hashlib
+import logging
+import sqlite3
+from pathlib import Path
+from typing import Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+from code_split.blocks import Block, leading_lines
+
+__author__ = "Matthias Homann"
+__copyright__ = "Matthias Homann"
+__license__ = "GPL-3.0-or-later"
+
+_logger = logging.getLogger(__name__)
+
+INDEX_NAME = ".code_split.db"
+INDEX_VERSION = 1
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS symbols (
+    name TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    source TEXT NOT NULL,
+    output TEXT NOT NULL,
+    start_line INTEGER NOT NULL,
+    end_line INTEGER NOT NULL,
+    start_offset INTEGER NOT NULL,
+    end_offset INTEGER NOT NULL,
+    decorators TEXT NOT NULL,
+    sha256 TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS symbols_name ON symbols (name);
+CREATE INDEX IF NOT EXISTS symbols_source ON symbols (source);
+"""
+_COLUMNS = "name, kind, source, output, start_line, end_line, start_offset, end_offset, decorators, sha256"
+_GLOB_CHARS = frozenset("*?[")
+
+
+class Symbol(NamedTuple):
+    """Entry of the index per class or function.
+
+    Lines and offsets are the same as of :class:`code_split.blocks.Block`, ``output`` is the path
+    of the output file and ``sha256`` the hash of its content.
+    """
+
+    name: str
+    kind: str
+    source: str
+    output: str
+    start_line: int
+    end_line: int
+    start_offset: int
+    end_offset: int
+    decorators: Tuple[str, ...]
+    sha256: str
+
+    @classmethod
+    def from_block(cls, block: Block, data: Optional[bytes] = None) -> "Symbol":
+        """Symbol of a block, source and output folder are filled in by :meth:`SymbolIndex.replace`
+
+        Parameters
+        ----------
+        block : Block
+            Block as returned by :func:`code_split.blocks.iter_blocks`
+        data : Optional[bytes]
+            Encoded text of the block, :attr:`code_split.blocks.Block.data` by default
+        """
+        if data is None:
+            data = block.data
+        return cls(
+            block.name,
+            block.kind,
+            "",
+            block.file_name,
+            block.start_line,
+            block.end_line,
+            block.start_offset,
+            block.end_offset,
+            block.decorators,
+            hashlib.sha256(data).hexdigest(),
+        )
+
+    @classmethod
+    def from_span(cls, span, pieces: Sequence, encoding: str = "utf-8") -> "Symbol":
+        """Symbol of a :class:`code_split.mmap_engine.Span` and the byte pieces of its ranges in the source encoding"""
+        digest = hashlib.sha256()
+        for piece in pieces:
+            digest.update(piece)
+        decorators: Tuple[str, ...] = ()
+        if span.decorator_lines:
+            # The block starts with the comment lines followed by the decorator lines
+            stop = span.comment_lines + span.decorator_lines
+            lines = leading_lines(b"".join(pieces), span.comment_lines, stop, encoding)
+            decorators = tuple(line.rstrip() for line in lines)
+        return cls(
+            span.name,
+            span.kind,
+            "",
+            span.file_name,
+            span.start_line,
+            span.end_line,
+            min(start for start, _ in span.ranges()),
+            span.end,
+            decorators,
+            digest.hexdigest(),
+        )
+
+
+class SymbolIndex:
+    """SQLite index of the symbols of all split sources.
+
+    Several processes can update the same index, e.g. the workers of the batch mode,
+    SQLite serialises the writes.
+
+    Parameters
+    ----------
+    path : Path
+        Path of the index database
+    readonly : bool
+        Open an existing index only for queries
+
+    Raises
+    ------
+    FileNotFoundError
+        If a readonly index doesn't exist
+    """
+
+    def __init__(self, path: Path, readonly: bool = False) -> None:
+        self.path = path
+        if readonly:
+            if not path.is_file():
+                raise FileNotFoundError(path)
+            self._db = sqlite3.connect(f"{path.resolve().as_uri()}?mode=ro", uri=True)
+        else:
+            self._db = sqlite3.connect(str(path), timeout=60)
+            # WAL lets the queries run while a split updates the index
+            self._db.execute("PRAGMA journal_mode=WAL")
+            if self._version() != INDEX_VERSION:
+                with self._db:
+                    # Other processes may create the index at the same time, check again holding the write lock
+                    self._db.execute("BEGIN IMMEDIATE")
+                    if self._version() != INDEX_VERSION:
+                        self._db.execute("DROP TABLE IF EXISTS symbols")
+                        # Not executescript(), which commits first and releases the lock
+                        for statement in _SCHEMA.split(";"):
+                            if statement.strip():
+                                self._db.execute(statement)
+                        self._db.execute(f"PRAGMA user_version = {INDEX_VERSION}")
+
+    def _version(self) -> int:
+        return self._db.execute("PRAGMA user_version").fetchone()[0]
+
+    def has_source(self, source: str) -> bool:
+        """Check if the source is part of the index"""
+        return self._db.execute("SELECT 1 FROM symbols WHERE source = ? LIMIT 1", (source,)).fetchone() is not None
+
+    def replace(self, source: str, folder: Path, symbols: Iterable[Symbol]) -> int:
+        """Replace all symbols of the source in one transaction
+
+        Parameters
+        ----------
+        source : str
+            Path of the source
+        folder : Path
+            Output folder, the output of each symbol is the file name in this folder
+        symbols : Iterable[Symbol]
+            New symbols of the source, e.g. from :meth:`Symbol.from_block`
+
+        Returns
+        -------
+        int
+            Number of stored symbols
+        """
+        rows = [
+            symbol._replace(
+                source=source, output=str(folder.joinpath(symbol.output)), decorators="\n".join(symbol.decorators)
+            )
+            for symbol in symbols
+        ]
+        with self._db:
+            self._db.execute("DELETE FROM symbols WHERE source = ?", (source,))
+            self._db.executemany(f"INSERT INTO symbols ({_COLUMNS}) VALUES ({', '.join('?' * 10)})", rows)
+        _logger.debug("Indexed %d symbols of %s", len(rows), source)
+        return len(rows)
+
+    def query(self, pattern: str, kind: Optional[str] = None, source: Optional[str] = None) -> List[Symbol]:
+        """Find symbols by name
+
+        Parameters
+        ----------
+        pattern : str
+            Name of the symbol, ``*``, ``?`` and ``[...]`` match like in glob patterns
+        kind : Optional[str]
+            Only symbols of this kind, e.g. ``"class"``
+        source : Optional[str]
+            Only symbols of sources matching this glob pattern
+
+        Returns
+        -------
+        List[Symbol]
+            Matching symbols sorted by name, source and line
+        """
+        # An exact name uses the index, GLOB only uses it for a constant prefix
+        conditions = ["name GLOB ?" if _GLOB_CHARS.intersection(pattern) else "name = ?"]
+        params = [pattern]
+        if kind:
+            conditions.append("kind = ?")
+            params.append(kind)
+        if source:
+            conditions.append("source GLOB ?")
+            params.append(source)
+        cursor = self._db.execute(
+            f"SELECT {_COLUMNS} FROM symbols WHERE {' AND '.join(conditions)} ORDER BY name, source, start_line",
+            params,
+        )
+        return [Symbol(*row[:8], tuple(row[8].splitlines()), row[9]) for row in cursor]
+
+    def close(self) -> None:
+        """Close the database"""
+        self._db.close()
+
+    def __enter__(self) -> "SymbolIndex":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
@@ -0,0 +1,196 @@
+"""
+Manifest of the split sources for the incremental mode
+"""
+
+import hashlib
+import json
+import logging
+import os
+from pathlib import Path
+from typing import ClassVar, Dict, List, Optional, Tuple
+
+from code_split.sinks import folder_lock
+
+__author__ = "Matthias Homann"
+__copyright__ = "Matthias Homann"
+__license__ = "GPL-3.0-or-later"
+
+_logger = logging.getLogger(__name__)
+
+MANIFEST_NAME = ".code_split.json"
+MANIFEST_VERSION = 1
+
+
+def file_digest(path: Path) -> str:
+    """SHA-256 hex digest of the file content, read in chunks"""
+    digest = hashlib.sha256()
+    with path.open("rb") as file:
+        for chunk in iter(lambda: file.read(2**20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class Manifest:
+    """Manifest stored in the output folder with one entry per source.
+
+    Each entry holds the size, mtime and hash of the source and the hash per
+    written output file, e.g.::
+
+        {"version": 1, "sources": {"/path/src.py": {"size": 123, "mtime_ns": 1656230400000000000,
+        "sha256": "...", "blocks": {"MyData.py": "...", "my_function.py": "..."}}}}
+
+    Sources split with a block filter keep its description as ``select``, see
+    :class:`code_split.filters.BlockFilter`.
+    Use :meth:`open` to reuse the manifest of a folder in a long running process.
+
+    Parameters
+    ----------
+    folder : Path
+        Output folder of the split code
+    """
+
+    # Manifests kept in memory by open(), e.g. by the server mode
+    _cache: ClassVar[Dict[Path, "Manifest"]] = {}
+    _CACHE_SIZE: ClassVar[int] = 256
+
+    def __init__(self, folder: Path) -> None:
+        self.folder = folder
+        self.path = folder.joinpath(MANIFEST_NAME)
+        self.sources: Dict[str, dict] = {}
+        self._pending: Dict[str, dict] = {}
+        self._stat: Optional[Tuple[int, int, int]] = None
+        self.load()
+
+    @classmethod
+    def open(cls, folder: Path) -> "Manifest":
+        """Manifest of the folder, the same instance is returned for the same folder.
+
+        The manifest is only read again if the file was changed by another process.
+        """
+        manifest = cls._cache.pop(folder, None)
+        if manifest is None:
+            manifest = cls(folder)
+            while len(cls._cache) >= cls._CACHE_SIZE:
+                # Drop the least recently used manifest
+                del cls._cache[next(iter(cls._cache))]
+        else:
+            manifest.load()
+        cls._cache[folder] = manifest
+        return manifest
+
+    def _file_stat(self) -> Optional[Tuple[int, int, int]]:
+        """Inode, size and mtime of the manifest, :meth:`save` always creates a new inode"""
+        try:
+            stat = self.path.stat()
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_size, stat.st_mtime_ns
+
+    def load(self) -> None:
+        """Read the manifest from the output folder, unless it's unchanged since the last read"""
+        stat = self._file_stat()
+        if stat is not None and stat == self._stat:
+            return
+        try:
+            data = json.loads(self.path.read_text(encoding="utf-8"))
+        except (FileNotFoundError, ValueError):
+            data = {}
+        if data.get("version") != MANIFEST_VERSION:
+            data = {}
+        self.sources = data.get("sources", {})
+        self._stat = stat
+
+    def is_unchanged(self, src: Path, select: str = "") -> bool:
+        """Check if the source is unchanged since the last split.
+
+        Size and mtime are checked first, the content hash is only computed if they differ.
+        The new stat and hash are kept to be stored by :meth:`update`.
+
+        Parameters
+        ----------
+        src : Path
+            Source code file
+        select : str
+            Description of the block filter, a source split with another filter isn't unchanged
+
+        Returns
+        -------
+        bool
+            True if the source doesn't need to be split again
+        """
+        self.load()
+        stat = src.stat()
+        entry = self.sources.get(str(src))
+        if entry and entry.get("select", "") != select:
+            entry = None
+        if entry and entry["size"] == stat.st_size and entry["mtime_ns"] == stat.st_mtime_ns:
+            return True
+        current = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": file_digest(src)}
+        if entry and entry["sha256"] == current["sha256"]:
+            # Only touched, remember the new mtime to skip the hashing next time
+            entry.update(current)
+            with folder_lock(self.folder):
+                self.load()
+                self.sources.setdefault(str(src), entry).update(current)
+                self.save()
+            return True
+        self._pending[str(src)] = current
+        return False
+
+    def blocks(self, key: str) -> Dict[str, str]:
+        """Output file name and hash per block of the last split of the source"""
+        entry = self.sources.get(key)
+        return dict(entry["blocks"]) if entry else {}
+
+    def update(self, key: str, blocks: Dict[str, str], select: str = "") -> List[str]:
+        """Store the output file hashes of the source, together with the stat checked by :meth:`is_unchanged`.
+
+        The output files of the source which are not part of the new blocks are removed.
+        The output folder is locked and the manifest is read again before the update, so
+        concurrent runs with the same output folder don't lose their entries.
+
+        Parameters
+        ----------
+        key : str
+            Path of the source
+        blocks : Dict[str, str]
+            Hash per output file name
+        select : str
+            Description of the block filter used for the split
+
+        Returns
+        -------
+        List[str]
+            Names of the removed output files
+        """
+        entry: Dict[str, Optional[object]] = {"size": None, "mtime_ns": None, "sha256": None}
+        entry.update(self._pending.pop(key, {}))
+        entry["blocks"] = blocks
+        if select:
+            entry["select"] = select
+        with folder_lock(self.folder):
+            self.load()
+            removed = sorted(self.blocks(key).keys() - blocks.keys())
+            for name in removed:
+                _logger.info("Remove output file %s", name)
+                try:
+                    self.folder.joinpath(name).unlink()
+                except FileNotFoundError:
+                    pass
+            self.sources[key] = entry
+            self.save()
+        return removed
+
+    def save(self) -> None:
+        """Write the manifest, a temporary file is used to never leave a partial manifest behind.
+
+        Use :func:`code_split.sinks.folder_lock` if other processes might update the manifest.
+        """
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        tmp_path.write_text(
+            json.dumps({"version": MANIFEST_VERSION, "sources": self.sources}, indent=1, sort_keys=True),
+            encoding="utf-8",
+        )
+        os.replace(tmp_path, self.path)
+        self._stat = self._file_stat()
+        _logger.debug("Saved manifest %s", self.path)
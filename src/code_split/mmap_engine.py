@@ -0,0 +1,236 @@
+"""
+Zero-copy split engine based on a memory mapped source file
+
+The source is scanned as bytes to build an index of byte spans per top level
+class and function. The output files are written directly from memoryview
+slices of the mapping, no string objects are created per line.
+
+The lines are classified with :mod:`code_split.classifier` like by
+:func:`code_split.blocks.iter_blocks` for a bytes source, the blocks are written
+with the bytes of the source, including its encoding and line endings.
+"""
+
+import logging
+import mmap
+from pathlib import Path
+from typing import TYPE_CHECKING, Iterator, List, NamedTuple, Optional, Tuple
+
+from code_split.classifier import (
+    BLANK,
+    CODE,
+    COMMENT,
+    DECORATOR,
+    HEADER,
+    classify_bytes,
+    header_kind,
+)
+from code_split.encoding import DEFAULT_ENCODING, detect_encoding, with_coding_line
+
+if TYPE_CHECKING:
+    from code_split.blocks import Select  # pragma: no cover
+    from code_split.index import Symbol  # pragma: no cover
+    from code_split.sinks import DirectorySink  # pragma: no cover
+
+__author__ = "Matthias Homann"
+__copyright__ = "Matthias Homann"
+__license__ = "GPL-3.0-or-later"
+
+_logger = logging.getLogger(__name__)
+
+# Line kinds in column 0 which end a class or function
+_BLOCK_END = frozenset((DECORATOR, COMMENT, CODE))
+
+Range = Tuple[int, int]
+
+
+class Span(NamedTuple):
+    """Byte span of a block in the source.
+
+    The block starts at ``start`` and ends before ``end``. Leading comments or decorators
+    which are not directly in front of the block, e.g. separated by top level code, are
+    listed as additional ranges in ``prefix`` and written before the span.
+    The line numbers are the first and last line of the block including the prefix, like
+    :attr:`code_split.blocks.Block.start_line` and :attr:`code_split.blocks.Block.end_line`.
+    The block starts with its comment lines followed by its decorator lines.
+    """
+
+    name: str
+    start: int
+    end: int
+    prefix: Tuple[Range, ...] = ()
+    kind: str = "def"
+    start_line: int = 0
+    end_line: int = 0
+    comment_lines: int = 0
+    decorator_lines: int = 0
+
+    @property
+    def file_name(self) -> str:
+        """Name of the output file for the block"""
+        return self.name + ".py"
+
+    def ranges(self) -> Tuple[Range, ...]:
+        """All byte ranges of the block in the order to be written"""
+        return self.prefix + ((self.start, self.end),)
+
+
+def _append_range(ranges: List[Range], start: int, end: int) -> None:
+    """Append the line to the ranges, consecutive lines are merged into one range"""
+    if ranges and ranges[-1][1] == start:
+        ranges[-1] = (ranges[-1][0], end)
+    else:
+        ranges.append((start, end))
+
+
+def scan_spans(
+    data,
+    start: int = 0,
+    end: Optional[int] = None,
+    select: Optional["Select"] = None,
+    encoding: str = DEFAULT_ENCODING,
+) -> Iterator[Span]:
+    """Scan the source bytes for the spans of the top level classes and functions.
+
+    Parameters
+    ----------
+    data : bytes-like
+        Source code, e.g. a bytes object or a memory mapped file
+    start : int
+        Offset of the first line to be scanned, the line numbers of the spans are counted from there
+    end : Optional[int]
+        Offset after the last line to be scanned, defaults to the end of the data
+    select : Optional[Select]
+        Filter of the blocks, see :func:`code_split.blocks.iter_blocks`
+    encoding : str
+        Encoding of the source to decode the names, see :func:`code_split.encoding.detect_encoding`
+
+    Yields
+    ------
+    Span
+        Span per class or function, in the order of the source
+    """
+    size = len(data) if end is None else end
+    pos = start
+    name: Optional[str] = None
+    kind = ""
+    keep = True
+    start = end = 0
+    start_line = end_line = 0
+    prefix: Tuple[Range, ...] = ()
+    cache: List[Range] = []
+    pre_comment: List[Range] = []
+    # Line number of the first line and number of lines in cache and pre_comment
+    cache_line = pre_comment_line = 0
+    cache_lines = pre_comment_lines = 0
+    leading = (0, 0)
+    lineno = 0
+    while pos < size:
+        lineno += 1
+        eol = data.find(b"\n", pos, size)
+        next_pos = size if eol < 0 else eol + 1
+        line_kind, match = classify_bytes(data, pos, next_pos)
+        if line_kind == DECORATOR:
+            if not cache:
+                cache_line = lineno
+                cache_lines = 0
+            _append_range(cache, pos, next_pos)
+            cache_lines += 1
+        elif line_kind == HEADER:
+            if name and keep:
+                yield Span(name, start, end, prefix, kind, start_line, end_line, *leading)
+            # Only the name and kind of the header line are decoded
+            name = match.group("name").decode(encoding)
+            kind = header_kind(match)
+            keep = select is None or select(name, kind, bool(cache))
+            start_line = lineno
+            if pre_comment:
+                start_line = min(start_line, pre_comment_line)
+            if cache:
+                start_line = min(start_line, cache_line)
+            pieces: List[Range] = []
+            for piece in pre_comment + cache + [(pos, pos)]:
+                _append_range(pieces, *piece)
+            prefix = tuple(pieces[:-1])
+            start = pieces[-1][0]
+            leading = (pre_comment_lines if pre_comment else 0, cache_lines if cache else 0)
+            pre_comment = []
+            cache = []
+        if name and line_kind in _BLOCK_END:
+            # Class of function ended, either comments or main code
+            if keep:
+                yield Span(name, start, end, prefix, kind, start_line, end_line, *leading)
+            name = None
+
+        if line_kind == BLANK:
+            # ignore comments before functions is separated by a blank line
+            pre_comment.clear()
+        elif name:
+            end = next_pos
+            end_line = lineno
+        elif line_kind == COMMENT:
+            if not pre_comment:
+                pre_comment_line = lineno
+                pre_comment_lines = 0
+            _append_range(pre_comment, pos, next_pos)
+            pre_comment_lines += 1
+        pos = next_pos
+    if name and keep:
+        yield Span(name, start, end, prefix, kind, start_line, end_line, *leading)
+
+
+def split_mmap(
+    src_path: Path,
+    sink: "DirectorySink",
+    symbols: Optional[List["Symbol"]] = None,
+    select: Optional["Select"] = None,
+) -> int:
+    """Split the source file using a memory mapping and write a file per block.
+
+    Parameters
+    ----------
+    src_path : Path
+        Source code file
+    sink : DirectorySink
+        Output folder for the new files
+    symbols : Optional[List[Symbol]]
+        List to collect the symbols of the blocks for the index
+    select : Optional[Select]
+        Filter of the blocks, see :func:`code_split.blocks.iter_blocks`
+
+    Returns
+    -------
+    int
+        Number of blocks
+    """
+    blocks = 0
+    with src_path.open("rb") as file:
+        if not src_path.stat().st_size:
+            # Empty files can't be mapped
+            return blocks
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapping, memoryview(mapping) as view:
+            encoding, bom = detect_encoding(mapping)
+            for span in scan_spans(mapping, bom, select=select, encoding=encoding):
+                _write_span(view, span, sink, symbols, encoding)
+                blocks += 1
+    return blocks
+
+
+def _write_span(
+    view: memoryview,
+    span: Span,
+    sink: "DirectorySink",
+    symbols: Optional[List["Symbol"]],
+    encoding: str = DEFAULT_ENCODING,
+) -> None:
+    """Write the block of the span, the slices of the view must be released before the mapping is closed"""
+    pieces = [view[start:end] for start, end in span.ranges()]
+    try:
+        sink.write(span.file_name, with_coding_line(pieces, encoding))
+        if symbols is not None:
+            from code_split.index import Symbol
+
+            symbols.append(Symbol.from_span(span, pieces, encoding)._replace(output=sink.last_name))
+    finally:
+        # The traceback of a failed write, e.g. a name collision, would keep the slices alive
+        for piece in pieces:
+            piece.release()
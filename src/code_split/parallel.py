@@ -0,0 +1,245 @@
+"""
+Split a single huge source file in parallel
+
+The memory mapped source is cut into chunks at top level boundaries, the chunks are
+scanned by worker processes with :func:`code_split.mmap_engine.scan_spans` and the
+spans are merged in source order. A chunk may only start at a line where the scanner
+of the whole file has no state left, so each chunk is split exactly like in the serial
+scan. A safe cut is a ``def`` or ``class`` line in column 0 which
+
+- follows a blank line, so no leading comment is pending, and
+- has no decorator line since the previous header, so no decorator is pending.
+
+The cuts are found by searching forward from evenly spaced offsets, only the lines
+starting with a header are classified. The output files are written by the workers
+too, a file name occurring more than once is only written by the chunk with the last
+occurrence, like the serial split where the last block wins.
+"""
+
+import logging
+import mmap
+import os
+import re
+from contextlib import contextmanager
+from pathlib import Path
+from typing import TYPE_CHECKING, Dict, Iterator, List, Optional, Set, Tuple
+
+from code_split.classifier import BLANK, HEADER, classify_bytes
+from code_split.encoding import detect_encoding
+from code_split.mmap_engine import Span, _write_span, scan_spans, split_mmap
+from code_split.sinks import DirectorySink
+
+if TYPE_CHECKING:
+    from code_split.blocks import Select  # pragma: no cover
+    from code_split.index import Symbol  # pragma: no cover
+
+__author__ = "Matthias Homann"
+__copyright__ = "Matthias Homann"
+__license__ = "GPL-3.0-or-later"
+
+_logger = logging.getLogger(__name__)
+
+MIN_CHUNK = 2**22
+"""Minimum size of a chunk in bytes, smaller sources are split serially"""
+# Chunks per worker, more chunks balance the load if the blocks have very different sizes
+CHUNKS_PER_WORKER = 4
+# Candidates for a header line, confirmed with the classifier
+_HEADER_LINE = re.compile(rb"^(?:async\s+)?(?:def|class)\s", re.MULTILINE)
+_COUNT_STEP = 2**24
+
+
+@contextmanager
+def _map_file(src_path: Path) -> Iterator[mmap.mmap]:
+    with src_path.open("rb") as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapping:
+        yield mapping
+
+
+def _after_blank(data, pos: int) -> bool:
+    """Check if the line before the offset is blank"""
+    if pos == 0:
+        return False
+    line_start = data.rfind(b"\n", 0, pos - 1) + 1
+    return classify_bytes(data, line_start, pos)[0] == BLANK
+
+
+def next_cut(data, pos: int) -> Optional[int]:
+    """Find the first safe cut at or after the offset, see the module description
+
+    Parameters
+    ----------
+    data : bytes-like
+        Source code, e.g. a bytes object or a memory mapped file
+    pos : int
+        Offset to start the search
+
+    Returns
+    -------
+    Optional[int]
+        Offset of the header line to start a chunk, None if there is no safe cut
+    """
+    size = len(data)
+    previous = None
+    for match in _HEADER_LINE.finditer(data, pos):
+        start = match.start()
+        eol = data.find(b"\n", start)
+        if classify_bytes(data, start, size if eol < 0 else eol + 1)[0] != HEADER:
+            continue
+        # The cache of the decorators is empty after a header, unless another decorator follows
+        if previous is not None and data.find(b"\n@", previous, start) < 0 and _after_blank(data, start):
+            return start
+        previous = start
+    return None
+
+
+def find_cuts(data, chunks: int, min_chunk: int = MIN_CHUNK) -> List[int]:
+    """Offsets of the chunks of the source
+
+    Parameters
+    ----------
+    data : bytes-like
+        Source code, e.g. a bytes object or a memory mapped file
+    chunks : int
+        Number of chunks wanted, fewer are returned for small sources or if there are no safe cuts
+    min_chunk : int
+        Minimum size of a chunk in bytes
+
+    Returns
+    -------
+    List[int]
+        Start offset of each chunk followed by the size of the source
+    """
+    size = len(data)
+    chunks = max(1, min(chunks, size // max(1, min_chunk)))
+    cuts = [0]
+    for number in range(1, chunks):
+        cut = next_cut(data, max(number * size // chunks, cuts[-1] + min_chunk))
+        if cut is None:
+            break
+        if cut > cuts[-1] and size - cut >= min_chunk:
+            cuts.append(cut)
+    cuts.append(size)
+    return cuts
+
+
+def _count_lines(data, start: int, end: int) -> int:
+    """Number of line breaks in the range, counted in steps to limit the copies of a memory mapping"""
+    return sum(data[pos : min(pos + _COUNT_STEP, end)].count(b"\n") for pos in range(start, end, _COUNT_STEP))
+
+
+def _scan_job(job: Tuple[str, int, int, Optional["Select"], str]) -> Tuple[List[Span], int]:
+    """Worker function, returns the spans of the chunk and its number of lines"""
+    src_path, start, end, select, encoding = job
+    with _map_file(Path(src_path)) as mapping:
+        return list(scan_spans(mapping, start, end, select, encoding)), _count_lines(mapping, start, end)
+
+
+def _write_job(
+    job: Tuple[str, str, str, Optional[Dict[str, str]], List[Span], Set[int], bool, str, Optional[str]],
+) -> Tuple[Dict[str, str], Tuple[int, int, int], Optional[List["Symbol"]]]:
+    """Worker function, writes the spans of a chunk and returns the hashes of the files, the counters and the symbols"""
+    src_path, folder, fsync, hashes, spans, skip, collect, encoding, store_root = job
+    symbols: Optional[List["Symbol"]] = [] if collect else None
+    store = None
+    if store_root:
+        from code_split.store import BlockStore
+
+        store = BlockStore(Path(store_root))
+    with _map_file(Path(src_path)) as mapping, memoryview(mapping) as view, DirectorySink(
+        Path(folder), fsync, hashes, store=store
+    ) as sink:
+        for number, span in enumerate(spans):
+            if number not in skip:
+                _write_span(view, span, sink, symbols, encoding)
+            elif symbols is not None:
+                # Overwritten by a later block of the same name, only part of the index
+                from code_split.index import Symbol
+
+                pieces = [bytes(view[start:end]) for start, end in span.ranges()]
+                symbols.append(Symbol.from_span(span, pieces, encoding))
+    return sink.written, (sink.files_written, sink.files_unchanged, sink.bytes_written), symbols
+
+
+def split_parallel(
+    src_path: Path,
+    sink: DirectorySink,
+    workers: Optional[int] = None,
+    symbols: Optional[List["Symbol"]] = None,
+    select: Optional["Select"] = None,
+    min_chunk: Optional[int] = None,
+) -> int:
+    """Split the source file in chunks by a process pool and write a file per block.
+
+    The written files, the hashes in ``sink.written`` and the symbols are the same as with
+    :func:`code_split.mmap_engine.split_mmap`. Sources smaller than two chunks are split serially.
+
+    Parameters
+    ----------
+    src_path : Path
+        Source code file
+    sink : DirectorySink
+        Output folder for the new files, the workers write with the same fsync policy, hashes and store,
+        the collision policy must be ``"overwrite"``
+    workers : Optional[int]
+        Number of worker processes, defaults to the number of CPU cores
+    symbols : Optional[List[Symbol]]
+        List to collect the symbols of the blocks for the index
+    select : Optional[Select]
+        Filter of the blocks, see :func:`code_split.blocks.iter_blocks`, it must be picklable
+    min_chunk : Optional[int]
+        Minimum size of a chunk in bytes, defaults to :data:`MIN_CHUNK`
+
+    Returns
+    -------
+    int
+        Number of blocks
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+    min_chunk = min_chunk or MIN_CHUNK
+    size = src_path.stat().st_size
+    cuts = [0, size]
+    if workers > 1 and size >= 2 * min_chunk:
+        with _map_file(src_path) as mapping:
+            encoding, bom = detect_encoding(mapping)
+            cuts = find_cuts(mapping, workers * CHUNKS_PER_WORKER, min_chunk)
+        # The first chunk starts after the BOM
+        cuts[0] = bom
+    if len(cuts) <= 2:
+        return split_mmap(src_path, sink, symbols, select)
+    _logger.info("Split %s in %d chunks using %d workers", src_path, len(cuts) - 1, workers)
+    from concurrent.futures import ProcessPoolExecutor
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        jobs = [(str(src_path), start, end, select, encoding) for start, end in zip(cuts, cuts[1:])]
+        scans = list(executor.map(_scan_job, jobs))
+        # Line numbers of the spans are relative to the chunk
+        chunks: List[List[Span]] = []
+        lines = 0
+        for spans, count in scans:
+            chunks.append(
+                [span._replace(start_line=span.start_line + lines, end_line=span.end_line + lines) for span in spans]
+            )
+            lines += count
+        # Position of the last block per file name, earlier blocks of the same name would be overwritten
+        last = {
+            span.file_name: (chunk, number) for chunk, spans in enumerate(chunks) for number, span in enumerate(spans)
+        }
+        write_jobs = []
+        for chunk, spans in enumerate(chunks):
+            skip = {number for number, span in enumerate(spans) if last[span.file_name] != (chunk, number)}
+            hashes = None
+            if sink.hashes is not None:
+                names = {span.file_name for span in spans}
+                hashes = {name: digest for name, digest in sink.hashes.items() if name in names}
+            store = str(sink.store.root) if sink.store else None
+            write_jobs.append(
+                (str(src_path), str(sink.folder), sink.fsync, hashes, spans, skip, symbols is not None, encoding, store)
+            )
+        for written, counters, chunk_symbols in executor.map(_write_job, write_jobs):
+            sink.written.update(written)
+            sink.files_written += counters[0]
+            sink.files_unchanged += counters[1]
+            sink.bytes_written += counters[2]
+            if symbols is not None:
+                symbols.extend(chunk_symbols)
+    return sum(map(len, chunks))
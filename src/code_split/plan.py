@@ -0,0 +1,198 @@
+"""
+Plan a split without writing anything
+
+The sources are only scanned, memory mapped like by the mmap engine, so no line is copied
+and no output is buffered. The plan lists the output file of each block with its size, if
+the file already exists and would be overwritten and if several blocks have the same output
+file, so that the later block would replace the earlier one, unless the collision policy
+``"suffix"`` writes it under another name.
+"""
+
+import logging
+import mmap
+from pathlib import Path
+from typing import Dict, Iterable, List, NamedTuple, Optional, Set, TextIO, Tuple
+
+from code_split.blocks import Block, Select, iter_blocks
+from code_split.encoding import coding_line, detect_encoding
+from code_split.mmap_engine import Span, scan_spans
+
+__author__ = "Matthias Homann"
+__copyright__ = "Matthias Homann"
+__license__ = "GPL-3.0-or-later"
+
+_logger = logging.getLogger(__name__)
+
+PLAN_FORMATS = ("text", "json")
+
+
+class PlannedFile(NamedTuple):
+    """Output file of a block in the plan.
+
+    ``exists`` is True if the file would be overwritten, ``collision`` if other blocks
+    of the plan have the same output file.
+    """
+
+    source: str
+    name: str
+    kind: str
+    start_line: int
+    end_line: int
+    target: str
+    size: int
+    exists: bool
+    collision: bool = False
+
+
+def _scan_source(src_path: Path, select: Optional[Select], depth: int = 1) -> List[Tuple[str, str, int, int, int]]:
+    """Name, kind, lines and size of each block of the source file"""
+    if depth > 1:
+        with src_path.open("rb") as file:
+            return _block_sizes(iter_blocks(file, select, depth))
+    with src_path.open("rb") as file:
+        if not src_path.stat().st_size:
+            # Empty files can't be mapped
+            return []
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapping:
+            encoding, bom = detect_encoding(mapping)
+            return [
+                (span.name, span.kind, span.start_line, span.end_line, _span_size(mapping, span, encoding))
+                for span in scan_spans(mapping, bom, select=select, encoding=encoding)
+            ]
+
+
+def _span_size(mapping: mmap.mmap, span: Span, encoding: str) -> int:
+    """Size of the output file of the span, with the coding cookie of a source which isn't UTF-8"""
+    ranges = span.ranges()
+    first = ranges[0][0]
+    # The head is enough to find a cookie in the first two lines
+    return sum(end - start for start, end in ranges) + len(coding_line(mapping[first : first + 1024], encoding))
+
+
+def _block_sizes(blocks: Iterable[Block]) -> List[Tuple[str, str, int, int, int]]:
+    """Name, kind, lines and output file size of the blocks"""
+    return [(block.name, block.kind, block.start_line, block.end_line, len(block.file_data)) for block in blocks]
+
+
+def plan_split(
+    inputs: Iterable[str],
+    folder: Optional[str] = None,
+    select: Optional[Select] = None,
+    collisions: str = "overwrite",
+    depth: int = 1,
+    report: Optional[Dict[str, Optional[str]]] = None,
+) -> List[PlannedFile]:
+    """Plan the split of the inputs without writing anything.
+
+    A single file is planned like :func:`code_split.code_split.split_code` splits it, several files,
+    directories or glob patterns like :func:`code_split.batch.split_tree`, mirroring the source layout.
+
+    Parameters
+    ----------
+    inputs : Iterable[str]
+        Source file or ``"-"`` for stdin, or files, directories or glob patterns of the batch mode
+    folder : Optional[str]
+        Output folder, defaults to the current working directory
+    select : Optional[Select]
+        Filter of the blocks, see :func:`code_split.blocks.iter_blocks`
+    collisions : str
+        Collision policy of the split, see :class:`code_split.sinks.DirectorySink`, with ``"suffix"``
+        the later blocks of a name get their own target and aren't collisions
+    depth : int
+        Levels of classes whose members are split, see :func:`code_split.blocks.iter_blocks`,
+        the sources are read as stream then and the sizes of the classes are without the members
+    report : Optional[Dict[str, Optional[str]]]
+        Filled with the error message or None per source of the batch mode, like the report of
+        :func:`code_split.batch.split_tree`
+
+    Returns
+    -------
+    List[PlannedFile]
+        Output file per block in the order of the split
+
+    Raises
+    ------
+    ValueError
+        If the encoding of a single source is unknown or not compatible with ASCII,
+        such sources are logged, reported and skipped in batch mode
+    FileNotFoundError
+        If a single source doesn't exist
+    """
+    from code_split.batch import collect_tree
+    from code_split.code_split import STDIN, is_batch
+
+    inputs = list(inputs)
+    output = Path.cwd().joinpath(folder) if folder else Path.cwd()
+    if inputs == [STDIN]:
+        import sys
+
+        blocks = _block_sizes(iter_blocks(getattr(sys.stdin, "buffer", sys.stdin), select, depth))
+        sources = [(STDIN, output, blocks)]
+    elif is_batch(inputs):
+        sources = []
+        for src, base in collect_tree(inputs, output):
+            # Like in the batch mode a source which can't be split doesn't stop the run
+            error = None
+            if not src.is_file():
+                error = "Can't find input file"
+            else:
+                try:
+                    blocks = _scan_source(src, select, depth)
+                except (OSError, ValueError) as err:
+                    error = f"{type(err).__name__}: {err}"
+            if report is not None:
+                report[str(src)] = error
+            if error:
+                _logger.error("Failed to split %s: %s", src, error)
+                continue
+            sources.append((str(src), output.joinpath(src.relative_to(base).with_suffix("")), blocks))
+    else:
+        src_path = Path.cwd().joinpath(inputs[0])
+        sources = [(str(src_path), output, _scan_source(src_path, select, depth))]
+    plan: List[PlannedFile] = []
+    targets: Dict[str, int] = {}
+    for source, target_folder, blocks in sources:
+        names: Set[str] = set()
+        for name, kind, start_line, end_line, size in blocks:
+            file_name = name
+            if collisions == "suffix":
+                # Like DirectorySink, the first free name_2, name_3...
+                number = 2
+                while file_name in names:
+                    file_name = f"{name}_{number}"
+                    number += 1
+                names.add(file_name)
+            target = target_folder.joinpath(file_name.replace(".", "/") + ".py")
+            plan.append(PlannedFile(source, name, kind, start_line, end_line, str(target), size, target.is_file()))
+            targets[str(target)] = targets.get(str(target), 0) + 1
+    return [entry._replace(collision=targets[entry.target] > 1) for entry in plan]
+
+
+def write_plan(plan: List[PlannedFile], plan_format: str, stream: TextIO) -> None:
+    """Write the plan as table with a summary or as JSON
+
+    Raises
+    ------
+    ValueError
+        If the format isn't one of :data:`PLAN_FORMATS`
+    """
+    if plan_format == "json":
+        import json
+
+        stream.write(json.dumps([entry._asdict() for entry in plan], indent=1) + "\n")
+        return
+    if plan_format != "text":
+        raise ValueError(f"Unknown plan format {plan_format}, use one of {', '.join(PLAN_FORMATS)}")
+    for entry in plan:
+        status = "overwrite" if entry.exists else "create"
+        if entry.collision:
+            status += ",collision"
+        span = f"{entry.source}:{entry.start_line}-{entry.end_line}"
+        stream.write(f"{status}\t{entry.size}\t{entry.target}\t{span}\n")
+    files = {entry.target for entry in plan}
+    overwritten = {entry.target for entry in plan if entry.exists}
+    collisions = {entry.target for entry in plan if entry.collision}
+    stream.write(
+        f"{len(plan)} blocks, {len(files)} files, {len(overwritten)} overwritten, {len(collisions)} collisions, "
+        f"{sum(entry.size for entry in plan)} bytes\n"
+    )
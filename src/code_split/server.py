@@ -0,0 +1,173 @@
+"""
+Resident split server listening on a Unix socket
+
+Each split job of a build system which runs ``code_split`` once per changed file pays
+the start of the interpreter and the imports. The server started by ``code_split serve``
+keeps the interpreter, the compiled patterns and the manifests of the incremental mode
+(see :meth:`code_split.manifest.Manifest.open`) in memory and runs the jobs sent by
+:mod:`code_split.client`.
+
+The protocol is one JSON line per request and response::
+
+    {"args": ["-i", "src.py", "-f", "out"], "cwd": "/path/to/project"}
+    {"status": 0, "output": "", "messages": [], "seconds": 0.0012}
+
+Jobs are run one after the other, batch jobs still use a process pool.
+"""
+
+import io
+import json
+import logging
+import os
+import socket
+import socketserver
+import time
+from contextlib import redirect_stderr, redirect_stdout
+from pathlib import Path
+from typing import Any, Dict, List
+
+from code_split.code_split import STDIN, execute, parse_args
+
+__author__ = "Matthias Homann"
+__copyright__ = "Matthias Homann"
+__license__ = "GPL-3.0-or-later"
+
+_logger = logging.getLogger(__name__)
+
+
+class _MessageHandler(logging.Handler):
+    """Collect the warnings and errors of a job to be returned to the client"""
+
+    def __init__(self) -> None:
+        super().__init__(logging.WARNING)
+        self.messages: List[str] = []
+
+    def emit(self, record: logging.LogRecord) -> None:
+        self.messages.append(f"{record.levelname}: {record.getMessage()}")
+
+
+def _is_alive(path: str) -> bool:
+    """Check if a server is listening on the socket"""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+        try:
+            probe.connect(path)
+        except OSError:
+            return False
+    return True
+
+
+def _resolve_paths(settings, cwd: Path) -> None:
+    """Make the paths of the parsed arguments absolute, relative paths are relative to the client"""
+    if STDIN in settings.input or settings.archive == STDIN or settings.ndjson:
+        # The binary output of NDJSON records or archives isn't sent back to the client
+        raise ValueError("stdin and stdout can't be used with the server")
+    if settings.watch:
+        raise ValueError("The watch mode can't be used with the server")
+    if settings.profile or settings.trace_memory:
+        raise ValueError("Jobs sent to the server can't be profiled")
+    settings.input = [str(cwd.joinpath(item)) for item in settings.input]
+    settings.folder = str(cwd.joinpath(settings.folder or ""))
+    if settings.archive:
+        settings.archive = str(cwd.joinpath(settings.archive))
+    if settings.index:
+        settings.index = str(cwd.joinpath(settings.index))
+    if settings.stats_file:
+        settings.stats_file = str(cwd.joinpath(settings.stats_file))
+    if settings.store:
+        settings.store = str(cwd.joinpath(settings.store))
+
+
+class SplitServer(socketserver.UnixStreamServer):
+    """Server running the split jobs sent to the Unix socket.
+
+    Use as context manager, the socket is removed when the server is closed.
+
+    Parameters
+    ----------
+    path : str
+        Path of the Unix socket, a stale socket of a terminated server is replaced
+
+    Raises
+    ------
+    FileExistsError
+        If another server is listening on the socket
+    """
+
+    def __init__(self, path: str) -> None:
+        if os.path.exists(path):
+            if _is_alive(path):
+                raise FileExistsError(path)
+            os.unlink(path)
+        self.path = path
+        self.jobs = 0
+        super().__init__(path, _RequestHandler)
+
+    def server_bind(self) -> None:
+        super().server_bind()
+        # Only the user may send jobs
+        os.chmod(self.path, 0o600)
+
+    def server_close(self) -> None:
+        super().server_close()
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+    def run_job(self, job: Dict[str, Any]) -> Dict[str, Any]:
+        """Run a split job
+
+        Parameters
+        ----------
+        job : Dict[str, Any]
+            ``code_split`` command line parameters as ``args`` and the working directory of the client as ``cwd``
+
+        Returns
+        -------
+        Dict[str, Any]
+            Exit ``status``, ``output`` for stdout, error ``messages`` and ``seconds`` needed
+        """
+        start = time.perf_counter()
+        self.jobs += 1
+        handler = _MessageHandler()
+        root = logging.getLogger()
+        root.addHandler(handler)
+        stdout = io.StringIO()
+        stderr = io.StringIO()
+        try:
+            # The help, the plan and the statistics are returned to the client
+            with redirect_stdout(stdout), redirect_stderr(stderr):
+                settings = parse_args(job["args"])
+                _resolve_paths(settings, Path(job.get("cwd") or os.getcwd()))
+                status = execute(settings)
+        except SystemExit as exc:
+            # argparse exits for --help, --version and invalid arguments
+            status = exc.code if isinstance(exc.code, int) else 2
+        except Exception as err:  # pylint: disable=broad-except
+            _logger.error("%s: %s", type(err).__name__, err)
+            status = 1
+        finally:
+            root.removeHandler(handler)
+        seconds = time.perf_counter() - start
+        _logger.info("Job %d finished with status %d in %.1f ms", self.jobs, status, seconds * 1000)
+        messages = handler.messages + stderr.getvalue().splitlines()
+        return {"status": status, "output": stdout.getvalue(), "messages": messages, "seconds": seconds}
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    """Read one job per connection and write the result"""
+
+    server: SplitServer
+
+    def handle(self) -> None:
+        line = self.rfile.readline()
+        if not line:
+            # Connection closed without a job, e.g. by the check for a running server
+            return
+        try:
+            job = json.loads(line)
+        except ValueError as err:
+            result: Dict[str, Any] = {"status": 2, "output": "", "messages": [f"Invalid job: {err}"], "seconds": 0}
+        else:
+            result = self.server.run_job(job)
+        self.wfile.write(json.dumps(result).encode("utf-8") + b"\n")
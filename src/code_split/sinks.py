@@ -0,0 +1,635 @@
+"""
+Destinations for the split blocks, i.e. the output folder or an archive
+"""
+
+import io
+import logging
+import os
+import sys
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    BinaryIO,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+)
+
+from code_split.blocks import Block
+
+if TYPE_CHECKING:
+    from code_split.store import BlockStore  # pragma: no cover
+
+if sys.platform == "win32":
+    import msvcrt  # pragma: no cover
+else:
+    import fcntl
+
+__author__ = "Matthias Homann"
+__copyright__ = "Matthias Homann"
+__license__ = "GPL-3.0-or-later"
+
+_logger = logging.getLogger(__name__)
+
+STDOUT = "-"
+LOCK_NAME = ".code_split.lock"
+FSYNC_POLICIES = ("none", "file", "run")
+COLLISIONS = ("overwrite", "suffix", "merge", "error")
+
+Data = Union[bytes, Sequence[Union[bytes, memoryview]]]
+
+
+@contextmanager
+def folder_lock(folder: Path) -> Iterator[None]:
+    """Exclusive advisory lock of the output folder.
+
+    The lock is only held for short critical sections, like the update of the manifest,
+    so parallel runs with the same output folder aren't serialised.
+    """
+    with folder.joinpath(LOCK_NAME).open("a+b") as file:
+        file.seek(0)
+        if sys.platform == "win32":
+            msvcrt.locking(file.fileno(), msvcrt.LK_LOCK, 1)  # pragma: no cover
+        else:
+            fcntl.flock(file.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if sys.platform == "win32":
+                msvcrt.locking(file.fileno(), msvcrt.LK_UNLCK, 1)  # pragma: no cover
+            else:
+                fcntl.flock(file.fileno(), fcntl.LOCK_UN)
+
+
+class DirectorySink:
+    """Write one file per block into the output folder.
+
+    Each file is written with one call into a temporary file in the same folder, which is then
+    atomically renamed. A crash never leaves a partial file and concurrent runs don't interleave
+    their writes, the last one wins.
+
+    Parameters
+    ----------
+    folder : Path
+        Output folder, must exist
+    fsync : str
+        ``"none"`` to leave the flushing to the OS, ``"file"`` to sync each file before it is
+        renamed or ``"run"`` to sync all files when the sink is closed
+    hashes : Optional[Dict[str, str]]
+        Hashes of the existing output files in incremental mode, unchanged files aren't written
+    collisions : str
+        Policy for a file name written more than once, e.g. a function defined twice:
+        ``"overwrite"`` keeps the last block, ``"suffix"`` writes the later blocks as ``name_2.py``,
+        ``name_3.py``..., ``"merge"`` appends them to the first file separated by two blank lines
+        and ``"error"`` raises a ValueError
+    store : Optional[BlockStore]
+        Write each block into this content-addressed store and link the output file to it,
+        see :mod:`code_split.store`
+    """
+
+    def __init__(
+        self,
+        folder: Path,
+        fsync: str = "none",
+        hashes: Optional[Dict[str, str]] = None,
+        collisions: str = "overwrite",
+        store: Optional["BlockStore"] = None,
+    ) -> None:
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"Unknown fsync policy {fsync}, use one of {', '.join(FSYNC_POLICIES)}")
+        if collisions not in COLLISIONS:
+            raise ValueError(f"Unknown collision policy {collisions}, use one of {', '.join(COLLISIONS)}")
+        self.folder = folder
+        self.fsync = fsync
+        self.hashes = hashes
+        self.collisions = collisions
+        self.store = store
+        self.written: Dict[str, str] = {}
+        """Hash per output file name, the hashes are empty if not in incremental mode or without store"""
+        self.last_name = ""
+        """Output file name of the last write, differs from the given name for the ``"suffix"`` policy"""
+        self.last_offset = 0
+        """Lines before the content of the last write in its file, set for the ``"merge"`` policy"""
+        # Counters for the statistics, see code_split.stats
+        self.files_written = 0
+        self.files_unchanged = 0
+        self.bytes_written = 0
+        self.write_seconds = 0.0
+        self._unsynced: List[Path] = []
+
+    def write(self, name: str, data: Data) -> bool:
+        """Write a file, unless it's unchanged in incremental mode
+
+        Parameters
+        ----------
+        name : str
+            Name of the file in the output folder
+        data : Data
+            Content of the file, either as bytes or as sequence of bytes-like pieces
+
+        Returns
+        -------
+        bool
+            True if the file was written, False if it's unchanged
+
+        Raises
+        ------
+        ValueError
+            If the file was already written and the collision policy is ``"error"``
+        """
+        start = time.perf_counter()
+        self.last_offset = 0
+        if name in self.written and self.collisions != "overwrite":
+            name, data = self._collide(name, data)
+        written = self._write(name, data)
+        self.last_name = name
+        self.write_seconds += time.perf_counter() - start
+        return written
+
+    def _collide(self, name: str, data: Data) -> Tuple[str, Data]:
+        """File name and content of a block whose file name was already written, by the collision policy"""
+        if self.collisions == "error":
+            raise ValueError(f"{name} is written by more than one block")
+        if self.collisions == "suffix":
+            stem, suffix = os.path.splitext(name)
+            number = 2
+            while f"{stem}_{number}{suffix}" in self.written:
+                number += 1
+            _logger.info("Write the later block of %s as %s_%d%s", name, stem, number, suffix)
+            return f"{stem}_{number}{suffix}", data
+        # The file has the blocks merged so far, even if the first one was unchanged in incremental mode
+        merged = self.folder.joinpath(name).read_bytes()
+        separator = _separator(merged)
+        self.last_offset = merged.count(b"\n") + separator.count(b"\n")
+        pieces = (data,) if isinstance(data, bytes) else data
+        return name, [merged, separator, *pieces]
+
+    def _write(self, name: str, data: Data) -> bool:
+        pieces = (data,) if isinstance(data, bytes) else data
+        path = self.folder.joinpath(name)
+        if "/" in name:
+            # Members of a class are written into the folder of the class
+            path.parent.mkdir(parents=True, exist_ok=True)
+        digest = ""
+        if self.hashes is not None or self.store is not None:
+            import hashlib
+
+            hasher = hashlib.sha256()
+            for piece in pieces:
+                hasher.update(piece)
+            digest = hasher.hexdigest()
+        if self.store is not None:
+            return self._link(name, path, digest, pieces)
+        if self.hashes is not None and path.is_file():
+            # A merged file was rewritten with its first block in this run, the hash of the manifest doesn't apply
+            known = name not in self.written and self.hashes.get(name) == digest
+            if known or path.read_bytes() == b"".join(pieces):
+                _logger.info("Skip unchanged output file: %s", name)
+                self.written[name] = digest
+                self.files_unchanged += 1
+                return False
+        _logger.info("NEW output file: %s", name)
+        tmp_path = path.with_name(f".{path.name}.{os.urandom(6).hex()}.tmp")
+        # os.open() instead of tempfile to get the default file permissions
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, "O_BINARY", 0), 0o666)
+        try:
+            with os.fdopen(fd, "wb") as file:
+                file.writelines(pieces)
+                if self.fsync == "file":
+                    file.flush()
+                    os.fsync(file.fileno())
+            os.replace(tmp_path, path)
+        except BaseException:
+            tmp_path.unlink()
+            raise
+        if self.fsync == "run":
+            self._unsynced.append(path)
+        self.written[name] = digest
+        self.files_written += 1
+        self.bytes_written += sum(map(len, pieces))
+        return True
+
+    def _link(self, name: str, path: Path, digest: str, pieces: Sequence[Union[bytes, memoryview]]) -> bool:
+        """Add the block to the store and link the output file to it, only new blocks count as written bytes"""
+        self.written[name] = digest
+        stored = self.store.path(digest)
+        if self.store.is_linked(stored, path):
+            _logger.info("Skip unchanged output file: %s", name)
+            self.files_unchanged += 1
+            return False
+        _logger.info("NEW output file: %s -> %s", name, digest)
+        size = self.store.bytes_written
+        stored = self.store.add(digest, pieces, self.fsync == "file")
+        self.bytes_written += self.store.bytes_written - size
+        if self.fsync == "run" and self.store.bytes_written > size:
+            self._unsynced.append(stored)
+        self.store.link(stored, path)
+        self.files_written += 1
+        return True
+
+    def close(self) -> None:
+        """Sync the written files and the folder, depending on the fsync policy"""
+        start = time.perf_counter()
+        self._sync()
+        self.write_seconds += time.perf_counter() - start
+
+    def _sync(self) -> None:
+        for path in self._unsynced:
+            fd = os.open(path, os.O_RDONLY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+        self._unsynced.clear()
+        if self.fsync != "none" and self.written and hasattr(os, "O_DIRECTORY"):
+            # The renames are only durable after the folder is synced
+            fd = os.open(self.folder, os.O_RDONLY | os.O_DIRECTORY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+
+    def __enter__(self) -> "DirectorySink":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+TOC_NAME = "toc.json"
+BUNDLE_PREFIX = "bundle-"
+
+
+class BundleSink(DirectorySink):
+    """Write consecutive small blocks into bundle files up to a byte and line budget.
+
+    A block which alone exceeds the budget, e.g. a large class, is written into its own file,
+    as is a bundle of a single block. Bundles are named like their first block with the prefix
+    ``bundle-``, which can't be part of a name, so they don't change if a block is appended.
+    The blocks of a bundle are separated by two blank lines. When the sink is closed the table of
+    contents :data:`TOC_NAME` is written, with the file and the lines in that file of each block::
+
+        {"version": 1, "blocks": [{"name": "my_function", "file": "bundle-MyData.py", "start_line": 14,
+        "end_line": 17}, ...]}
+
+    Parameters
+    ----------
+    folder : Path
+        Output folder, must exist
+    fsync : str
+        Sync policy, see :class:`DirectorySink`
+    hashes : Optional[Dict[str, str]]
+        Hashes of the existing output files in incremental mode
+    max_bytes : Optional[int]
+        Maximum size of a bundle in bytes
+    max_lines : Optional[int]
+        Maximum number of lines of a bundle
+    collisions : str
+        Policy for a file name written more than once, see :class:`DirectorySink`, the names of the
+        blocks in a bundle aren't changed
+    store : Optional[BlockStore]
+        Content-addressed store of the files, see :class:`DirectorySink`
+    """
+
+    def __init__(
+        self,
+        folder: Path,
+        fsync: str = "none",
+        hashes: Optional[Dict[str, str]] = None,
+        max_bytes: Optional[int] = None,
+        max_lines: Optional[int] = None,
+        collisions: str = "overwrite",
+        store: Optional["BlockStore"] = None,
+    ) -> None:
+        super().__init__(folder, fsync, hashes, collisions, store)
+        if not (max_bytes or max_lines):
+            raise ValueError("A bundle needs a byte or a line budget")
+        self.max_bytes = max_bytes or float("inf")
+        self.max_lines = max_lines or float("inf")
+        self.files: Dict[str, str] = {}
+        """Output file name per block file name"""
+        self._toc: List[Dict[str, object]] = []
+        self._pending: List[Tuple[str, bytes, int]] = []
+        self._bytes = 0
+        self._lines = 0
+
+    def write(self, name: str, data: Data) -> bool:
+        """Add a block to the current bundle, or write it into its own file if it exceeds the budget
+
+        Returns
+        -------
+        bool
+            True if a file was written, False if it's unchanged or the block is kept for the bundle
+        """
+        # The pieces of the mmap engines are only valid during the call
+        content = data if isinstance(data, bytes) else b"".join(data)
+        lines = content.count(b"\n") + (not content.endswith(b"\n"))
+        if len(content) > self.max_bytes or lines > self.max_lines:
+            self._flush()
+            return self._write_single(name, content, lines)
+        if self._pending:
+            separator = len(_separator(self._pending[-1][1]))
+            if self._bytes + separator + len(content) > self.max_bytes or self._lines + 2 + lines > self.max_lines:
+                self._flush()
+            else:
+                self._bytes += separator
+                self._lines += 2
+        self._pending.append((name, content, lines))
+        self._bytes += len(content)
+        self._lines += lines
+        self.last_name = name
+        return False
+
+    def _write_single(self, name: str, content: bytes, lines: int) -> bool:
+        """Write a block into its own file"""
+        written = super().write(name, content)
+        self._add_entry(name, 1, lines)
+        return written
+
+    def _flush(self) -> None:
+        """Write the pending blocks as bundle"""
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, []
+        self._bytes = self._lines = 0
+        if len(pending) == 1:
+            name, content, lines = pending[0]
+            self._write_single(name, content, lines)
+            return
+        folder, _, first = pending[0][0].rpartition("/")
+        bundle = f"{folder}/{BUNDLE_PREFIX}{first}" if folder else BUNDLE_PREFIX + first
+        parts: List[bytes] = []
+        entries: List[Tuple[str, int, int]] = []
+        line = 1
+        for name, content, lines in pending:
+            if parts:
+                parts.append(_separator(parts[-1]))
+                line += 2
+            parts.append(content)
+            entries.append((name, line, line + lines - 1))
+            line += lines
+        super().write(bundle, parts)
+        for name, start_line, end_line in entries:
+            self._add_entry(name, start_line, end_line)
+
+    def _add_entry(self, name: str, start_line: int, end_line: int) -> None:
+        """Add a block of the last written file to the table of contents
+
+        The file name and the lines are taken after the collision policy was applied.
+        """
+        self.files[name] = self.last_name
+        self._toc.append(
+            {
+                "name": _block_name(name),
+                "file": self.last_name,
+                "start_line": self.last_offset + start_line,
+                "end_line": self.last_offset + end_line,
+            }
+        )
+
+    def close(self) -> None:
+        """Write the last bundle and the table of contents, then sync like :class:`DirectorySink`"""
+        if self._toc or self._pending:
+            import json
+
+            self._flush()
+            super().write(TOC_NAME, json.dumps({"version": 1, "blocks": self._toc}, indent=1).encode() + b"\n")
+            self._toc = []
+        super().close()
+
+
+def _block_name(file_name: str) -> str:
+    """Name of the block of an output file name, e.g. ``MyClass.method`` of ``MyClass/method.py``"""
+    return file_name[:-3].replace("/", ".")
+
+
+def _separator(content: bytes) -> bytes:
+    """Two blank lines after the content, with its line ending"""
+    eol = b"\r\n" if content.endswith(b"\r\n") else b"\n"
+    return eol * 2 if content.endswith(b"\n") else eol * 3
+
+
+# Archive format per file name suffix, the tar formats are written as non-seekable stream
+ARCHIVE_FORMATS = {
+    "zip": ".zip",
+    "tar": ".tar",
+    "tar.gz": ".tar.gz",
+    "tgz": ".tgz",
+    "tar.bz2": ".tar.bz2",
+    "tar.xz": ".tar.xz",
+}
+_TAR_MODES = {"tar": "w|", "tar.gz": "w|gz", "tgz": "w|gz", "tar.bz2": "w|bz2", "tar.xz": "w|xz"}
+
+
+def archive_format(archive: str) -> str:
+    """Guess the archive format from the file name, stdout is written as tar stream
+
+    Raises
+    ------
+    ValueError
+        If the suffix is not a supported archive format
+    """
+    if archive == STDOUT:
+        return "tar"
+    for name, suffix in ARCHIVE_FORMATS.items():
+        if archive.endswith(suffix):
+            return name
+    raise ValueError(f"Unknown archive format of {archive}, use one of {', '.join(ARCHIVE_FORMATS.values())}")
+
+
+class ArchiveSink:
+    """Write all blocks into a single zip or tar archive with one sequential stream.
+
+    Use as context manager, the archive is finalized when the context is left::
+
+        with ArchiveSink("out.zip") as sink:
+            sink.write_blocks(iter_blocks(source_code))
+
+    Parameters
+    ----------
+    archive : str
+        File name of the archive or ``"-"`` for stdout
+    fmt : Optional[str]
+        Archive format, one of :data:`ARCHIVE_FORMATS`, guessed from the file name by default
+    """
+
+    def __init__(self, archive: str, fmt: Optional[str] = None) -> None:
+        self.archive = archive
+        self.format = fmt or archive_format(archive)
+        if self.format not in ARCHIVE_FORMATS:
+            raise ValueError(f"Unknown archive format {self.format}")
+        self.count = 0
+        self._mtime = time.time()
+        self._file: BinaryIO = sys.stdout.buffer if archive == STDOUT else open(archive, "wb")
+        # zipfile.ZipFile or tarfile.TarFile, the modules are only imported when an archive is written
+        self._zip: Optional[Any] = None
+        self._tar: Optional[Any] = None
+        if self.format == "zip":
+            import zipfile
+
+            self._zip = zipfile.ZipFile(self._file, "w", compression=zipfile.ZIP_DEFLATED)
+        else:
+            import tarfile
+
+            self._tar = tarfile.open(fileobj=self._file, mode=_TAR_MODES[self.format])
+
+    def write(self, name: str, data: bytes) -> None:
+        """Append a file to the archive
+
+        Parameters
+        ----------
+        name : str
+            Path of the file in the archive, using ``/`` as separator
+        data : bytes
+            Content of the file
+        """
+        _logger.info("NEW archive entry: %s", name)
+        if self._zip:
+            import zipfile
+
+            info = zipfile.ZipInfo(name, date_time=time.localtime(self._mtime)[:6])
+            info.compress_type = zipfile.ZIP_DEFLATED
+            info.external_attr = 0o644 << 16
+            self._zip.writestr(info, data)
+        elif self._tar:
+            import tarfile
+
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            info.mtime = int(self._mtime)
+            info.mode = 0o644
+            self._tar.addfile(info, io.BytesIO(data))
+        self.count += 1
+
+    def write_blocks(self, blocks: Iterable[Block], prefix: str = "") -> int:
+        """Append a file per block, e.g. from :func:`code_split.blocks.iter_blocks`
+
+        Parameters
+        ----------
+        blocks : Iterable[Block]
+            Blocks to be written
+        prefix : str
+            Folder of the files in the archive, e.g. ``"pkg/module"``
+
+        Returns
+        -------
+        int
+            Number of written files
+        """
+        count = 0
+        for block in blocks:
+            self.write(f"{prefix}/{block.file_name}" if prefix else block.file_name, block.file_data)
+            count += 1
+        return count
+
+    def close(self) -> None:
+        """Finalize the archive"""
+        if self._zip:
+            self._zip.close()
+        elif self._tar:
+            self._tar.close()
+        if self._file is sys.stdout.buffer:
+            self._file.flush()
+        else:
+            self._file.close()
+
+    def __enter__(self) -> "ArchiveSink":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+# Content of the NDJSON records, the text of the block or its SHA-256 hash
+NDJSON_CONTENT = ("text", "hash")
+
+
+def block_record(source: str, block: Block, content: str = "text") -> bytes:
+    """One line of JSON describing the block, encoded as UTF-8
+
+    Parameters
+    ----------
+    source : str
+        Path of the source
+    block : Block
+        Block of the source
+    content : str
+        ``"text"`` for the source code of the block or ``"hash"`` for the SHA-256 of its bytes,
+        which is the hash of the output file in the manifest of the incremental mode
+    """
+    import json
+
+    record = {
+        "source": source,
+        "name": block.name,
+        "kind": block.kind,
+        "start_line": block.start_line,
+        "end_line": block.end_line,
+    }
+    if content == "hash":
+        import hashlib
+
+        record["sha256"] = hashlib.sha256(block.data).hexdigest()
+    else:
+        # Bytes which aren't valid in the source encoding can't be represented in JSON
+        record["text"] = block.data.decode(block.encoding, "replace")
+    return json.dumps(record, ensure_ascii=False).encode("utf-8") + b"\n"
+
+
+class NdjsonSink:
+    """Stream one JSON record per block to stdout, see :func:`block_record`.
+
+    Each record is flushed as soon as the block is complete, a slow consumer blocks the split
+    once the pipe is full.
+
+    Parameters
+    ----------
+    content : str
+        ``"text"`` or ``"hash"``, one of :data:`NDJSON_CONTENT`
+    stream : Optional[BinaryIO]
+        Destination of the records, defaults to stdout
+    """
+
+    def __init__(self, content: str = "text", stream: Optional[BinaryIO] = None) -> None:
+        if content not in NDJSON_CONTENT:
+            raise ValueError(f"Unknown record content {content}, use one of {', '.join(NDJSON_CONTENT)}")
+        self.content = content
+        self.count = 0
+        self._stream = stream or sys.stdout.buffer
+
+    def write(self, record: bytes) -> None:
+        """Write a record, e.g. created by :func:`block_record` in a worker process"""
+        self._stream.write(record)
+        self._stream.flush()
+        self.count += 1
+
+    def write_blocks(self, source: str, blocks: Iterable[Block]) -> int:
+        """Write a record per block, e.g. from :func:`code_split.blocks.iter_blocks`
+
+        Returns
+        -------
+        int
+            Number of written records
+        """
+        count = 0
+        for block in blocks:
+            self.write(block_record(source, block, self.content))
+            count += 1
+        return count
+
+    def close(self) -> None:
+        self._stream.flush()
+
+    def __enter__(self) -> "NdjsonSink":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
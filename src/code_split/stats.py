@@ -0,0 +1,204 @@
+"""
+Statistics of a split run and profiling hooks
+
+The statistics are only collected if a :class:`RunStats` is passed to
+:func:`code_split.code_split.split_code`, otherwise the split only pays for the
+counters of :class:`code_split.sinks.DirectorySink`. Per source the lines scanned,
+the blocks found, the files and bytes written and the time spent reading,
+classifying and writing are reported as JSON or in the Prometheus text format.
+"""
+
+import logging
+import sys
+import time
+from pathlib import Path
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    TextIO,
+    TypeVar,
+)
+
+if TYPE_CHECKING:
+    from code_split.sinks import DirectorySink  # pragma: no cover
+
+__author__ = "Matthias Homann"
+__copyright__ = "Matthias Homann"
+__license__ = "GPL-3.0-or-later"
+
+_logger = logging.getLogger(__name__)
+
+STATS_FORMATS = ("json", "prometheus")
+_PREFIX = "code_split"
+# Prometheus help per counter, in the order of the output
+_COUNTERS = {
+    "lines": "Lines scanned",
+    "blocks": "Classes and functions found and selected",
+    "files_written": "Output files written",
+    "files_unchanged": "Output files skipped as unchanged",
+    "bytes_written": "Bytes written",
+    "read_seconds": "Time spent reading the source",
+    "classify_seconds": "Time spent classifying lines and collecting blocks",
+    "write_seconds": "Time spent writing output files",
+    "seconds": "Total time of the split",
+}
+
+Line = TypeVar("Line")
+
+
+class SourceStats:
+    """Statistics of one source.
+
+    With the mmap engines the source is read while it's classified, the read time is 0.
+    The parallel engine reports the time spent by the workers as classify time.
+    """
+
+    __slots__ = ("source", "engine") + tuple(_COUNTERS)
+
+    def __init__(self, source: str, engine: str) -> None:
+        self.source = source
+        self.engine = engine
+        self.lines = 0
+        self.blocks = 0
+        self.files_written = 0
+        self.files_unchanged = 0
+        self.bytes_written = 0
+        self.read_seconds = 0.0
+        self.classify_seconds = 0.0
+        self.write_seconds = 0.0
+        self.seconds = 0.0
+
+    def count_lines(self, lines: Iterable[Line]) -> Iterator[Line]:
+        """Pass the lines through, counting them and the time spent reading"""
+        clock = time.perf_counter
+        source = iter(lines)
+        while True:
+            start = clock()
+            line = next(source, None)
+            self.read_seconds += clock() - start
+            if line is None:
+                return
+            self.lines += 1
+            yield line
+
+    def finish(self, sink: "DirectorySink", blocks: int, seconds: float) -> None:
+        """Take the counters of the sink, the time not spent reading or writing was spent classifying"""
+        self.blocks = blocks
+        self.files_written = sink.files_written
+        self.files_unchanged = sink.files_unchanged
+        self.bytes_written = sink.bytes_written
+        self.write_seconds = sink.write_seconds
+        self.seconds = seconds
+        self.classify_seconds = max(0.0, seconds - self.read_seconds - self.write_seconds)
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {attribute: getattr(self, attribute) for attribute in self.__slots__}
+
+
+def count_file_lines(path: Path) -> int:
+    """Number of lines of a file, a last line without line ending is counted as well"""
+    lines = 0
+    last = b"\n"
+    with path.open("rb") as file:
+        for chunk in iter(lambda: file.read(2**20), b""):
+            lines += chunk.count(b"\n")
+            last = chunk[-1:]
+    return lines + (last != b"\n")
+
+
+class RunStats:
+    """Statistics of all sources split in a run, see :class:`SourceStats`"""
+
+    def __init__(self) -> None:
+        self.sources: List[SourceStats] = []
+
+    def add(self, source: str, engine: str) -> SourceStats:
+        """Start the statistics of a source"""
+        stats = SourceStats(source, engine)
+        self.sources.append(stats)
+        return stats
+
+    def totals(self) -> Dict[str, Any]:
+        """Sum of the counters of all sources"""
+        totals: Dict[str, Any] = {name: sum(getattr(stats, name) for stats in self.sources) for name in _COUNTERS}
+        totals["sources"] = len(self.sources)
+        return totals
+
+    def to_json(self) -> str:
+        import json
+
+        return json.dumps({"sources": [stats.as_dict() for stats in self.sources], "totals": self.totals()}, indent=1)
+
+    def to_prometheus(self) -> str:
+        """Counters per source in the Prometheus text exposition format"""
+        lines = []
+        for name, description in _COUNTERS.items():
+            metric = f"{_PREFIX}_{name}_total"
+            lines += [f"# HELP {metric} {description}", f"# TYPE {metric} counter"]
+            for stats in self.sources:
+                source = stats.source.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+                lines.append(f'{metric}{{source="{source}",engine="{stats.engine}"}} {getattr(stats, name)}')
+        return "\n".join(lines) + "\n"
+
+    def write(self, stats_format: str, stream: TextIO) -> None:
+        """Write the statistics as ``"json"`` or ``"prometheus"`` text"""
+        if stats_format not in STATS_FORMATS:
+            raise ValueError(f"Unknown statistics format {stats_format}, use one of {', '.join(STATS_FORMATS)}")
+        stream.write(self.to_json() + "\n" if stats_format == "json" else self.to_prometheus())
+
+
+class Profiler:
+    """Optional cProfile and tracemalloc hooks around a run, use as context manager.
+
+    Parameters
+    ----------
+    profile : Optional[str]
+        Save the cProfile statistics to this file, e.g. to be viewed with ``python -m pstats``
+    trace_memory : bool
+        Trace the memory allocations, the peak and the top allocation sites are reported at the end
+    stream : Optional[TextIO]
+        Stream for the report, defaults to stderr
+    top : int
+        Number of allocation sites reported
+    """
+
+    def __init__(
+        self, profile: Optional[str] = None, trace_memory: bool = False, stream: Optional[TextIO] = None, top: int = 10
+    ) -> None:
+        self.profile = profile
+        self.trace_memory = trace_memory
+        self.stream = stream or sys.stderr
+        self.top = top
+        self._profiler = None
+
+    def __enter__(self) -> "Profiler":
+        if self.trace_memory:
+            import tracemalloc
+
+            tracemalloc.start()
+        if self.profile:
+            import cProfile
+
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        if self._profiler:
+            self._profiler.disable()
+            self._profiler.dump_stats(self.profile)
+            print(f"Saved profile to {self.profile}", file=self.stream)
+        if self.trace_memory:
+            import tracemalloc
+
+            snapshot = tracemalloc.take_snapshot()
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            print(f"Peak traced memory {peak / 2**20:.2f} MB", file=self.stream)
+            for statistic in snapshot.statistics("lineno")[: self.top]:
+                print(statistic, file=self.stream)
@@ -0,0 +1,112 @@
+"""
+Content-addressed store of the output files
+
+Each distinct block is stored once as ``<store>/<hash[:2]>/<hash>.py``, named by the SHA-256
+hash of its content, and the output files in the destination folders are hard links to the
+stored blocks. Identical helpers copied across many sources of a tree take the space of one
+file, and the hash of each output file in the manifest of the incremental mode is the key of
+its stored block. Symbolic links are used if the store is on another file system.
+
+The stored blocks are shared, so the output files must not be edited in place. Blocks which
+are no longer linked from any output folder are kept until the store is deleted.
+"""
+
+import logging
+import os
+from pathlib import Path
+from typing import Sequence, Union
+
+__author__ = "Matthias Homann"
+__copyright__ = "Matthias Homann"
+__license__ = "GPL-3.0-or-later"
+
+_logger = logging.getLogger(__name__)
+
+STORE_NAME = ".code_split_store"
+"""Default folder of the store in the output folder"""
+
+
+class BlockStore:
+    """Folder of blocks named by their hash, shared by the sinks of a run and across runs.
+
+    Concurrent processes may add the same block, each block is written into a temporary
+    file which is then atomically renamed, so the store never has a partial block.
+
+    Parameters
+    ----------
+    root : Path
+        Folder of the store, created if missing
+    """
+
+    def __init__(self, root: Path) -> None:
+        self.root = root
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.blocks_written = 0
+        self.bytes_written = 0
+
+    def path(self, digest: str) -> Path:
+        """Path of the stored block with this hash"""
+        return self.root.joinpath(digest[:2], f"{digest}.py")
+
+    def add(self, digest: str, pieces: Sequence[Union[bytes, memoryview]], sync: bool = False) -> Path:
+        """Store a block unless it's already stored
+
+        Parameters
+        ----------
+        digest : str
+            SHA-256 hash of the content as hex string
+        pieces : Sequence[Union[bytes, memoryview]]
+            Content of the block as bytes-like pieces
+        sync : bool
+            Sync a new block to disk before it's renamed
+
+        Returns
+        -------
+        Path
+            Path of the stored block
+        """
+        path = self.path(digest)
+        if path.is_file():
+            return path
+        path.parent.mkdir(exist_ok=True)
+        tmp_path = path.with_name(f".{digest}.{os.urandom(6).hex()}.tmp")
+        # os.open() instead of tempfile to get the default file permissions
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, "O_BINARY", 0), 0o666)
+        try:
+            with os.fdopen(fd, "wb") as file:
+                file.writelines(pieces)
+                if sync:
+                    file.flush()
+                    os.fsync(file.fileno())
+            os.replace(tmp_path, path)
+        except BaseException:
+            tmp_path.unlink()
+            raise
+        _logger.debug("Stored block %s", digest)
+        self.blocks_written += 1
+        self.bytes_written += sum(map(len, pieces))
+        return path
+
+    def link(self, stored: Path, path: Path) -> None:
+        """Atomically replace the file with a link to the stored block
+
+        A hard link is used if possible, else a relative symbolic link.
+        """
+        tmp_path = path.with_name(f".{path.name}.{os.urandom(6).hex()}.tmp")
+        try:
+            os.link(stored, tmp_path)
+        except OSError:
+            # Another file system or no hard links supported
+            os.symlink(os.path.relpath(stored, path.parent), tmp_path)
+        try:
+            os.replace(tmp_path, path)
+        except BaseException:
+            tmp_path.unlink()
+            raise
+
+    def is_linked(self, stored: Path, path: Path) -> bool:
+        """Check if the file is already a link to the stored block"""
+        try:
+            return stored.is_file() and os.path.samefile(stored, path)
+        except OSError:
+            return False
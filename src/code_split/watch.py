@@ -0,0 +1,374 @@
+"""
+Watch the inputs and split changed source files again
+
+The inputs are watched with inotify on Linux, other systems fall back to polling the
+size and mtime of the sources. Bursts of events, e.g. an editor writing a temporary file
+and renaming it, are coalesced by waiting until no further event arrives for the debounce
+time. The hash of each source and of each of its blocks is kept in memory, so only sources
+with a changed content are split and only changed blocks are written.
+"""
+
+import ctypes
+import ctypes.util
+import hashlib
+import logging
+import os
+import select
+import struct
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+from code_split.batch import collect_tree, is_glob
+from code_split.blocks import Select, iter_blocks
+from code_split.sinks import DirectorySink
+
+__author__ = "Matthias Homann"
+__copyright__ = "Matthias Homann"
+__license__ = "GPL-3.0-or-later"
+
+_logger = logging.getLogger(__name__)
+
+# inotify event masks, see inotify(7)
+IN_CLOSE_WRITE = 0x8
+IN_MOVED_FROM = 0x40
+IN_MOVED_TO = 0x80
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_Q_OVERFLOW = 0x4000
+IN_ISDIR = 0x40000000
+_WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+_EVENT = struct.Struct("iIII")
+
+
+class SourceState(NamedTuple):
+    """Last split of a source: output folder, size and mtime, content hash and hash per output file"""
+
+    output: Path
+    stat: Tuple[int, int]
+    sha256: str
+    blocks: Dict[str, str]
+
+
+class _Inotify:
+    """Minimal inotify binding using ctypes, reports the paths of the events in the watched folders
+
+    Raises
+    ------
+    OSError
+        If inotify isn't available
+    """
+
+    def __init__(self) -> None:
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        if not hasattr(libc, "inotify_init1"):
+            raise OSError("inotify isn't available")
+        self._libc = libc
+        self._fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self._folders: Dict[int, Path] = {}
+        self._watched: Set[Path] = set()
+
+    def add(self, folder: Path) -> None:
+        """Watch the folder, events of files in sub-folders need their own watch"""
+        if folder in self._watched:
+            return
+        descriptor = self._libc.inotify_add_watch(self._fd, os.fsencode(folder), _WATCH_MASK)
+        if descriptor < 0:
+            _logger.warning("Can't watch folder %s: %s", folder, os.strerror(ctypes.get_errno()))
+            return
+        self._folders[descriptor] = folder
+        self._watched.add(folder)
+
+    def wait(self, timeout: float) -> Optional[Set[Path]]:
+        """Paths of the events within the timeout, None if events were lost"""
+        if not select.select([self._fd], [], [], timeout)[0]:
+            return set()
+        data = os.read(self._fd, 2**16)
+        paths = set()
+        pos = 0
+        while pos < len(data):
+            descriptor, mask, _, size = _EVENT.unpack_from(data, pos)
+            name = data[pos + _EVENT.size : pos + _EVENT.size + size].rstrip(b"\0")
+            pos += _EVENT.size + size
+            if mask & IN_Q_OVERFLOW:
+                return None
+            folder = self._folders.get(descriptor)
+            if folder is None or not name:
+                continue
+            path = folder.joinpath(os.fsdecode(name))
+            paths.add(path)
+            if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+                # New sub-folders are only watched after the scan, report their content as changed
+                paths.update(self.add_tree(path))
+        return paths
+
+    def add_tree(self, folder: Path) -> List[Path]:
+        """Watch the folder and all sub-folders, returns the files found"""
+        files = []
+        for root, _, names in os.walk(folder):
+            self.add(Path(root))
+            files += [Path(root, name) for name in names]
+        return files
+
+    def close(self) -> None:
+        os.close(self._fd)
+
+
+class _Polling:
+    """Polling fallback, reports the sources with a changed size or mtime"""
+
+    def __init__(self, watcher: "Watcher", interval: float) -> None:
+        self._watcher = watcher
+        self._interval = interval
+        self._next_scan = 0.0
+        self._stats: Dict[Path, Tuple[int, int]] = {}
+
+    def add(self, folder: Path) -> None:
+        pass
+
+    def add_tree(self, folder: Path) -> List[Path]:
+        return []
+
+    def wait(self, timeout: float) -> Optional[Set[Path]]:
+        time.sleep(max(0.0, min(timeout, self._next_scan - time.monotonic())))
+        if time.monotonic() < self._next_scan:
+            return set()
+        self._next_scan = time.monotonic() + self._interval
+        stats = {}
+        for src in self._watcher.scan():
+            try:
+                stat = src.stat()
+            except FileNotFoundError:
+                continue
+            stats[src] = (stat.st_size, stat.st_mtime_ns)
+        changed = {src for src, stat in stats.items() if self._stats.get(src) != stat}
+        changed.update(self._stats.keys() - stats.keys())
+        self._stats = stats
+        return changed
+
+    def close(self) -> None:
+        pass
+
+
+class Watcher:
+    """Split the sources found in the inputs and split them again when they change.
+
+    A single file is split into the output folder, directories, glob patterns or several
+    files are split like in batch mode, with a sub-folder per source.
+
+    Parameters
+    ----------
+    inputs : Iterable[str]
+        Files, directories or glob patterns
+    folder : Optional[str]
+        Output folder for the new files, defaults to the current working directory
+    debounce : float
+        Seconds without further events before the changed sources are split
+    interval : float
+        Seconds between two scans if inotify isn't available
+    use_inotify : Optional[bool]
+        Force inotify (True) or polling (False), by default inotify is used if available
+    fsync : str
+        Fsync policy of the output files, see :class:`code_split.sinks.DirectorySink`
+    index : Optional[str]
+        Path of the symbol index to be updated, see :func:`code_split.code_split.split_code`
+    select : Optional[Select]
+        Only split the selected blocks, see :func:`code_split.blocks.iter_blocks`
+    collisions : str
+        Policy for blocks with the same name, see :class:`code_split.sinks.DirectorySink`
+    store : Optional[str]
+        Path of a content-addressed store, ``""`` for the default store in the output folder,
+        see :mod:`code_split.store`
+    depth : int
+        Levels of classes whose members are split, see :func:`code_split.blocks.iter_blocks`
+    """
+
+    def __init__(
+        self,
+        inputs: Iterable[str],
+        folder: Optional[str],
+        debounce: float = 0.2,
+        interval: float = 1.0,
+        use_inotify: Optional[bool] = None,
+        fsync: str = "none",
+        index: Optional[str] = None,
+        select: Optional[Select] = None,
+        collisions: str = "overwrite",
+        store: Optional[str] = None,
+        depth: int = 1,
+    ) -> None:
+        from code_split.code_split import is_batch
+
+        self.inputs = [str(Path.cwd().joinpath(item)) for item in inputs]
+        self.output = Path.cwd().joinpath(folder) if folder else Path.cwd()
+        self.batch = is_batch(self.inputs)
+        self.debounce = debounce
+        self.fsync = fsync
+        self.index = index
+        self.select = select
+        self.collisions = collisions
+        self.depth = depth
+        self.store = None
+        if store is not None:
+            from code_split.store import STORE_NAME, BlockStore
+
+            self.store = BlockStore(Path.cwd().joinpath(store or self.output.joinpath(STORE_NAME)))
+        self.states: Dict[Path, SourceState] = {}
+        self.splits = 0
+        """Number of splits, sources with unchanged content are not counted"""
+        self._events = None
+        if use_inotify is not False:
+            try:
+                self._events = _Inotify()
+            except (OSError, AttributeError, TypeError) as err:
+                if use_inotify:
+                    raise
+                _logger.info("Polling the inputs, inotify isn't available: %s", err)
+        if self._events is None:
+            self._events = _Polling(self, interval)
+
+    def scan(self) -> Dict[Path, Path]:
+        """Output folder per source file currently found in the inputs"""
+        sources = {}
+        # The results of a previous run are skipped if the output folder is part of the input tree
+        for src, base in collect_tree(self.inputs, self.output):
+            sources[src] = self.output.joinpath(src.relative_to(base).with_suffix("")) if self.batch else self.output
+        return sources
+
+    def _watch_inputs(self) -> None:
+        """Watch the folders of the inputs, directories with all their sub-folders"""
+        for item in self.inputs:
+            path = Path(item)
+            if is_glob(item):
+                from code_split.batch import _glob_base
+
+                self._events.add_tree(_glob_base(item))
+            elif path.is_dir():
+                self._events.add_tree(path)
+            else:
+                self._events.add(path.parent)
+
+    def split(self, src: Path, output: Path) -> bool:
+        """Split the source if its content changed since the last split
+
+        Returns
+        -------
+        bool
+            True if the source was split
+        """
+        state = self.states.get(src)
+        try:
+            stat = src.stat()
+            if state and state.stat == (stat.st_size, stat.st_mtime_ns):
+                return False
+            data = src.read_bytes()
+        except FileNotFoundError:
+            return False
+        digest = hashlib.sha256(data).hexdigest()
+        if state and state.sha256 == digest:
+            _logger.debug("Skip unchanged input file %s", src)
+            self.states[src] = state._replace(stat=(stat.st_size, stat.st_mtime_ns))
+            return False
+        _logger.info("Split %s", src)
+        output.mkdir(parents=True, exist_ok=True)
+        symbols = [] if self.index is not None else None
+        try:
+            # Existing files are compared with the new blocks, so unchanged outputs aren't written
+            blocks = dict(state.blocks) if state else {}
+            with DirectorySink(output, self.fsync, blocks, self.collisions, self.store) as sink:
+                for block in iter_blocks(data, self.select, self.depth):
+                    sink.write(block.file_name, block.file_data)
+                    if symbols is not None:
+                        from code_split.index import Symbol
+
+                        symbols.append(Symbol.from_block(block)._replace(output=sink.last_name))
+        except ValueError as err:
+            # Unknown encoding, a name which can't be decoded or a name collision
+            _logger.error("Failed to split %s: %s", src, err)
+            return False
+        if state:
+            self._remove(output, state.blocks.keys() - sink.written.keys())
+        if symbols is not None:
+            from code_split.code_split import _open_index
+
+            with _open_index(self.index, self.output) as symbol_index:
+                symbol_index.replace(str(src), output, symbols)
+        self.states[src] = SourceState(output, (stat.st_size, stat.st_mtime_ns), digest, sink.written)
+        self.splits += 1
+        return True
+
+    def _remove(self, output: Path, names: Iterable[str]) -> None:
+        for name in sorted(names):
+            _logger.info("Remove output file %s", output.joinpath(name))
+            try:
+                output.joinpath(name).unlink()
+            except FileNotFoundError:
+                pass
+
+    def update(self, changed: Optional[Set[Path]] = None) -> List[Path]:
+        """Split the changed and new sources and remove the outputs of deleted sources
+
+        Parameters
+        ----------
+        changed : Optional[Set[Path]]
+            Paths reported as changed, all sources are checked if None
+
+        Returns
+        -------
+        List[Path]
+            Sources which were split
+        """
+        sources = self.scan()
+        split = []
+        for src, output in sources.items():
+            if (changed is None or src in changed or src not in self.states) and self.split(src, output):
+                split.append(src)
+        for src in self.states.keys() - sources.keys():
+            _logger.info("Input file %s was removed", src)
+            state = self.states.pop(src)
+            self._remove(state.output, state.blocks)
+        return split
+
+    def run(self, stop: Optional[threading.Event] = None) -> None:
+        """Split all sources and watch them until stopped
+
+        Parameters
+        ----------
+        stop : Optional[threading.Event]
+            Event to stop watching, runs until interrupted by default
+        """
+        stop = stop or threading.Event()
+        self._watch_inputs()
+        self.update()
+        _logger.info("Watching %d input files", len(self.states))
+        try:
+            while not stop.is_set():
+                changed = self._events.wait(0.5)
+                if changed == set():
+                    continue
+                # Coalesce bursts of events, the sources are split once no further event arrives
+                while changed is not None:
+                    more = self._events.wait(self.debounce)
+                    if more is None:
+                        # Events were lost, check all sources
+                        changed = None
+                    if not more:
+                        break
+                    changed |= more
+                self.update(changed)
+        finally:
+            self._events.close()
+
+
+def watch(inputs: Iterable[str], folder: Optional[str], debounce: float = 0.2, **options) -> None:
+    """Split the sources found in the inputs and split them again when they change, until interrupted
+
+    See :class:`Watcher` for the parameters.
+    """
+    try:
+        Watcher(inputs, folder, debounce, **options).run()
+    except KeyboardInterrupt:
+        pass
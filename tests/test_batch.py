@@ -0,0 +1,94 @@
+import os
+
+from fixtures.sample_data import code
+
+from code_split.batch import collect_sources, split_tree
+from code_split.code_split import main
+
+__author__ = "Matthias Homann"
+__copyright__ = "Matthias Homann"
+__license__ = "GPL-3.0-or-later"
+
+
+def make_tree(root):
+    """Create a source tree with the sample code in several (sub-)folders and one broken file"""
+    for rel in ("mod_a.py", "pkg/mod_b.py", "pkg/sub/mod_c.py"):
+        src = root / rel
+        src.parent.mkdir(parents=True, exist_ok=True)
+        src.write_text("".join(code.values()))
+    (root / "pkg" / "broken.py").write_bytes(b"# -*- coding: no-such-codec -*-\ndef broken():\n    pass\n")
+    (root / "pkg" / "notes.txt").write_text("def not_python():\n")
+
+
+def assert_split(folder):
+    for name, value in code.items():
+        if not name.startswith("skip"):
+            assert (folder / f"{name}.py").read_text() == value
+
+
+def test_collect_sources(tmp_path):
+    """Directories are searched recursively and the result is sorted"""
+    make_tree(tmp_path)
+    os.chdir(tmp_path)
+    sources = collect_sources([".", "pkg/*.py"])
+    assert [src.relative_to(tmp_path).as_posix() for src, _ in sources] == [
+        "mod_a.py",
+        "pkg/broken.py",
+        "pkg/mod_b.py",
+        "pkg/sub/mod_c.py",
+    ]
+    assert all(base == tmp_path for _, base in sources)
+
+
+def test_split_tree(tmp_path):
+    """Test split_tree with a process pool, the broken file must not stop the run"""
+    src = tmp_path / "src"
+    make_tree(src)
+    out = tmp_path / "out"
+    results = split_tree([str(src)], str(out), workers=2)
+    assert list(results) == sorted(results)
+    assert results[src / "pkg" / "broken.py"].startswith("ValueError: Unknown encoding")
+    assert [error for error in results.values() if error] == [results[src / "pkg" / "broken.py"]]
+    assert_split(out / "mod_a")
+    assert_split(out / "pkg" / "mod_b")
+    assert_split(out / "pkg" / "sub" / "mod_c")
+
+
+def test_split_tree_glob(tmp_path):
+    """Glob patterns mirror the layout relative to the part without wildcards"""
+    make_tree(tmp_path)
+    os.chdir(tmp_path)
+    results = split_tree(["pkg/**/mod_*.py"], "out", workers=1)
+    assert len(results) == 2
+    assert_split(tmp_path / "out" / "mod_b")
+    assert_split(tmp_path / "out" / "sub" / "mod_c")
+
+
+def test_split_tree_skip_output(tmp_path):
+    """Results of a previous run in the output folder aren't split again"""
+    make_tree(tmp_path)
+    os.chdir(tmp_path)
+    split_tree(["."], "out", workers=1)
+    results = split_tree(["."], "out", workers=1)
+    assert len(results) == 4
+    # Also if the output folder is the root of the input tree, e.g. without destination folder
+    root = tmp_path / "root"
+    make_tree(root)
+    os.chdir(root)
+    for _ in range(2):
+        assert len(split_tree(["."], None, workers=1)) == 4
+    assert_split(root / "pkg" / "mod_b")
+    assert not (root / "pkg" / "mod_b" / "MyData").exists()
+    assert len(split_tree([str(root / "pkg")], str(root / "pkg"), workers=1)) == 3
+
+
+def test_main_batch(tmp_path, caplog):
+    """CLI batch mode returns an error status if any file failed"""
+    make_tree(tmp_path)
+    os.chdir(tmp_path)
+    assert main(["-i", "mod_a.py", "pkg/sub", "-f", "out"]) == 0
+    assert_split(tmp_path / "out" / "mod_a")
+    assert_split(tmp_path / "out" / "mod_c")
+    assert main(["-i", "pkg", "missing.py", "-f", "out2", "-j", "2"]) == 1
+    assert "Failed to split" in caplog.text
+    assert_split(tmp_path / "out2" / "sub" / "mod_c")
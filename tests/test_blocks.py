@@ -0,0 +1,153 @@
+import io
+
+import pytest
+from fixtures.sample_data import code
+
+from code_split.blocks import Block, iter_blocks, split_blocks
+
+__author__ = "Matthias Homann"
+__copyright__ = "Matthias Homann"
+__license__ = "GPL-3.0-or-later"
+
+SOURCE = "".join(code.values())
+
+
+@pytest.mark.parametrize(
+    "source",
+    [
+        pytest.param(SOURCE, id="str"),
+        pytest.param(SOURCE.encode(), id="bytes"),
+        pytest.param(io.StringIO(SOURCE), id="text-file"),
+        pytest.param(io.BytesIO(SOURCE.encode()), id="binary-file"),
+        pytest.param(SOURCE.splitlines(keepends=True), id="lines"),
+    ],
+)
+def test_split_blocks(source):
+    """All kinds of sources give the same blocks as the sample data"""
+    blocks = split_blocks(source)
+    expected = {name: value for name, value in code.items() if not name.startswith("skip")}
+    assert [block.name for block in blocks] == list(expected)
+    assert [block.text for block in blocks] == list(expected.values())
+    assert [block.kind for block in blocks] == ["class", "class", "def", "def"]
+    assert blocks[0].file_name == "MyData.py"
+
+
+def test_block_spans():
+    """Line numbers and byte offsets match the position of the block in the source"""
+    lines = SOURCE.splitlines(keepends=True)
+    for block in iter_blocks(SOURCE):
+        assert "".join(lines[block.start_line - 1 : block.end_line]) == block.text
+        assert SOURCE.encode()[block.start_offset : block.end_offset].decode() == block.text
+
+
+def test_block_spans_non_ascii():
+    """Byte offsets count the UTF-8 encoded size"""
+    header = "# Größe\nx = 'ä'\n\n"
+    text = "@decorator\ndef größe():\n    return 'ß'\n"
+    (block,) = split_blocks(header + text)
+    assert block == Block("größe", "def", 4, 6, len(header.encode()), len((header + text).encode()), text)
+    assert block.start_offset == len(header) + 3
+
+
+def test_iter_blocks_lazy():
+    """Blocks are yielded as soon as they end, the remaining source isn't consumed"""
+    consumed = []
+
+    def lines():
+        for line in SOURCE.splitlines(keepends=True):
+            consumed.append(line)
+            yield line
+
+    blocks = iter_blocks(lines())
+    assert next(blocks).name == "MyData"
+    assert len(consumed) < len(SOURCE.splitlines())
+
+
+def test_iter_blocks_path(tmp_path):
+    """A path is scanned without reading the blocks, the data is read from the file when it's used"""
+    src = tmp_path / "test_code.py"
+    src.write_bytes(SOURCE.encode())
+    blocks = split_blocks(src)
+    assert [(block._data, block._text) for block in blocks] == [(None, None)] * len(blocks)
+    assert blocks == split_blocks(SOURCE)
+    assert blocks[0].data == code["MyData"].encode()
+    (tmp_path / "empty.py").touch()
+    assert split_blocks(tmp_path / "empty.py") == []
+
+
+@pytest.mark.parametrize("kind", ["str", "bytes", "path"])
+def test_block_leading_lines(tmp_path, kind):
+    """The comment and the decorators in front of the header are available without splitting the whole text"""
+    source = "# comment\n# second line\n@decorator\n@other(1)\ndef f():\n    pass\n\n\nclass C:\n    pass\n"
+    if kind == "path":
+        src = tmp_path / "source.py"
+        src.write_text(source)
+        function, cls = iter_blocks(src)
+    else:
+        function, cls = iter_blocks(source if kind == "str" else source.encode())
+    assert function.comment == "# comment\n# second line\n"
+    assert function.decorators == ("@decorator", "@other(1)")
+    assert (cls.comment, cls.decorators) == ("", ())
+
+
+NESTED = '''# The class
+class Outer(
+    Base,
+):
+    """Docstring"""
+
+    attribute = 1
+
+    # Leading comment
+    def method(self):
+        return 1
+
+    @property
+    @cached(
+        size=1,
+    )
+    def value(self):
+        return 2
+
+    class Inner:
+        inner = 3
+
+        async def run(self):
+            pass
+
+    last = 4
+
+
+def function():
+    pass
+'''
+
+
+@pytest.mark.parametrize("source", [NESTED, NESTED.encode()], ids=["str", "bytes"])
+def test_iter_blocks_depth(source):
+    """Members are split in the same pass with their own comments and decorators, the class keeps the rest"""
+    blocks = {block.name: block for block in iter_blocks(source, depth=2)}
+    assert list(blocks) == ["Outer.method", "Outer.value", "Outer.Inner", "Outer", "function"]
+    assert blocks["Outer.method"].text == "    # Leading comment\n    def method(self):\n        return 1\n"
+    assert blocks["Outer.method"].comment == "    # Leading comment\n"
+    assert (blocks["Outer.method"].start_line, blocks["Outer.method"].end_line) == (9, 11)
+    assert blocks["Outer.value"].decorators == ("@property", "@cached(", "size=1,", ")")
+    assert blocks["Outer.Inner"].file_name == "Outer/Inner.py"
+    assert blocks["Outer.Inner"].kind == "class"
+    assert blocks["Outer"].text == (
+        '# The class\nclass Outer(\n    Base,\n):\n    """Docstring"""\n\n    attribute = 1\n\n    last = 4\n'
+    )
+    assert (blocks["Outer"].start_line, blocks["Outer"].end_line) == (1, 26)
+    assert blocks["function"].text == "def function():\n    pass\n"
+    nested = split_blocks(source, depth=3)
+    assert [block.name for block in nested][2:4] == ["Outer.Inner.run", "Outer.Inner"]
+    assert nested[2].kind == "async def"
+    assert nested[3].text == "    class Inner:\n        inner = 3\n"
+    assert split_blocks(source, depth=1) == split_blocks(source)
+
+
+def test_iter_blocks_depth_select():
+    """Members which aren't selected stay in their class"""
+    blocks = split_blocks(NESTED, lambda name, kind, decorated: not name.endswith(".value"), depth=2)
+    assert [block.name for block in blocks] == ["Outer.method", "Outer.Inner", "Outer", "function"]
+    assert "    @property\n    @cached(\n        size=1,\n    )\n    def value(self):\n" in blocks[2].text
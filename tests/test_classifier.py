@@ -0,0 +1,71 @@
+import pytest
+
+from code_split.classifier import (
+    BLANK,
+    CODE,
+    COMMENT,
+    CONTINUATION,
+    DECORATOR,
+    HEADER,
+    classify,
+    classify_bytes,
+    header_kind,
+)
+from code_split.code_split import split_blocks
+
+__author__ = "Matthias Homann"
+__copyright__ = "Matthias Homann"
+__license__ = "GPL-3.0-or-later"
+
+LINES = [
+    ("\n", BLANK),
+    ("    \t\n", BLANK),
+    ("@dataclass\n", DECORATOR),
+    ("def my_function(data: MyData) -> str:\n", HEADER),
+    ("class MyData:\n", HEADER),
+    ("async def fetch():\n", HEADER),
+    ("async  def  fetch():\n", HEADER),
+    ("    return value\n", CONTINUATION),
+    (") -> None:\n", CONTINUATION),
+    ("# Main code starts here\n", COMMENT),
+    ("print('main code')\n", CODE),
+    ("default = 1\n", CODE),
+    ("classes = []\n", CODE),
+    ("async_mode = True\n", CODE),
+    ("\tindented_by_tab()\n", CODE),
+]
+
+
+@pytest.mark.parametrize("line, kind", LINES)
+def test_classify(line, kind):
+    """str and bytes lines are classified the same"""
+    assert classify(line)[0] == kind
+    data = b"x = 0\n" + line.encode() + b"y = 1\n"
+    assert classify_bytes(data, 6, 6 + len(line.encode()))[0] == kind
+
+
+@pytest.mark.parametrize(
+    "line, kind, name",
+    [
+        ("def my_function(data):\n", "def", "my_function"),
+        ("class MyData(Base):\n", "class", "MyData"),
+        ("async def fetch():\n", "async def", "fetch"),
+        ("def größe():\n", "def", "größe"),
+    ],
+)
+def test_header(line, kind, name):
+    """Kind and name of header lines"""
+    _, match = classify(line)
+    assert header_kind(match) == kind
+    assert match.group("name") == name
+    _, match = classify_bytes(line.encode(), 0, len(line.encode()))
+    assert header_kind(match) == kind
+    assert match.group("name").decode() == name
+
+
+def test_split_async_def():
+    """async def functions are split like other functions"""
+    source = "import asyncio\n\n# Fetch data\nasync def fetch():\n    await asyncio.sleep(1)\n\nfetch()\n"
+    (block,) = split_blocks(source)
+    assert (block.name, block.kind) == ("fetch", "async def")
+    assert block.text == "# Fetch data\nasync def fetch():\n    await asyncio.sleep(1)\n"
@@ -1,13 +1,18 @@
+import io
 import logging
 import os
+import subprocess
 import sys
+import time
 from pathlib import Path
 
 import pytest
 from fixtures.sample_data import code
 
 from code_split import __version__
-from code_split.code_split import main, run
+from code_split.batch import split_tree
+from code_split.code_split import _split_lines, main, run, split_code
+from code_split.sinks import DirectorySink
 
 __author__ = "Matthias Homann"
 __copyright__ = "Matthias Homann"
@@ -201,3 +206,244 @@ def test_code_split_single_def(tmp_path):
             my_data = d / f"{name}.py"
             assert my_data.read_text() == value
             break
+
+
+def test_code_split_stdin(tmp_path, monkeypatch):
+    """Test code_split reading the source code from stdin
+
+    Parameters
+    ----------
+    tmp_path : Path
+        Temp path fixture
+    monkeypatch : fixture
+    """
+    monkeypatch.setattr(sys, "stdin", io.StringIO("".join(code.values())))
+    main(["-i", "-", "-f", str(tmp_path)])
+    for name, value in code.items():
+        if not name.startswith("skip"):
+            my_data = tmp_path / f"{name}.py"
+            assert my_data.read_text() == value
+
+
+@pytest.mark.parametrize("engine", ["stream", "mmap", "parallel"])
+def test_code_split_depth(tmp_path, engine):
+    """Test code_split writing the methods into the folder of their class
+
+    Parameters
+    ----------
+    tmp_path : Path
+        Temp path fixture
+    engine : str
+        Split engine, the mmap engines fall back to the stream engine
+    """
+    src = tmp_path / "test_code.py"
+    src.write_text("".join(code.values()))
+    out = tmp_path / "out"
+    assert main(["-i", str(src), "-f", str(out), "-e", engine, "--depth", "2", "--incremental"]) == 0
+    assert (out / "SampleClass" / "__init__.py").read_text() == (
+        "    def __init__(self, value: str) -> None:\n        self.value = value\n"
+    )
+    assert (out / "SampleClass" / "output.py").read_text().startswith("    def output(self) -> str:\n")
+    # The class keeps the lines in front of the first method
+    assert (out / "MyData.py").read_text() == code["MyData"][: code["MyData"].index("\n    def")]
+    assert (out / "my_function.py").read_text() == code["my_function"]
+    # The members are removed when the depth is reduced
+    assert main(["-i", str(src), "-f", str(out), "-e", engine, "--incremental"]) == 0
+    assert not (out / "MyData" / "birthday.py").exists()
+    assert (out / "MyData.py").read_text() == code["MyData"]
+
+
+def test_code_split_engine_fallback(tmp_path, caplog):
+    """Options which the engine doesn't support fall back to another engine with a warning"""
+    src = tmp_path / "test_code.py"
+    src.write_text("".join(code.values()))
+    split_code(str(src), str(tmp_path / "out"), engine="parallel", bundle_lines=10)
+    assert caplog.messages == ["The parallel engine can't write bundles or handle collisions, using the mmap engine"]
+    caplog.clear()
+    split_code(str(src), str(tmp_path / "out"), engine="mmap", depth=2)
+    assert caplog.messages == ["The mmap engine can't split the members of classes, using the stream engine"]
+    caplog.clear()
+    # Only once in batch mode
+    src.with_name("other.py").write_text("".join(code.values()))
+    split_tree([str(src), str(src.with_name("other.py"))], str(tmp_path / "tree"), 1, engine="mmap", depth=2)
+    assert caplog.messages == ["The mmap engine can't split the members of classes, using the stream engine"]
+
+
+@pytest.mark.parametrize("depth", ["0", "-1", "two"])
+def test_main_depth_invalid(capsys, depth):
+    """The depth must be an integer of at least 1"""
+    with pytest.raises(SystemExit) as pytest_exit:
+        main(["-i", "test_code.py", "--depth", depth])
+    assert "must be an integer of at least 1" in capsys.readouterr().err
+    assert pytest_exit.value.code == 2
+
+
+def test_code_split_stream_memory(tmp_path):
+    """Test that the peak memory doesn't scale with the input size
+
+    A synthetic source is piped into ``code_split -i -`` and the growth of the max. RSS
+    of the process is compared with the input size.
+    The size in MB can be changed with the environment variable ``CODE_SPLIT_STREAM_MB``,
+    e.g. to test with multi-GB input.
+
+    Parameters
+    ----------
+    tmp_path : Path
+        Temp path fixture
+    """
+    size = int(os.environ.get("CODE_SPLIT_STREAM_MB", "32")) * 2**20
+    script = (
+        "import resource, sys\n"
+        "from code_split.code_split import main\n"
+        "print(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)\n"
+        f"main(['-i', '-', '-f', {str(tmp_path)!r}])\n"
+        "print(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)\n"
+    )
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+    proc = subprocess.Popen([sys.executable, "-c", script], stdin=subprocess.PIPE, stdout=subprocess.PIPE, env=env)
+    written = 0
+    index = 0
+    while written < size:
+        chunk = (
+            f"# Function {index}\n@decorator\ndef function_{index % 100}(value):\n"
+            + "    value += 1  # padding to get realistic line lengths\n" * 200
+            + "    return value\n\n\n"
+        ).encode()
+        proc.stdin.write(chunk)
+        written += len(chunk)
+        index += 1
+    proc.stdin.close()
+    # ru_maxrss is in KiB, the RSS after the imports depends on the environment
+    start_rss, max_rss = (int(value) * 1024 for value in proc.stdout.read().split())
+    assert proc.wait() == 0
+    # Reading all lines at once needs more than the input size
+    assert max_rss - start_rss < 16 * 2**20
+    assert (tmp_path / "function_99.py").read_text().startswith("# Function")
+
+
+@pytest.mark.parametrize(
+    "snippet",
+    [
+        pytest.param(("", "# banner comment\n", "def function():\n    pass\n"), id="comment"),
+        pytest.param(("", "@decorator\n", "def function():\n    pass\n"), id="decorator"),
+        pytest.param(("def function():\n    pass\n", "\n", "    pass\n"), id="blank"),
+    ],
+)
+def test_code_split_linear_time(tmp_path, snippet):
+    """Test that the runtime grows linear with the length of comment, decorator and blank line runs
+
+    The input size is increased in steps of 10x, the runtime may grow by 10x plus some
+    tolerance for timer noise. Quadratic growth would show up as 100x.
+
+    Parameters
+    ----------
+    tmp_path : Path
+        Temp path fixture
+    snippet : Tuple[str, str, str]
+        Lines before the repeated run, the repeated line and the lines after the run
+    """
+    head, repeated, tail = snippet
+
+    def best_time(count: int) -> float:
+        lines = [head] + [repeated] * count + [tail]
+        timings = []
+        for _ in range(3):
+            start = time.perf_counter()
+            with DirectorySink(tmp_path) as sink:
+                _split_lines(lines, sink)
+            timings.append(time.perf_counter() - start)
+        return min(timings)
+
+    previous = best_time(2_000)
+    for count in (20_000, 200_000):
+        current = best_time(count)
+        assert current < 10 * 3 * max(previous, 1e-3)
+        previous = current
+
+
+# Modules which are only imported when a feature needs them
+LAZY_MODULES = [
+    "attr",
+    "concurrent.futures",
+    "dataclasses",
+    "hashlib",
+    "importlib.metadata",
+    "json",
+    "socket",
+    "subprocess",
+    "sqlite3",
+    "tarfile",
+    "uuid",
+    "zipfile",
+]
+
+
+def _python(tmp_path, *args):
+    """Run python with the bytecode cached in tmp_path, so the import time isn't spent compiling"""
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path), PYTHONPYCACHEPREFIX=str(tmp_path / "pycache"))
+    env.pop("PYTHONDONTWRITEBYTECODE", None)
+    return subprocess.run([sys.executable, *args], env=env, capture_output=True, text=True, check=True)
+
+
+@pytest.mark.parametrize(
+    "statement",
+    [
+        "import code_split.code_split",
+        "from code_split.code_split import main; main(['-i', {src!r}, '-f', {out!r}])",
+    ],
+    ids=["import", "cli"],
+)
+def test_lazy_imports(tmp_path, statement):
+    """Library import and a plain split don't load the modules of optional features"""
+    src = tmp_path / "test_code.py"
+    src.write_text("".join(code.values()))
+    script = statement.format(src=str(src), out=str(tmp_path / "out")) + "; import sys; print(*sorted(sys.modules))"
+    loaded = set(_python(tmp_path, "-c", script).stdout.split())
+    assert loaded.isdisjoint(LAZY_MODULES)
+
+
+@pytest.mark.parametrize(
+    "name, module",
+    [
+        ("ARCHIVE_FORMATS", "sinks"),
+        ("INDEX_NAME", "index"),
+        ("KINDS", "filters"),
+        ("NDJSON_CONTENT", "sinks"),
+        ("PLAN_FORMATS", "plan"),
+        ("STATS_FORMATS", "stats"),
+        ("STORE_NAME", "store"),
+    ],
+)
+def test_cli_constants(name, module):
+    """The constants of the command line are the same as in the modules which are only imported when needed"""
+    import importlib
+
+    from code_split import code_split
+
+    value = getattr(importlib.import_module(f"code_split.{module}"), name)
+    # The archive formats are the keys of the suffix per format
+    assert getattr(code_split, name) == (tuple(value) if isinstance(value, dict) else value)
+
+
+def test_import_time(tmp_path):
+    """Test the cold start budget of ``import code_split.code_split``, measured by ``python -X importtime``
+
+    The best of 5 runs must stay below the budget in ms, which can be changed with the
+    environment variable ``CODE_SPLIT_IMPORT_BUDGET_MS`` for slow machines.
+
+    Parameters
+    ----------
+    tmp_path : Path
+        Temp path fixture
+    """
+    budget = float(os.environ.get("CODE_SPLIT_IMPORT_BUDGET_MS", "50"))
+    _python(tmp_path, "-c", "import code_split.code_split")
+    timings = []
+    for _ in range(5):
+        report = _python(tmp_path, "-X", "importtime", "-c", "import code_split.code_split").stderr
+        # import time: self [us] | cumulative | imported package
+        (cumulative,) = [
+            int(line.split("|")[1]) for line in report.splitlines() if line.endswith("| code_split.code_split")
+        ]
+        timings.append(cumulative / 1000)
+    assert min(timings) < budget
@@ -0,0 +1,105 @@
+import codecs
+
+import pytest
+
+from code_split.code_split import iter_blocks, main
+from code_split.encoding import coding_line, detect_encoding, with_coding_line
+
+__author__ = "Matthias Homann"
+__copyright__ = "Matthias Homann"
+__license__ = "GPL-3.0-or-later"
+
+LATIN_1 = "# -*- coding: latin-1 -*-\n\n# Größe\ndef größe():\r\n    return 'ß'\n\nclass Ä:\n    x = '\xff'\n"
+LATIN_1 = LATIN_1.encode("latin-1")
+
+
+@pytest.mark.parametrize(
+    "head, expected",
+    [
+        (b"def f():\n    pass\n", ("utf-8", 0)),
+        (codecs.BOM_UTF8 + b"def f():\n", ("utf-8", 3)),
+        (codecs.BOM_UTF8 + b"# coding: utf-8\n", ("utf-8", 3)),
+        (codecs.BOM_UTF8 + b"# -*- coding: utf-8-sig -*-\n", ("utf-8", 3)),
+        (b"# -*- coding: UTF_8_SIG -*-\n", ("utf-8", 0)),
+        (b"# -*- coding: latin-1 -*-\n", ("iso8859-1", 0)),
+        (b"#!/usr/bin/python\n# vim: set fileencoding=cp1252 :\n", ("cp1252", 0)),
+        (b"\n# coding=koi8-r\n", ("koi8-r", 0)),
+        (b"x = 1\n# coding: latin-1\n", ("utf-8", 0)),
+        (b"#\n#\n# coding: latin-1\n", ("utf-8", 0)),
+    ],
+)
+def test_detect_encoding(head, expected):
+    """BOM and coding cookie in the first or second line are detected like by the interpreter"""
+    assert detect_encoding(head) == expected
+
+
+@pytest.mark.parametrize(
+    "head, message",
+    [
+        (b"# coding: no-such-codec\n", "Unknown encoding"),
+        (b"# coding: utf-16\n", "isn't compatible with ASCII"),
+        (codecs.BOM_UTF8 + b"# coding: latin-1\n", "doesn't match the UTF-8 BOM"),
+    ],
+)
+def test_detect_encoding_invalid(head, message):
+    with pytest.raises(ValueError, match=message):
+        detect_encoding(head)
+
+
+def test_iter_blocks_bytes():
+    """Bytes are split without decoding the lines, names and text are decoded with the source encoding"""
+    blocks = list(iter_blocks(LATIN_1))
+    assert [block.name for block in blocks] == ["größe", "Ä"]
+    assert [block._text for block in blocks] == [None, None]
+    assert blocks[0].data == LATIN_1[blocks[0].start_offset : blocks[0].end_offset]
+    assert blocks[0].data.startswith(b"# Gr\xf6\xdfe\ndef gr\xf6\xdfe():\r\n")
+    assert blocks[1].text == "class Ä:\n    x = '\xff'\n"
+    assert blocks[1].encoding == "iso8859-1"
+
+
+def test_iter_blocks_bom():
+    """The BOM isn't part of the first block, offsets count it"""
+    source = codecs.BOM_UTF8 + "def größe():\n    pass\n".encode()
+    (block,) = iter_blocks(source)
+    assert block.name == "größe"
+    assert block.start_offset == 3
+    assert block.data == source[3:]
+    (text_block,) = iter_blocks(source.decode("utf-8"))
+    assert text_block == block
+
+
+@pytest.mark.parametrize("engine", ["stream", "mmap", "parallel"])
+def test_split_bytes_unchanged(tmp_path, engine):
+    """The output files get the bytes of the source, including encoding and line endings, and its coding cookie"""
+    src = tmp_path / "latin.py"
+    src.write_bytes(LATIN_1)
+    assert main(["-i", str(src), "-f", str(tmp_path / "out"), "-e", engine, "--index"]) == 0
+    output = (tmp_path / "out" / "größe.py").read_bytes()
+    assert output == "# -*- coding: iso8859-1 -*-\n# Größe\ndef größe():\r\n    return 'ß'\n".encode("latin-1")
+    output = (tmp_path / "out" / "Ä.py").read_bytes()
+    assert output == "# -*- coding: iso8859-1 -*-\nclass Ä:\n    x = '\xff'\n".encode("latin-1")
+    for path in (tmp_path / "out").glob("*.py"):
+        namespace = {}
+        exec(compile(path.read_bytes(), str(path), "exec"), namespace)
+    assert namespace["Ä"].x == "\xff"
+
+
+@pytest.mark.parametrize("engine", ["stream", "mmap", "parallel"])
+def test_split_coding_line(tmp_path, engine):
+    """Blocks which start with the coding cookie and UTF-8 blocks don't get another one"""
+    src = tmp_path / "latin.py"
+    src.write_bytes(b"#!/usr/bin/python\n# coding: latin-1\ndef f():\n    return '\xe9'\n\n\ndef g():\n    pass\n")
+    assert main(["-i", str(src), "-f", str(tmp_path / "out"), "-e", engine]) == 0
+    assert (tmp_path / "out" / "f.py").read_bytes().startswith(b"#!/usr/bin/python\n# coding: latin-1\ndef f():")
+    assert (tmp_path / "out" / "g.py").read_bytes() == b"# -*- coding: iso8859-1 -*-\ndef g():\n    pass\n"
+    for name in ("f", "g"):
+        compile((tmp_path / "out" / f"{name}.py").read_bytes(), name, "exec")
+    assert with_coding_line(b"def f():\n", "utf-8") == b"def f():\n"
+    assert coding_line(b"# coding: cp1252\n", "cp1252") == b""
+
+
+def test_split_unknown_encoding(tmp_path, caplog):
+    src = tmp_path / "unknown.py"
+    src.write_bytes(b"# coding: no-such-codec\ndef f():\n    pass\n")
+    assert main(["-i", str(src), "-f", str(tmp_path / "out")]) == 1
+    assert "Unknown encoding: no-such-codec" in caplog.text
@@ -0,0 +1,79 @@
+import pytest
+from fixtures.sample_data import code
+
+from code_split.code_split import main, split_blocks
+from code_split.filters import BlockFilter
+from code_split.mmap_engine import scan_spans
+
+__author__ = "Matthias Homann"
+__copyright__ = "Matthias Homann"
+__license__ = "GPL-3.0-or-later"
+
+SOURCE = "".join(code.values())
+
+
+@pytest.mark.parametrize(
+    "options, names",
+    [
+        ({}, ["MyData", "SampleClass", "my_function", "second_function"]),
+        ({"include": ["*_function"]}, ["my_function", "second_function"]),
+        ({"include": ["My*", "second*"]}, ["MyData", "second_function"]),
+        ({"include": ["re:^[A-Z]"], "exclude": ["*Data"]}, ["SampleClass"]),
+        ({"exclude": ["re:function"]}, ["MyData", "SampleClass"]),
+        ({"kinds": ["class"]}, ["MyData", "SampleClass"]),
+        ({"kinds": ["decorated"]}, ["MyData"]),
+        ({"kinds": ["def", "decorated"], "exclude": ["my_*"]}, ["MyData", "second_function"]),
+    ],
+)
+def test_block_filter(options, names):
+    """Both engines only return the selected blocks, unchanged"""
+    select = BlockFilter(**options)
+    blocks = split_blocks(SOURCE, select)
+    assert [block.name for block in blocks] == names
+    assert blocks == [block for block in split_blocks(SOURCE) if block.name in names]
+    spans = list(scan_spans(SOURCE.encode(), select=select))
+    assert [(span.name, span.start_line, span.end_line) for span in spans] == [
+        (block.name, block.start_line, block.end_line) for block in blocks
+    ]
+
+
+def test_block_filter_invalid():
+    """Unknown kinds and invalid regular expressions are reported"""
+    with pytest.raises(ValueError, match="Unknown kind"):
+        BlockFilter(kinds=["function"])
+    with pytest.raises(ValueError, match="Invalid regular expression"):
+        BlockFilter(include=["re:("])
+    assert str(BlockFilter()) == ""
+    assert str(BlockFilter(["a*"], kinds=["def", "class"])) == "include=a*;exclude=;kinds=class,def"
+
+
+def test_block_filter_skipped_lines():
+    """Lines of skipped blocks don't reach the output, comments before the next block are kept"""
+    source = "def skip():\n    x = 1\n\n    return x\n# comment\ndef keep():\n    pass\n"
+    (block,) = split_blocks(source, BlockFilter(exclude=["skip"]))
+    assert block.text == "# comment\ndef keep():\n    pass\n"
+    assert block.start_line == 5
+
+
+@pytest.mark.parametrize("engine", ["stream", "mmap", "parallel"])
+def test_filter_cli(tmp_path, engine):
+    """Only the selected blocks are written"""
+    src = tmp_path / "test_code.py"
+    src.write_text(SOURCE)
+    args = ["-i", str(src), "-f", str(tmp_path / "out"), "-e", engine, "--include", "*_function", "--kind", "def"]
+    assert main(args + ["--exclude", "my_*"]) == 0
+    assert sorted(path.name for path in (tmp_path / "out").iterdir()) == ["second_function.py"]
+    assert main(["-i", str(src), "-f", str(tmp_path / "out"), "--include", "re:("]) == 1
+
+
+def test_filter_incremental(tmp_path):
+    """A changed filter splits an unchanged source again, outputs which are no longer selected are removed"""
+    src = tmp_path / "test_code.py"
+    src.write_text(SOURCE)
+    args = ["-i", str(src), "-f", str(tmp_path / "out"), "--incremental"]
+    main(args + ["--kind", "class"])
+    assert sorted(path.name for path in (tmp_path / "out").glob("*.py")) == ["MyData.py", "SampleClass.py"]
+    main(args + ["--kind", "def"])
+    assert sorted(path.name for path in (tmp_path / "out").glob("*.py")) == ["my_function.py", "second_function.py"]
+    main(args)
+    assert len(list((tmp_path / "out").glob("*.py"))) == 4
@@ -0,0 +1,130 @@
+import io
+import os
+import shutil
+import subprocess
+import tarfile
+
+import pytest
+from fixtures.sample_data import code
+
+from code_split import git_source
+from code_split.code_split import main
+from code_split.filters import BlockFilter
+from code_split.git_source import ABBREV, GitObjects, list_commits, split_revisions
+
+__author__ = "Matthias Homann"
+__copyright__ = "Matthias Homann"
+__license__ = "GPL-3.0-or-later"
+
+pytestmark = pytest.mark.skipif(shutil.which("git") is None, reason="git isn't installed")
+
+SOURCE = "".join(code.values())
+
+
+def _git(repo, *args):
+    env = dict(os.environ, GIT_AUTHOR_NAME="test", GIT_AUTHOR_EMAIL="test@example.com")
+    env.update(GIT_COMMITTER_NAME="test", GIT_COMMITTER_EMAIL="test@example.com")
+    return subprocess.run(["git", "-C", str(repo), *args], env=env, check=True, capture_output=True, text=True).stdout
+
+
+@pytest.fixture
+def repo(tmp_path):
+    """Repository with three commits, the sources are changed in the second and third commit"""
+    path = tmp_path / "repo"
+    path.mkdir()
+    _git(path, "init", "-q")
+    (path / "pkg").mkdir()
+    (path / "pkg" / "module.py").write_text(SOURCE)
+    (path / "README.md").write_text("def not_python():\n    pass\n")
+    _git(path, "add", ".")
+    _git(path, "commit", "-q", "-m", "first")
+    (path / "top.py").write_text("def top():\n    return 1\n")
+    _git(path, "add", ".")
+    _git(path, "commit", "-q", "-m", "second")
+    (path / "top.py").write_text("def top():\n    return 2\n")
+    _git(path, "commit", "-q", "-am", "third")
+    # The working tree isn't used
+    (path / "top.py").write_text("def top():\n    return 3\n")
+    return path
+
+
+def _commits(repo):
+    return _git(repo, "rev-list", "--reverse", "HEAD").split()
+
+
+def test_git_objects(repo):
+    """Commits, trees and blobs are read from one process"""
+    with GitObjects(str(repo)) as objects:
+        commit, tree = objects.commit("HEAD")
+        assert commit == _commits(repo)[-1]
+        assert [path for path, _ in objects.iter_files(tree)] == ["pkg/module.py", "top.py"]
+        assert [path for path, _ in objects.iter_files(tree, ["pkg/"])] == ["pkg/module.py"]
+        assert [path for path, _ in objects.iter_files(tree, pattern="*.md")] == ["README.md"]
+        (_, blob), _ = objects.iter_files(tree)
+        assert objects.read(blob) == (blob, "blob", SOURCE.encode())
+        with pytest.raises(KeyError):
+            objects.read("no-such-revision")
+        assert list_commits(str(repo), ["HEAD~2..HEAD", "HEAD"], objects) == _commits(repo)[1:]
+        with pytest.raises(ValueError, match="Unknown revision"):
+            list_commits(str(repo), ["no-such-branch"], objects)
+
+
+def test_split_revisions(repo, tmp_path):
+    """Each commit is split into its own folder, the working tree isn't used"""
+    first, second, third = (commit[:ABBREV] for commit in _commits(repo))
+    report = split_revisions(str(repo), ["HEAD~2", "HEAD~2..HEAD"], str(tmp_path / "out"))
+    assert list(report.values()) == [None] * 5
+    out = tmp_path / "out"
+    assert sorted(path.name for path in out.iterdir()) == sorted([first, second, third])
+    assert (out / first / "pkg" / "module" / "MyData.py").read_text() == code["MyData"]
+    assert not (out / first / "top").exists()
+    assert (out / second / "top" / "top.py").read_text() == "def top():\n    return 1\n"
+    assert (out / third / "top" / "top.py").read_text() == "def top():\n    return 2\n"
+    assert not (out / first / "README").exists()
+
+
+def test_split_revisions_unchanged(repo, tmp_path, monkeypatch):
+    """Files of unchanged sources are hard linked from the earlier commit, or copied without hard links"""
+    first, second, third = (commit[:ABBREV] for commit in _commits(repo))
+    split_revisions(str(repo), ["HEAD~2..HEAD"], str(tmp_path / "out"))
+    linked = [tmp_path / "out" / commit / "pkg" / "module" / "MyData.py" for commit in (second, third)]
+    assert os.path.samefile(*linked)
+
+    def no_link(*args):
+        raise OSError("Operation not permitted")
+
+    monkeypatch.setattr(os, "link", no_link)
+    split_revisions(str(repo), ["HEAD~2..HEAD"], str(tmp_path / "copy"))
+    copied = [tmp_path / "copy" / commit / "pkg" / "module" / "MyData.py" for commit in (second, third)]
+    assert not os.path.samefile(*copied)
+    assert copied[1].read_text() == code["MyData"]
+    assert not list((tmp_path / "copy").rglob("*.tmp"))
+
+
+def test_split_revisions_archive_cache(repo, tmp_path, monkeypatch):
+    """The archive is the same if the split files of the blobs don't fit into the cache"""
+    members = []
+    for cache_bytes in (git_source.CACHE_BYTES, 0):
+        monkeypatch.setattr(git_source, "CACHE_BYTES", cache_bytes)
+        split_revisions(str(repo), ["HEAD~2..HEAD"], archive=str(tmp_path / "out.tar"))
+        with tarfile.open(tmp_path / "out.tar") as tar:
+            members.append([(member.name, tar.extractfile(member).read()) for member in tar])
+    assert members[0] == members[1]
+    assert len(members[0]) == 10
+
+
+def test_split_revisions_archive(repo, tmp_path):
+    """Filters and paths apply, the files are written into an archive"""
+    archive = tmp_path / "out.tar"
+    split_revisions(str(repo), ["HEAD"], archive=str(archive), paths=["pkg"], select=BlockFilter(kinds=["class"]))
+    head = _commits(repo)[-1][:ABBREV]
+    with tarfile.open(archive) as tar:
+        assert sorted(tar.getnames()) == [f"{head}/pkg/module/MyData.py", f"{head}/pkg/module/SampleClass.py"]
+
+
+def test_git_cli(repo, tmp_path, capsysbinary):
+    head = _commits(repo)[-1][:ABBREV]
+    assert main(["git", "-C", str(repo), "HEAD", "-a", "-", "--include", "top"]) == 0
+    with tarfile.open(fileobj=io.BytesIO(capsysbinary.readouterr().out)) as tar:
+        assert tar.getnames() == [f"{head}/top/top.py"]
+    assert main(["git", "-C", str(repo), "no-such-branch", "-f", str(tmp_path / "out")]) == 1
@@ -0,0 +1,141 @@
+import json
+import multiprocessing
+import os
+import time
+
+import pytest
+from fixtures.sample_data import code
+
+from code_split.code_split import iter_blocks, main, split_code
+from code_split.index import INDEX_NAME, Symbol, SymbolIndex
+
+__author__ = "Matthias Homann"
+__copyright__ = "Matthias Homann"
+__license__ = "GPL-3.0-or-later"
+
+SOURCE = "".join(code.values())
+
+
+def read_index(path):
+    with SymbolIndex(path, readonly=True) as index:
+        return index.query("*")
+
+
+@pytest.mark.parametrize("engine", ["stream", "mmap"])
+def test_index(tmp_path, engine):
+    """The index holds span, kind, decorators and hash of each block, the same with both engines"""
+    src = tmp_path / "test_code.py"
+    src.write_text(SOURCE)
+    split_code(str(src), str(tmp_path / "out"), engine=engine, index="")
+    symbols = read_index(tmp_path / "out" / INDEX_NAME)
+    assert [symbol.name for symbol in symbols] == ["MyData", "SampleClass", "my_function", "second_function"]
+    my_data = symbols[0]
+    assert my_data.kind == "class"
+    assert my_data.source == str(src)
+    assert my_data.output == str(tmp_path / "out" / "MyData.py")
+    assert my_data.decorators == ("@dataclass",)
+    assert (my_data.start_line, my_data.end_line) == (8, 17)
+    assert SOURCE.encode()[my_data.start_offset : my_data.end_offset].decode() == code["MyData"].rstrip("\n") + "\n"
+    assert my_data.sha256 == Symbol.from_block(next(iter_blocks(SOURCE))).sha256
+
+
+def test_index_update(tmp_path):
+    """Split again replaces the symbols of the source, symbols of other sources are kept"""
+    first, second = tmp_path / "first.py", tmp_path / "second.py"
+    first.write_text("def old():\n    pass\n")
+    second.write_text("class Other:\n    pass\n")
+    index = str(tmp_path / "symbols.db")
+    split_code(str(first), str(tmp_path / "out"), index=index)
+    split_code(str(second), str(tmp_path / "out"), index=index)
+    first.write_text("async def new():\n    pass\n")
+    split_code(str(first), str(tmp_path / "out"), index=index)
+    assert [(symbol.name, symbol.kind) for symbol in read_index(tmp_path / "symbols.db")] == [
+        ("Other", "class"),
+        ("new", "async def"),
+    ]
+
+
+def test_index_incremental(tmp_path):
+    """Unchanged sources are only skipped if they are already part of the index"""
+    src = tmp_path / "test_code.py"
+    src.write_text(SOURCE)
+    main(["-i", str(src), "-f", str(tmp_path / "out"), "--incremental"])
+    main(["-i", str(src), "-f", str(tmp_path / "out"), "--incremental", "--index"])
+    assert len(read_index(tmp_path / "out" / INDEX_NAME)) == 4
+
+
+def test_index_batch(tmp_path):
+    """The batch mode writes a single index in the output folder"""
+    for rel in ("mod_a.py", "pkg/mod_b.py"):
+        (tmp_path / "src" / rel).parent.mkdir(parents=True, exist_ok=True)
+        (tmp_path / "src" / rel).write_text(SOURCE)
+    assert main(["-i", str(tmp_path / "src"), "-f", str(tmp_path / "out"), "-j", "2", "--index"]) == 0
+    symbols = read_index(tmp_path / "out" / INDEX_NAME)
+    assert len(symbols) == 8
+    assert {symbol.output for symbol in symbols if symbol.name == "MyData"} == {
+        str(tmp_path / "out" / "mod_a" / "MyData.py"),
+        str(tmp_path / "out" / "pkg" / "mod_b" / "MyData.py"),
+    }
+
+
+def _replace_symbols(path, number, barrier):
+    barrier.wait()
+    symbol = Symbol(f"function_{number}", "def", "", f"function_{number}.py", 1, 2, 0, 10, (), "0" * 64)
+    with SymbolIndex(path) as index:
+        index.replace(f"/src/module_{number}.py", path.parent, [symbol])
+
+
+def test_index_concurrent_create(tmp_path):
+    """Processes opening a new index at the same time keep the symbols of each other"""
+    for run in range(5):
+        path = tmp_path / f"run_{run}" / INDEX_NAME
+        path.parent.mkdir()
+        barrier = multiprocessing.Barrier(6)
+        processes = [multiprocessing.Process(target=_replace_symbols, args=(path, i, barrier)) for i in range(6)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+        assert [process.exitcode for process in processes] == [0] * 6
+        assert sorted(symbol.name for symbol in read_index(path)) == [f"function_{i}" for i in range(6)]
+
+
+def test_query(tmp_path, capsys):
+    """The query command prints the matching symbols, filtered by kind and source"""
+    src = tmp_path / "test_code.py"
+    src.write_text(SOURCE)
+    main(["-i", str(src), "-f", str(tmp_path / "out"), "--index"])
+    capsys.readouterr()
+    assert main(["query", "-f", str(tmp_path / "out"), "*_function", "-k", "def"]) == 0
+    lines = capsys.readouterr().out.splitlines()
+    assert lines == [
+        f"my_function\tdef\t{src}:42-45\t{tmp_path / 'out' / 'my_function.py'}",
+        f"second_function\tdef\t{src}:48-62\t{tmp_path / 'out' / 'second_function.py'}",
+    ]
+    assert main(["query", "-f", str(tmp_path / "out"), "MyData", "--json"]) == 0
+    (symbol,) = json.loads(capsys.readouterr().out)
+    assert symbol["decorators"] == ["@dataclass"]
+    assert main(["query", "-f", str(tmp_path / "out"), "MyData", "-s", "*/other.py"]) == 1
+    assert main(["query", "-f", str(tmp_path / "missing"), "MyData"]) == 1
+
+
+def test_query_speed(tmp_path):
+    """Lookups in an index of thousands of sources take milliseconds
+
+    The budget in ms can be changed with the environment variable ``CODE_SPLIT_QUERY_BUDGET_MS``
+    for slow machines.
+    """
+    budget = float(os.environ.get("CODE_SPLIT_QUERY_BUDGET_MS", "250"))
+    symbol = Symbol("name", "def", "", "name.py", 1, 2, 0, 10, (), "0" * 64)
+    with SymbolIndex(tmp_path / INDEX_NAME) as index:
+        for number in range(5000):
+            index.replace(
+                f"/src/module_{number}.py",
+                tmp_path,
+                [symbol._replace(name=f"function_{number}_{i}", output=f"function_{number}_{i}.py") for i in range(5)],
+            )
+    with SymbolIndex(tmp_path / INDEX_NAME, readonly=True) as index:
+        start = time.perf_counter()
+        (found,) = index.query("function_4321_3")
+        assert (time.perf_counter() - start) * 1000 < budget
+    assert found.source == "/src/module_4321.py"
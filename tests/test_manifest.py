@@ -0,0 +1,105 @@
+import hashlib
+import json
+import os
+
+from fixtures.sample_data import code
+
+from code_split.code_split import main
+from code_split.manifest import MANIFEST_NAME, Manifest, file_digest
+
+__author__ = "Matthias Homann"
+__copyright__ = "Matthias Homann"
+__license__ = "GPL-3.0-or-later"
+
+OLD = 1_000_000_000
+
+
+def split(src, out):
+    """Split incremental and return the mtime per output file"""
+    main(["-i", str(src), "-f", str(out), "--incremental"])
+    return {path.name: path.stat().st_mtime_ns for path in out.iterdir()}
+
+
+def age_outputs(out):
+    """Set the mtime of the output files to a fixed old value"""
+    for path in out.iterdir():
+        os.utime(path, ns=(OLD, OLD))
+
+
+def test_incremental_manifest(tmp_path):
+    """The manifest holds the stat and hash of the source and the hash per block"""
+    src = tmp_path / "test_code.py"
+    src.write_text("".join(code.values()))
+    out = tmp_path / "out"
+    split(src, out)
+    data = json.loads((out / MANIFEST_NAME).read_text())
+    entry = data["sources"][str(src)]
+    assert entry["size"] == src.stat().st_size
+    assert entry["mtime_ns"] == src.stat().st_mtime_ns
+    assert entry["sha256"] == file_digest(src)
+    assert entry["blocks"] == {
+        f"{name}.py": hashlib.sha256(value.encode()).hexdigest()
+        for name, value in code.items()
+        if not name.startswith("skip")
+    }
+
+
+def test_incremental_unchanged_source(tmp_path):
+    """Unchanged sources are skipped, also if only the mtime changed"""
+    src = tmp_path / "test_code.py"
+    src.write_text("".join(code.values()))
+    out = tmp_path / "out"
+    split(src, out)
+    age_outputs(out)
+    assert set(split(src, out).values()) == {OLD}
+    os.utime(src, ns=(OLD, OLD))
+    assert set(split(src, out).values()) - {OLD} == {os.stat(out / MANIFEST_NAME).st_mtime_ns}
+    assert Manifest(out).sources[str(src)]["mtime_ns"] == OLD
+
+
+def test_incremental_changed_source(tmp_path):
+    """Only changed blocks are written, blocks removed from the source are deleted"""
+    src = tmp_path / "test_code.py"
+    src.write_text("".join(code.values()))
+    out = tmp_path / "out"
+    split(src, out)
+    age_outputs(out)
+    changed = dict(code)
+    changed["my_function"] = changed["my_function"].replace("# Sample comment", "# Changed comment")
+    del changed["second_function"]
+    src.write_text("".join(changed.values()))
+    mtimes = split(src, out)
+    assert "second_function.py" not in mtimes
+    assert mtimes["MyData.py"] == mtimes["SampleClass.py"] == OLD
+    assert mtimes["my_function.py"] != OLD
+    assert (out / "my_function.py").read_text() == changed["my_function"]
+
+
+def test_incremental_modified_output(tmp_path):
+    """Output files which were modified are restored, identical files without manifest aren't written"""
+    src = tmp_path / "test_code.py"
+    src.write_text("".join(code.values()))
+    out = tmp_path / "out"
+    main(["-i", str(src), "-f", str(out)])
+    age_outputs(out)
+    (out / "MyData.py").write_text("modified")
+    os.utime(out / "MyData.py", ns=(OLD, OLD))
+    mtimes = split(src, out)
+    assert mtimes["MyData.py"] != OLD
+    assert (out / "MyData.py").read_text() == code["MyData"]
+    assert mtimes["SampleClass.py"] == OLD
+
+
+def test_manifest_open(tmp_path):
+    """The manifest of a folder is kept in memory and only read again if another process changed it"""
+    src = tmp_path / "test_code.py"
+    src.write_text("".join(code.values()))
+    out = tmp_path / "out"
+    main(["-i", str(src), "-f", str(out), "--incremental"])
+    manifest = Manifest.open(out)
+    assert Manifest.open(out) is manifest
+    assert manifest.is_unchanged(src)
+    other = Manifest(out)
+    other.sources.clear()
+    other.save()
+    assert not manifest.is_unchanged(src)
@@ -0,0 +1,70 @@
+import pytest
+from fixtures.sample_data import code
+
+from code_split.code_split import main, split_blocks
+from code_split.mmap_engine import Span, scan_spans
+
+__author__ = "Matthias Homann"
+__copyright__ = "Matthias Homann"
+__license__ = "GPL-3.0-or-later"
+
+SOURCES = {
+    "sample": "".join(code.values()),
+    "prefix": "# comment\nx = 1\n@decorator\n\n# second comment\ndef function():\n    pass\n",
+    "reordered": "@decorator\n# comment\nclass Data:\n    pass\n@decorator\ndef f():\n    pass",
+    "non_ascii": "# Größe\ndef größe():\n    return 'ß'\n\n\n\n# Kommentar\n\nclass Ä:\n  x = 1\n",
+}
+
+
+@pytest.mark.parametrize("name", SOURCES)
+def test_scan_spans(name):
+    """The spans give the same text as the stream engine"""
+    data = SOURCES[name].encode()
+    spans = list(scan_spans(data))
+    blocks = split_blocks(SOURCES[name])
+    assert [(span.name, span.kind, span.start_line, span.end_line) for span in spans] == [
+        (block.name, block.kind, block.start_line, block.end_line) for block in blocks
+    ]
+    assert [b"".join(data[s:e] for s, e in span.ranges()).decode() for span in spans] == [
+        block.text for block in blocks
+    ]
+
+
+def test_scan_spans_prefix():
+    """Leading comments and decorators which aren't directly in front of the block are kept as prefix"""
+    data = SOURCES["prefix"].encode()
+    (span,) = scan_spans(data)
+    comment = data.index(b"# second")
+    header = data.index(b"def")
+    assert span == Span("function", header, len(data), ((comment, header), (16, 27)), "def", 3, 7, 1, 1)
+
+
+@pytest.mark.parametrize("name", SOURCES)
+def test_mmap_engine_identical(tmp_path, name):
+    """The mmap engine writes byte identical files as the stream engine"""
+    src = tmp_path / "test_code.py"
+    src.write_bytes(SOURCES[name].encode())
+    main(["-i", str(src), "-f", str(tmp_path / "stream")])
+    main(["-i", str(src), "-f", str(tmp_path / "mmap"), "--engine", "mmap"])
+    stream = {path.name: path.read_bytes() for path in (tmp_path / "stream").iterdir()}
+    mmap = {path.name: path.read_bytes() for path in (tmp_path / "mmap").iterdir()}
+    assert stream
+    assert stream == mmap
+
+
+def test_mmap_engine_incremental(tmp_path):
+    """Incremental mode gives the same manifest with both engines"""
+    src = tmp_path / "test_code.py"
+    src.write_text(SOURCES["sample"])
+    main(["-i", str(src), "-f", str(tmp_path / "stream"), "--incremental"])
+    main(["-i", str(src), "-f", str(tmp_path / "mmap"), "--incremental", "--engine", "mmap"])
+    manifests = [(tmp_path / engine / ".code_split.json").read_text() for engine in ("stream", "mmap")]
+    assert manifests[0] == manifests[1]
+
+
+def test_mmap_engine_empty(tmp_path):
+    """Empty files can't be mapped, but must not fail"""
+    src = tmp_path / "empty.py"
+    src.write_text("")
+    main(["-i", str(src), "-f", str(tmp_path / "out"), "--engine", "mmap"])
+    assert list((tmp_path / "out").iterdir()) == []
@@ -0,0 +1,69 @@
+import pytest
+
+from code_split.code_split import main, split_code
+from code_split.index import INDEX_NAME, SymbolIndex
+from code_split.mmap_engine import scan_spans
+from code_split.parallel import find_cuts, next_cut
+
+__author__ = "Matthias Homann"
+__copyright__ = "Matthias Homann"
+__license__ = "GPL-3.0-or-later"
+
+# Each part ends with a case where a naive cut would change the attached comments or decorators
+PARTS = [
+    "def function_{n}():\n    return {n}\n\n",
+    "# leading comment {n}\ndef commented_{n}():\n    pass\n\n\n",
+    "@decorator\n\ndef decorated_{n}():\n    pass\n\n",
+    "@decorator\nx = {n}\n\nclass Late_{n}:\n    x = 1\n\n    def method(self):\n        pass\n\n",
+    "# comment\n\n# attached comment\n@first\n# between\n@second\nasync def stacked_{n}():\n    pass\n",
+    "value = {n}\n\nclass Duplicate:\n    n = {n}\n\n",
+    "def crlf_{n}():\r\n    pass\r\n\r\n",
+]
+SOURCE = "".join(part.format(n=n) for n in range(40) for part in PARTS)
+
+
+def read_folder(folder):
+    return {path.name: path.read_bytes() for path in folder.iterdir() if not path.name.startswith(".")}
+
+
+def test_next_cut():
+    """Only headers after a blank line without pending decorators are safe cuts"""
+    data = b"def a():\n    pass\n@decorator\n\ndef b():\n    pass\n# comment\n\ndef c():\n    pass\n"
+    assert next_cut(data, 0) == data.index(b"def c")
+    assert next_cut(data, data.index(b"def b")) == data.index(b"def c")
+    assert next_cut(b"def a():\n    pass\ndef b():\n    pass\n", 0) is None
+
+
+@pytest.mark.parametrize("chunks", [2, 5, 50])
+def test_find_cuts(chunks):
+    """The spans of the chunks are the spans of the whole source"""
+    data = SOURCE.encode()
+    cuts = find_cuts(data, chunks, min_chunk=100)
+    assert cuts[0] == 0 and cuts[-1] == len(data)
+    assert 1 < len(cuts) - 1 <= chunks
+    spans = [span[:4] for start, end in zip(cuts, cuts[1:]) for span in scan_spans(data, start, end)]
+    assert spans == [span[:4] for span in scan_spans(data)]
+
+
+def test_find_cuts_small():
+    """Sources smaller than two chunks aren't cut"""
+    assert find_cuts(SOURCE.encode(), 8) == [0, len(SOURCE.encode())]
+
+
+@pytest.mark.parametrize("incremental", [False, True])
+def test_parallel_identical(tmp_path, monkeypatch, incremental):
+    """The parallel engine writes the same files and index as the serial split, including line endings"""
+    monkeypatch.setattr("code_split.parallel.MIN_CHUNK", 500)
+    src = tmp_path / "huge.py"
+    src.write_bytes(SOURCE.encode())
+    split_code(str(src), str(tmp_path / "serial"), engine="mmap", index="")
+    for _ in range(2 if incremental else 1):
+        args = ["-i", str(src), "-f", str(tmp_path / "parallel"), "-e", "parallel", "-j", "3", "--index"]
+        assert main(args + ["--incremental"] if incremental else args) == 0
+    assert read_folder(tmp_path / "parallel") == read_folder(tmp_path / "serial")
+    indexes = []
+    for folder in ("serial", "parallel"):
+        with SymbolIndex(tmp_path / folder / INDEX_NAME, readonly=True) as index:
+            indexes.append([symbol[:2] + symbol[4:] for symbol in index.query("*")])
+    assert indexes[0] == indexes[1]
+    assert len(indexes[0]) == len(PARTS) * 40
@@ -0,0 +1,92 @@
+import json
+from pathlib import Path
+
+from fixtures.sample_data import code
+
+from code_split.code_split import main
+from code_split.plan import plan_split
+
+__author__ = "Matthias Homann"
+__copyright__ = "Matthias Homann"
+__license__ = "GPL-3.0-or-later"
+
+SOURCE = "".join(code.values())
+EXPECTED = [name for name in code if not name.startswith("skip")]
+
+
+def test_plan_split(tmp_path):
+    """The plan has the sizes of the split, existing files and collisions, nothing is written"""
+    src = tmp_path / "test_code.py"
+    src.write_text(SOURCE + "\n\ndef my_function():\n    pass\n")
+    out = tmp_path / "out"
+    out.mkdir()
+    (out / "MyData.py").write_text("old")
+    plan = plan_split([str(src)], str(out))
+    assert [entry.name for entry in plan] == EXPECTED + ["my_function"]
+    assert [entry.size for entry in plan[:-1]] == [len(code[name].encode()) for name in EXPECTED]
+    assert [entry.exists for entry in plan] == [True, False, False, False, False]
+    assert [entry.collision for entry in plan] == [False, False, True, False, True]
+    assert plan[0].target == str(out / "MyData.py")
+    assert (plan[0].source, plan[0].start_line) == (str(src), 8)
+    assert sorted(path.name for path in out.iterdir()) == ["MyData.py"]
+
+
+def test_plan_batch(tmp_path):
+    """The batch mode mirrors the source layout, broken sources are skipped"""
+    for rel in ("mod_a.py", "pkg/mod_b.py"):
+        (tmp_path / "src" / rel).parent.mkdir(parents=True, exist_ok=True)
+        (tmp_path / "src" / rel).write_text(SOURCE)
+    (tmp_path / "src" / "broken.py").write_bytes(b"# coding: no-such-codec\ndef broken():\n    pass\n")
+    report = {}
+    plan = plan_split([str(tmp_path / "src")], str(tmp_path / "out"), report=report)
+    assert [entry.target for entry in plan] == [
+        str(tmp_path / "out" / folder / f"{name}.py") for folder in ("mod_a", "pkg/mod_b") for name in EXPECTED
+    ]
+    assert not (tmp_path / "out").exists()
+    assert report[str(tmp_path / "src" / "broken.py")].startswith("ValueError: Unknown encoding")
+    assert [error for error in report.values() if error] == [report[str(tmp_path / "src" / "broken.py")]]
+
+
+def test_plan_batch_cli(tmp_path, capsys, caplog):
+    """Missing or broken sources are logged with their path, the others are planned, the exit status is 1"""
+    src = tmp_path / "test_code.py"
+    src.write_text(SOURCE)
+    missing = tmp_path / "missing.py"
+    assert main(["-i", str(src), str(missing), "-f", str(tmp_path / "out"), "--plan"]) == 1
+    assert capsys.readouterr().out.splitlines()[-1].startswith(f"{len(EXPECTED)} blocks")
+    assert [record.getMessage() for record in caplog.records] == [f"Failed to split {missing}: Can't find input file"]
+    assert main(["-i", str(src), str(src), "-f", str(tmp_path / "out"), "--plan"]) == 0
+
+
+def test_plan_cli(tmp_path, capsys):
+    src = tmp_path / "test_code.py"
+    src.write_text(SOURCE)
+    out = tmp_path / "out"
+    assert main(["-i", str(src), "-f", str(out), "--plan", "--kind", "class"]) == 0
+    lines = capsys.readouterr().out.splitlines()
+    assert lines[0] == f"create\t{len(code['MyData'])}\t{out / 'MyData.py'}\t{src}:8-17"
+    assert lines[-1].startswith("2 blocks, 2 files, 0 overwritten, 0 collisions")
+    main(["-i", str(src), "-f", str(out)])
+    assert main(["-i", str(src), "-f", str(out), "--plan", "json"]) == 0
+    plan = json.loads(capsys.readouterr().out)
+    assert all(entry["exists"] for entry in plan)
+    assert main(["-i", str(tmp_path / "missing.py"), "--plan"]) == 1
+
+
+def test_plan_suffix(tmp_path):
+    """With the suffix policy later blocks of a name get their own target"""
+    src = tmp_path / "twice.py"
+    src.write_text("def f():\n    pass\n\n\ndef f():\n    pass\n\n\ndef f_2():\n    pass\n")
+    plan = plan_split([str(src)], str(tmp_path), collisions="suffix")
+    assert [Path(entry.target).name for entry in plan] == ["f.py", "f_2.py", "f_2_2.py"]
+    assert not any(entry.collision for entry in plan)
+
+
+def test_plan_depth(tmp_path):
+    """With a depth the members are planned in the folder of their class"""
+    src = tmp_path / "test_code.py"
+    src.write_text(SOURCE)
+    plan = plan_split([str(src)], str(tmp_path / "out"), depth=2)
+    targets = [Path(entry.target).relative_to(tmp_path / "out").as_posix() for entry in plan]
+    assert targets[:4] == ["MyData/birthday.py", "MyData.py", "SampleClass/__init__.py", "SampleClass/output.py"]
+    assert plan[1].size == len(code["MyData"].split("\n\n    def")[0]) + 1
@@ -0,0 +1,105 @@
+import threading
+
+import pytest
+from fixtures.sample_data import code
+
+from code_split import client
+from code_split.server import SplitServer
+
+__author__ = "Matthias Homann"
+__copyright__ = "Matthias Homann"
+__license__ = "GPL-3.0-or-later"
+
+SOURCE = "".join(code.values())
+EXPECTED = sorted(f"{name}.py" for name in code if not name.startswith("skip"))
+
+
+@pytest.fixture
+def server(tmp_path):
+    """Split server running in a thread"""
+    with SplitServer(str(tmp_path / "server.sock")) as split_server:
+        thread = threading.Thread(target=split_server.serve_forever)
+        thread.start()
+        yield split_server
+        split_server.shutdown()
+        thread.join()
+
+
+def test_server(tmp_path, server):
+    """Jobs are split by the server, relative paths are relative to the client"""
+    (tmp_path / "test_code.py").write_text(SOURCE)
+    args = ["-i", "test_code.py", "-f", "out", "--incremental"]
+    result = client.request(args, server.path, cwd=str(tmp_path))
+    assert (result["status"], result["messages"]) == (0, [])
+    assert sorted(path.name for path in (tmp_path / "out").glob("*.py")) == EXPECTED
+    assert client.request(args, server.path, cwd=str(tmp_path))["status"] == 0
+    assert server.jobs == 2
+
+
+def test_server_errors(tmp_path, server):
+    """Errors are returned to the client and don't stop the server"""
+    result = client.request(["-i", "missing.py"], server.path, cwd=str(tmp_path))
+    assert result["messages"] == [f"ERROR: Can't find input file {tmp_path / 'missing.py'}"]
+    result = client.request(["-i"], server.path)
+    assert result["status"] == 2
+    assert "expected at least one argument" in result["messages"][-1]
+    assert client.request(["-i", "-"], server.path)["status"] == 1
+    result = client.request(["-i", "missing.py", "--ndjson"], server.path, cwd=str(tmp_path))
+    assert result["status"] == 1
+    assert result["messages"] == ["ERROR: ValueError: stdin and stdout can't be used with the server"]
+    assert client.request(["--version"], server.path)["output"].startswith("code_split ")
+    assert server.jobs == 5
+
+
+def test_server_socket(tmp_path, server):
+    """Only one server can listen on a socket, a stale socket is replaced"""
+    with pytest.raises(FileExistsError):
+        SplitServer(server.path)
+    stale = tmp_path / "stale.sock"
+    SplitServer(str(stale)).socket.close()
+    assert stale.exists()
+    with SplitServer(str(stale)):
+        pass
+    assert not stale.exists()
+
+
+def test_client(tmp_path, server, capsys):
+    """The client prints the messages of the server and splits the code itself without server"""
+    (tmp_path / "test_code.py").write_text(SOURCE)
+    assert client.main(["--socket", server.path, "-i", str(tmp_path / "missing.py")]) == 0
+    assert "Can't find input file" in capsys.readouterr().err
+    missing = str(tmp_path / "missing.sock")
+    assert client.main(["--socket", missing, "-i", str(tmp_path / "test_code.py"), "-f", str(tmp_path / "out")]) == 0
+    assert sorted(path.name for path in (tmp_path / "out").iterdir()) == EXPECTED
+
+
+def test_default_socket(monkeypatch):
+    """The socket path can be set by the environment"""
+    monkeypatch.setenv(client.SOCKET_ENV, "/run/split.sock")
+    assert client.default_socket() == "/run/split.sock"
+    monkeypatch.delenv(client.SOCKET_ENV)
+    monkeypatch.setenv("XDG_RUNTIME_DIR", "/run/user/1000")
+    assert client.default_socket() == "/run/user/1000/code_split.sock"
+
+
+def test_server_plan(tmp_path, server):
+    """The plan is returned to the client, nothing is written"""
+    (tmp_path / "test_code.py").write_text(SOURCE)
+    result = client.request(["-i", "test_code.py", "-f", "out", "--plan"], server.path, cwd=str(tmp_path))
+    assert result["status"] == 0
+    assert f"{tmp_path / 'out' / EXPECTED[0]}" in result["output"]
+    assert not (tmp_path / "out").exists()
+
+
+def test_server_stats(tmp_path, server):
+    """The statistics are returned as messages, profiling is rejected"""
+    (tmp_path / "test_code.py").write_text(SOURCE)
+    args = ["-i", "test_code.py", "-f", "out", "--stats", "prometheus"]
+    result = client.request(args, server.path, cwd=str(tmp_path))
+    assert result["status"] == 0
+    assert any(line.startswith("code_split_blocks_total") for line in result["messages"])
+    for option in (["--profile", "split.prof"], ["--trace-memory"]):
+        result = client.request(["-i", "test_code.py", "-f", "out", *option], server.path, cwd=str(tmp_path))
+        assert result["status"] == 1
+        assert result["messages"] == ["ERROR: ValueError: Jobs sent to the server can't be profiled"]
+    assert not (tmp_path / "split.prof").exists()
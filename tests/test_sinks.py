@@ -0,0 +1,331 @@
+import io
+import json
+import os
+import sys
+import tarfile
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+
+import pytest
+from fixtures.sample_data import code
+
+from code_split.batch import split_tree
+from code_split.code_split import iter_blocks, main, split_code
+from code_split.manifest import MANIFEST_NAME
+from code_split.sinks import (
+    TOC_NAME,
+    ArchiveSink,
+    BundleSink,
+    DirectorySink,
+    NdjsonSink,
+    archive_format,
+    folder_lock,
+)
+
+__author__ = "Matthias Homann"
+__copyright__ = "Matthias Homann"
+__license__ = "GPL-3.0-or-later"
+
+SOURCE = "".join(code.values())
+EXPECTED = {f"{name}.py": value for name, value in code.items() if not name.startswith("skip")}
+
+
+def read_archive(path):
+    """Content per file name of a zip or tar archive"""
+    if zipfile.is_zipfile(path):
+        with zipfile.ZipFile(path) as archive:
+            return {name: archive.read(name).decode() for name in archive.namelist()}
+    with tarfile.open(path) as archive:
+        return {member.name: archive.extractfile(member).read().decode() for member in archive.getmembers()}
+
+
+@pytest.mark.parametrize("name", ["out.zip", "out.tar", "out.tar.gz", "out.tar.bz2", "out.tar.xz"])
+def test_archive(tmp_path, name):
+    """All blocks are written into one archive, no files in the output folder"""
+    src = tmp_path / "test_code.py"
+    src.write_text(SOURCE)
+    os.chdir(tmp_path)
+    main(["-i", str(src), "-a", name])
+    assert read_archive(tmp_path / name) == EXPECTED
+    assert sorted(path.name for path in tmp_path.iterdir()) == sorted([name, "test_code.py"])
+
+
+def test_archive_stdout(tmp_path, monkeypatch):
+    """The archive can be written as tar stream to stdout"""
+    src = tmp_path / "test_code.py"
+    src.write_text(SOURCE)
+    stdout = io.TextIOWrapper(io.BytesIO())
+    monkeypatch.setattr(sys, "stdout", stdout)
+    main(["-i", str(src), "-a", "-", "-v"])
+    (tmp_path / "out.tar").write_bytes(stdout.buffer.getvalue())
+    assert read_archive(tmp_path / "out.tar") == EXPECTED
+
+
+def test_archive_format(tmp_path):
+    """The format can be given explicitly, unknown suffixes are rejected"""
+    assert archive_format("-") == "tar"
+    assert archive_format("out.tgz") == "tgz"
+    with pytest.raises(ValueError):
+        archive_format("out.rar")
+    with ArchiveSink(str(tmp_path / "out.bin"), "zip") as sink:
+        assert sink.write_blocks(iter_blocks(SOURCE), prefix="sample") == len(EXPECTED)
+    assert read_archive(tmp_path / "out.bin") == {f"sample/{name}": value for name, value in EXPECTED.items()}
+
+
+def test_archive_batch(tmp_path):
+    """The batch mode writes all sources into one archive, mirroring the source layout"""
+    for rel in ("mod_a.py", "pkg/mod_b.py"):
+        (tmp_path / "src" / rel).parent.mkdir(parents=True, exist_ok=True)
+        (tmp_path / "src" / rel).write_text(SOURCE)
+    (tmp_path / "src" / "broken.py").write_bytes(b"# -*- coding: no-such-codec -*-\ndef broken():\n    pass\n")
+    report = split_tree([str(tmp_path / "src")], None, workers=2, archive=str(tmp_path / "out.zip"))
+    assert [error is None for error in report.values()] == [False, True, True]
+    with zipfile.ZipFile(tmp_path / "out.zip") as archive:
+        names = archive.namelist()
+    assert names == [f"mod_a/{name}" for name in EXPECTED] + [f"pkg/mod_b/{name}" for name in EXPECTED]
+    assert read_archive(tmp_path / "out.zip")["pkg/mod_b/MyData.py"] == code["MyData"]
+
+
+def _stdout(monkeypatch):
+    stdout = io.TextIOWrapper(io.BytesIO())
+    monkeypatch.setattr(sys, "stdout", stdout)
+    return stdout.buffer
+
+
+def test_ndjson(tmp_path, monkeypatch):
+    """One record per block is streamed to stdout, with the text or the hash which the manifest has"""
+    src = tmp_path / "test_code.py"
+    src.write_text(SOURCE)
+    stdout = _stdout(monkeypatch)
+    assert main(["-i", str(src), "--ndjson", "--kind", "def", "-v"]) == 0
+    records = [json.loads(line) for line in stdout.getvalue().splitlines()]
+    assert [record["name"] for record in records] == ["my_function", "second_function"]
+    assert records[0] == {
+        "source": str(src),
+        "name": "my_function",
+        "kind": "def",
+        "start_line": 42,
+        "end_line": 45,
+        "text": code["my_function"],
+    }
+    assert not (tmp_path / "my_function.py").exists()
+    os.chdir(tmp_path)
+    main(["-i", str(src), "--incremental"])
+    manifest = json.loads((tmp_path / MANIFEST_NAME).read_text())["sources"][str(src)]["blocks"]
+    stdout = _stdout(monkeypatch)
+    main(["-i", str(src), "--ndjson", "hash"])
+    hashes = {record["name"] + ".py": record["sha256"] for record in map(json.loads, stdout.getvalue().splitlines())}
+    assert hashes == manifest
+    assert main(["-i", str(src), "--ndjson", "-a", "out.zip"]) == 1
+
+
+def test_ndjson_batch(tmp_path, monkeypatch):
+    """The records of all sources are streamed in source order"""
+    for rel in ("mod_a.py", "pkg/mod_b.py"):
+        (tmp_path / "src" / rel).parent.mkdir(parents=True, exist_ok=True)
+        (tmp_path / "src" / rel).write_text(SOURCE)
+    stdout = _stdout(monkeypatch)
+    assert main(["-i", str(tmp_path / "src"), "-j", "2", "--ndjson"]) == 0
+    records = [json.loads(line) for line in stdout.getvalue().splitlines()]
+    expected = [(str(tmp_path / "src" / rel), name[:-3]) for rel in ("mod_a.py", "pkg/mod_b.py") for name in EXPECTED]
+    assert [(record["source"], record["name"]) for record in records] == expected
+    assert not (tmp_path / "src" / "mod_a").exists()
+
+
+def test_ndjson_sink():
+    stream = io.BytesIO()
+    with NdjsonSink("hash", stream) as sink:
+        assert sink.write_blocks("-", iter_blocks(SOURCE)) == len(EXPECTED)
+    assert stream.getvalue().count(b"\n") == len(EXPECTED)
+    with pytest.raises(ValueError, match="Unknown record content"):
+        NdjsonSink("json")
+
+
+SMALL = "".join(f"def f{index}():\n    return {index}\n\n\n" for index in range(5))
+LARGE = "class Large:\n" + "".join(f"    x{index} = {index}\n" for index in range(10))
+
+
+@pytest.mark.parametrize("engine", ["stream", "mmap", "parallel"])
+def test_bundle(tmp_path, engine):
+    """Small blocks are bundled up to the budget, large blocks get their own file, the TOC maps all blocks"""
+    src = tmp_path / "small.py"
+    src.write_text(SMALL + LARGE + "\n\ndef last():\n    pass\n")
+    out = tmp_path / "out"
+    assert main(["-i", str(src), "-f", str(out), "-e", engine, "--bundle-bytes", "60", "--index"]) == 0
+    files = sorted(path.name for path in out.iterdir() if not path.name.startswith("."))
+    assert files == ["Large.py", "bundle-f0.py", "bundle-f2.py", "f4.py", "last.py", TOC_NAME]
+    assert (out / "bundle-f0.py").read_text() == "def f0():\n    return 0\n\n\ndef f1():\n    return 1\n"
+    assert (out / "Large.py").read_text() == LARGE
+    toc = json.loads((out / TOC_NAME).read_text())["blocks"]
+    assert [(entry["name"], entry["file"]) for entry in toc] == [
+        ("f0", "bundle-f0.py"),
+        ("f1", "bundle-f0.py"),
+        ("f2", "bundle-f2.py"),
+        ("f3", "bundle-f2.py"),
+        ("f4", "f4.py"),
+        ("Large", "Large.py"),
+        ("last", "last.py"),
+    ]
+    lines = (out / "bundle-f2.py").read_text().splitlines()
+    assert lines[toc[3]["start_line"] - 1 : toc[3]["end_line"]] == ["def f3():", "    return 3"]
+    assert toc[5] == {"name": "Large", "file": "Large.py", "start_line": 1, "end_line": 11}
+    from code_split.index import SymbolIndex
+
+    with SymbolIndex(out / ".code_split.db", readonly=True) as index:
+        assert index.query("f1")[0].output == str(out / "bundle-f0.py")
+
+
+def test_bundle_lines(tmp_path):
+    """The line budget limits bundles as well, the bundles are rewritten in incremental mode if the budget changed"""
+    with BundleSink(tmp_path, max_lines=8) as sink:
+        for block in iter_blocks(SMALL):
+            sink.write(block.file_name, block.data)
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["bundle-f0.py", "bundle-f2.py", "f4.py", TOC_NAME]
+    assert sink.files_written == 4
+    with pytest.raises(ValueError, match="budget"):
+        BundleSink(tmp_path)
+    src = tmp_path / "small.py"
+    src.write_text(SMALL)
+    out = tmp_path / "out"
+    main(["-i", str(src), "-f", str(out), "--incremental", "--bundle-lines", "8"])
+    main(["-i", str(src), "-f", str(out), "--incremental", "--bundle-lines", "20"])
+    assert sorted(path.name for path in out.glob("*.py")) == ["bundle-f0.py"]
+
+
+@pytest.mark.parametrize("fsync", ["none", "file", "run"])
+def test_directory_sink(tmp_path, fsync):
+    """Files are renamed into place, no temporary files are left"""
+    with DirectorySink(tmp_path, fsync) as sink:
+        sink.write("a.py", b"a = 1\n")
+        sink.write("b.py", [b"b = ", memoryview(b"2\n")])
+    assert sorted(os.listdir(tmp_path)) == ["a.py", "b.py"]
+    assert (tmp_path / "b.py").read_bytes() == b"b = 2\n"
+    assert sink.written == {"a.py": "", "b.py": ""}
+    with pytest.raises(ValueError):
+        DirectorySink(tmp_path, "always")
+
+
+def test_directory_sink_failure(tmp_path):
+    """A failed write keeps the previous file and removes the temporary file"""
+    (tmp_path / "a.py").write_text("old\n")
+    with pytest.raises(TypeError):
+        DirectorySink(tmp_path).write("a.py", [b"new\n", "not bytes"])
+    assert os.listdir(tmp_path) == ["a.py"]
+    assert (tmp_path / "a.py").read_text() == "old\n"
+
+
+def test_directory_sink_incremental(tmp_path):
+    """Unchanged files are not written again in incremental mode"""
+    with DirectorySink(tmp_path, hashes={}) as sink:
+        sink.write("a.py", b"a = 1\n")
+    mtime = (tmp_path / "a.py").stat().st_mtime_ns
+    with DirectorySink(tmp_path, hashes=sink.written) as again:
+        again.write("a.py", b"a = 1\n")
+    assert again.written == sink.written
+    assert (tmp_path / "a.py").stat().st_mtime_ns == mtime
+
+
+TWICE = "import sys\n\nif sys.platform == 'win32':\n    pass\n\n\ndef f():\n    return 1\n\n\ndef f():\n    return 2\n"
+
+
+@pytest.mark.parametrize("engine", ["stream", "mmap", "parallel"])
+def test_collisions(tmp_path, engine):
+    """Later blocks of a name get a suffix or are merged, the index points to the written file"""
+    src = tmp_path / "twice.py"
+    src.write_text(TWICE)
+    split_code(str(src), str(tmp_path / "suffix"), engine=engine, index="", collisions="suffix")
+    assert (tmp_path / "suffix" / "f.py").read_text() == "def f():\n    return 1\n"
+    assert (tmp_path / "suffix" / "f_2.py").read_text() == "def f():\n    return 2\n"
+    from code_split.index import SymbolIndex
+
+    with SymbolIndex(tmp_path / "suffix" / ".code_split.db", readonly=True) as index:
+        assert [symbol.output for symbol in index.query("f")] == [
+            str(tmp_path / "suffix" / "f.py"),
+            str(tmp_path / "suffix" / "f_2.py"),
+        ]
+    for _ in range(2):
+        # The merged file isn't merged again with itself in incremental mode
+        split_code(str(src), str(tmp_path / "merge"), True, engine, collisions="merge")
+    merged = "def f():\n    return 1\n\n\ndef f():\n    return 2\n"
+    assert (tmp_path / "merge" / "f.py").read_text() == merged
+    with pytest.raises(ValueError, match="f.py is written by more than one block"):
+        split_code(str(src), str(tmp_path / "error"), engine=engine, collisions="error")
+
+
+@pytest.mark.parametrize("engine", ["stream", "mmap"])
+def test_collisions_merge_incremental(tmp_path, engine):
+    """The merged file is written again in incremental mode if the source changed"""
+    src = tmp_path / "twice.py"
+    src.write_text(TWICE)
+    out = tmp_path / "out"
+    merged = "def f():\n    return 1\n\n\ndef f():\n    return 2\n"
+    for _ in range(2):
+        assert main(["-i", str(src), "-f", str(out), "-e", engine, "--incremental", "--collisions", "merge"]) == 0
+        assert (out / "f.py").read_text() == merged
+        src.write_text(TWICE + "# changed\n")
+
+
+def test_collisions_cli(tmp_path):
+    src = tmp_path / "twice.py"
+    src.write_text(TWICE)
+    assert main(["-i", str(src), "-f", str(tmp_path / "out"), "--collisions", "error"]) == 1
+    assert main(["-i", str(src), "-a", str(tmp_path / "out.zip"), "--collisions", "suffix"]) == 1
+    with pytest.raises(ValueError, match="Unknown collision policy"):
+        DirectorySink(tmp_path, collisions="rename")
+
+
+def test_bundle_collisions(tmp_path):
+    """The table of contents has the file and the lines of each block after the collision policy"""
+    src = tmp_path / "twice.py"
+    src.write_text(TWICE)
+    for collisions in ("suffix", "merge"):
+        out = tmp_path / collisions
+        assert main(["-i", str(src), "-f", str(out), "--bundle-lines", "1", "--collisions", collisions]) == 0
+        toc = json.loads((out / TOC_NAME).read_text())["blocks"]
+        for entry in toc:
+            lines = (out / entry["file"]).read_text().splitlines()
+            assert lines[entry["start_line"] - 1 : entry["end_line"]][0] == "def f():"
+            assert lines[entry["end_line"] - 1].startswith("    return ")
+        assert [entry["file"] for entry in toc] == (["f.py", "f_2.py"] if collisions == "suffix" else ["f.py", "f.py"])
+    assert [(entry["start_line"], entry["end_line"]) for entry in toc] == [(1, 2), (5, 6)]
+    # Bundles with the same first block are merged as well
+    (tmp_path / "bundles").mkdir()
+    with BundleSink(tmp_path / "bundles", max_lines=6, collisions="merge") as sink:
+        for block in iter_blocks("def f():\n    pass\n\n\ndef g():\n    pass\n\n\n" * 2):
+            sink.write(block.file_name, block.data)
+    assert sink.files == {"f.py": "bundle-f.py", "g.py": "bundle-f.py"}
+    toc = json.loads((tmp_path / "bundles" / TOC_NAME).read_text())["blocks"]
+    assert [(entry["name"], entry["start_line"], entry["end_line"]) for entry in toc] == [
+        ("f", 1, 2),
+        ("g", 5, 6),
+        ("f", 9, 10),
+        ("g", 13, 14),
+    ]
+
+
+def _split_incremental(job):
+    src, folder = job
+    split_code(src, folder, True, "stream", None, None, "file")
+
+
+def test_concurrent_runs(tmp_path):
+    """Parallel runs with the same output folder keep the manifest entries of each other"""
+    sources = []
+    for index in range(8):
+        src = tmp_path / f"src_{index}.py"
+        src.write_text(f"def function_{index}():\n    pass\n")
+        sources.append((str(src), str(tmp_path / "out")))
+    with ProcessPoolExecutor(4) as executor:
+        list(executor.map(_split_incremental, sources))
+    manifest = json.loads((tmp_path / "out" / MANIFEST_NAME).read_text())
+    assert sorted(manifest["sources"]) == sorted(src for src, _ in sources)
+    assert not [name for name in os.listdir(tmp_path / "out") if name.endswith(".tmp")]
+    assert len(list((tmp_path / "out").glob("function_*.py"))) == 8
+
+
+def test_folder_lock(tmp_path):
+    """The lock can be taken again after it is released"""
+    with folder_lock(tmp_path):
+        pass
+    with folder_lock(tmp_path):
+        assert (tmp_path / ".code_split.lock").exists()
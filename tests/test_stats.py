@@ -0,0 +1,87 @@
+import json
+import pstats
+
+import pytest
+from fixtures.sample_data import code
+
+from code_split.code_split import main, split_code
+from code_split.stats import RunStats, count_file_lines
+
+__author__ = "Matthias Homann"
+__copyright__ = "Matthias Homann"
+__license__ = "GPL-3.0-or-later"
+
+SOURCE = "".join(code.values())
+BLOCKS = len([name for name in code if not name.startswith("skip_")])
+
+
+@pytest.fixture
+def src(tmp_path):
+    path = tmp_path / "test_code.py"
+    path.write_text(SOURCE)
+    return path
+
+
+@pytest.mark.parametrize("engine", ["stream", "mmap", "parallel"])
+def test_split_stats(tmp_path, src, engine):
+    """All engines report the same counters, unchanged files are counted in incremental mode"""
+    stats = RunStats()
+    split_code(str(src), str(tmp_path / "out"), engine=engine, stats=stats)
+    split_code(str(src), str(tmp_path / "out"), engine=engine, stats=stats)
+    first, second = stats.sources
+    assert (first.source, first.engine) == (str(src), engine)
+    assert first.lines == SOURCE.count("\n")
+    assert first.blocks == BLOCKS
+    assert (first.files_written, first.files_unchanged) == (BLOCKS, 0)
+    assert first.bytes_written == sum(path.stat().st_size for path in (tmp_path / "out").iterdir())
+    assert first.seconds >= first.read_seconds + first.write_seconds
+    assert first.classify_seconds >= 0
+    assert first.write_seconds > 0
+    # The second split overwrites the files, nothing is skipped without manifest
+    assert second.files_written == first.files_written
+    stats = RunStats()
+    split_code(str(src), str(tmp_path / "out"), incremental=True, engine=engine, stats=stats)
+    assert (stats.sources[0].files_written, stats.sources[0].files_unchanged) == (0, BLOCKS)
+    assert stats.totals()["sources"] == 1
+
+
+def test_count_file_lines(tmp_path):
+    path = tmp_path / "lines.py"
+    for content, lines in [(b"", 0), (b"a\n", 1), (b"a\nb", 2), (b"\n\n", 2)]:
+        path.write_bytes(content)
+        assert count_file_lines(path) == lines
+
+
+def test_prometheus_format():
+    stats = RunStats()
+    record = stats.add('dir/"quoted".py', "mmap")
+    record.lines = 12
+    text = stats.to_prometheus()
+    assert "# TYPE code_split_lines_total counter\n" in text
+    assert 'code_split_lines_total{source="dir/\\"quoted\\".py",engine="mmap"} 12\n' in text
+    assert text.count("# HELP ") == 9
+    with pytest.raises(ValueError, match="Unknown statistics format"):
+        stats.write("xml", None)
+
+
+@pytest.mark.parametrize("batch", [False, True])
+def test_stats_cli(tmp_path, src, capsys, batch):
+    """The statistics are written as JSON to stderr or a file, in batch mode the workers' statistics are merged"""
+    inputs = [str(src), str(src.with_name("other.py"))] if batch else [str(src)]
+    src.with_name("other.py").write_text(SOURCE)
+    assert main(["-i", *inputs, "-f", str(tmp_path / "out"), "-j", "2", "--stats", "json"]) == 0
+    report = json.loads(capsys.readouterr().err)
+    assert [record["source"] for record in report["sources"]] == sorted(inputs)
+    assert report["totals"]["blocks"] == BLOCKS * len(inputs)
+    stats_file = tmp_path / "stats.prom"
+    main(["-i", *inputs, "-f", str(tmp_path / "out"), "--stats", "prometheus", "--stats-file", str(stats_file)])
+    assert f'code_split_blocks_total{{source="{src}",engine="stream"}} {BLOCKS}' in stats_file.read_text()
+
+
+def test_profiler_cli(tmp_path, src, capsys):
+    """cProfile statistics are saved, the memory allocations are reported to stderr"""
+    profile = tmp_path / "split.prof"
+    assert main(["-i", str(src), "-f", str(tmp_path / "out"), "--profile", str(profile), "--trace-memory"]) == 0
+    functions = {function for _, _, function in pstats.Stats(str(profile)).stats}
+    assert "split_code" in functions
+    assert "Peak traced memory" in capsys.readouterr().err
@@ -0,0 +1,81 @@
+import hashlib
+import json
+import os
+
+import pytest
+
+from code_split.batch import split_tree
+from code_split.code_split import main, split_code
+from code_split.manifest import MANIFEST_NAME
+from code_split.stats import RunStats
+from code_split.store import STORE_NAME, BlockStore
+
+__author__ = "Matthias Homann"
+__copyright__ = "Matthias Homann"
+__license__ = "GPL-3.0-or-later"
+
+HELPER = "def helper():\n    return 42\n"
+
+
+def _digest(text):
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+@pytest.mark.parametrize("engine", ["stream", "mmap", "parallel"])
+def test_store_split(tmp_path, engine):
+    """The output files are links to the stored blocks, the manifest has their hashes"""
+    src = tmp_path / "module.py"
+    src.write_text(HELPER + "\n\nclass Data:\n    pass\n")
+    out = tmp_path / "out"
+    stats = RunStats()
+    split_code(str(src), str(out), True, engine, store="", stats=stats)
+    stored = BlockStore(out / STORE_NAME).path(_digest(HELPER))
+    assert (out / "helper.py").read_text() == HELPER
+    assert os.path.samefile(out / "helper.py", stored)
+    manifest = json.loads((out / MANIFEST_NAME).read_text())
+    assert manifest["sources"][str(src)]["blocks"]["helper.py"] == _digest(HELPER)
+    assert stats.sources[0].bytes_written == len(HELPER) + len("class Data:\n    pass\n")
+    # Linked files are unchanged, also without manifest
+    split_code(str(src), str(out), engine=engine, store="", stats=stats)
+    assert (stats.sources[1].files_written, stats.sources[1].files_unchanged) == (0, 2)
+
+
+def test_store_batch(tmp_path):
+    """Identical blocks of a tree are stored once in the shared store"""
+    for name in ("a", "b", "c"):
+        (tmp_path / "src").mkdir(exist_ok=True)
+        (tmp_path / "src" / f"{name}.py").write_text(HELPER + f"\n\ndef only_{name}():\n    pass\n")
+    out = tmp_path / "out"
+    report = split_tree([str(tmp_path / "src")], str(out), workers=2, store="")
+    assert list(report.values()) == [None] * 3
+    stored = sorted(path.name for path in (out / STORE_NAME).rglob("*.py"))
+    assert len(stored) == 4
+    assert (out / "a" / "helper.py").stat().st_ino == (out / "c" / "helper.py").stat().st_ino
+    assert (out / "c" / "only_c.py").read_text() == "def only_c():\n    pass\n"
+
+
+def test_store_symlink(tmp_path, monkeypatch):
+    """Without hard links the output files are relative symbolic links"""
+
+    def no_link(*args):
+        raise OSError("Invalid cross-device link")
+
+    monkeypatch.setattr(os, "link", no_link)
+    store = BlockStore(tmp_path / "store")
+    (tmp_path / "out").mkdir()
+    stored = store.add(_digest(HELPER), [HELPER.encode()])
+    assert store.add(_digest(HELPER), [HELPER.encode()]) == stored
+    assert store.blocks_written == 1
+    store.link(stored, tmp_path / "out" / "helper.py")
+    assert os.readlink(tmp_path / "out" / "helper.py") == os.path.join("..", "store", stored.parent.name, stored.name)
+    assert store.is_linked(stored, tmp_path / "out" / "helper.py")
+    assert not store.is_linked(stored, tmp_path / "out" / "missing.py")
+
+
+def test_store_cli(tmp_path):
+    src = tmp_path / "module.py"
+    src.write_text(HELPER)
+    store = tmp_path / "blocks"
+    assert main(["-i", str(src), "-f", str(tmp_path / "out"), "--store", str(store)]) == 0
+    assert os.path.samefile(tmp_path / "out" / "helper.py", BlockStore(store).path(_digest(HELPER)))
+    assert main(["-i", str(src), "--ndjson", "--store"]) == 1
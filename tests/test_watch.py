@@ -0,0 +1,98 @@
+import os
+import threading
+import time
+
+import pytest
+from fixtures.sample_data import code
+
+from code_split.code_split import main
+from code_split.watch import Watcher
+
+__author__ = "Matthias Homann"
+__copyright__ = "Matthias Homann"
+__license__ = "GPL-3.0-or-later"
+
+SOURCE = "".join(code.values())
+OLD = 1_000_000_000
+
+
+def age_outputs(folder):
+    for path in folder.rglob("*.py"):
+        os.utime(path, ns=(OLD, OLD))
+
+
+def wait_for(condition, timeout=10.0):
+    """Wait until the condition is true, the watcher runs in a thread"""
+    end = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < end, "timeout"
+        time.sleep(0.02)
+
+
+def test_watcher_update(tmp_path):
+    """Only sources with a changed content are split, only changed blocks are written"""
+    (tmp_path / "src" / "pkg").mkdir(parents=True)
+    src = tmp_path / "src" / "pkg" / "mod.py"
+    src.write_text(SOURCE)
+    out = tmp_path / "out"
+    watcher = Watcher([str(tmp_path / "src")], str(out), use_inotify=False)
+    assert watcher.update() == [src]
+    assert (out / "pkg" / "mod" / "MyData.py").read_text() == code["MyData"]
+    age_outputs(out)
+    os.utime(src)
+    assert watcher.update({src}) == []
+    src.write_text(SOURCE.replace("# Sample comment", "# Changed comment").replace(code["second_function"], ""))
+    assert watcher.update({src}) == [src]
+    assert (out / "pkg" / "mod" / "MyData.py").stat().st_mtime_ns == OLD
+    assert (out / "pkg" / "mod" / "my_function.py").stat().st_mtime_ns != OLD
+    assert not (out / "pkg" / "mod" / "second_function.py").exists()
+    src.unlink()
+    assert watcher.update({src}) == []
+    assert list((out / "pkg" / "mod").iterdir()) == []
+    assert watcher.splits == 2
+
+
+def test_watcher_output_in_inputs(tmp_path):
+    """The results aren't split again if the output folder is the input folder or part of it"""
+    for root, folder in ((tmp_path / "a", tmp_path / "a"), (tmp_path / "b", tmp_path / "b" / "out")):
+        (root / "pkg").mkdir(parents=True)
+        src = root / "pkg" / "mod.py"
+        src.write_text(SOURCE)
+        watcher = Watcher([str(root)], str(folder), use_inotify=False)
+        assert watcher.update() == [src]
+        assert (folder / "pkg" / "mod" / "MyData.py").is_file()
+        assert list(watcher.scan()) == [src]
+
+
+@pytest.mark.parametrize("use_inotify", [True, False], ids=["inotify", "polling"])
+def test_watch(tmp_path, use_inotify):
+    """Changes of watched files are split after the debounce time, bursts are split once"""
+    (tmp_path / "src").mkdir()
+    src = tmp_path / "src" / "mod.py"
+    src.write_text(SOURCE)
+    try:
+        watcher = Watcher([str(tmp_path / "src")], str(tmp_path / "out"), 0.3, 0.05, use_inotify)
+    except OSError:
+        pytest.skip("inotify isn't available")
+    stop = threading.Event()
+    thread = threading.Thread(target=watcher.run, args=(stop,))
+    thread.start()
+    try:
+        wait_for(lambda: watcher.splits == 1)
+        for number in range(5):
+            src.write_text(SOURCE.replace("# Sample comment", f"# Change {number}"))
+            time.sleep(0.02)
+        wait_for(lambda: "# Change 4" in (tmp_path / "out" / "mod" / "my_function.py").read_text())
+        (tmp_path / "src" / "new").mkdir()
+        (tmp_path / "src" / "new" / "other.py").write_text("def other():\n    pass\n")
+        wait_for(lambda: (tmp_path / "out" / "new" / "other" / "other.py").exists())
+    finally:
+        stop.set()
+        thread.join()
+    assert watcher.splits == 3
+
+
+def test_watch_stdin(caplog):
+    """The watch mode needs input files"""
+    assert main(["-i", "-", "--watch"]) == 1
+    assert "Watch mode needs input files" in caplog.text